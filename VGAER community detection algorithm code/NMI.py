@@ -2,6 +2,7 @@ import math
 import numpy as np
 import pickle as pkl
 import scipy.sparse as sp
+from scipy.special import gammaln
 from sklearn import metrics
 import matplotlib.pyplot as plt
 from collections import Counter
@@ -29,36 +30,11 @@ def load_label(dataset):
 
 
 
-def NMI(A,B):
-    A = np.array(A)
-    B = np.array(B)
-    #样本点数
-    total = len(A)
-    A_ids = set(A)
-    B_ids = set(B)
-    #互信息计算
-    MI = 0
-    eps = 1.4e-45
-    for idA in A_ids:
-        for idB in B_ids:
-            idAOccur = np.where(A==idA)
-            idBOccur = np.where(B==idB)
-            idABOccur = np.intersect1d(idAOccur,idBOccur)
-            px = 1.0*len(idAOccur[0])/total
-            py = 1.0*len(idBOccur[0])/total
-            pxy = 1.0*len(idABOccur)/total
-            MI = MI + pxy*math.log(pxy/(px*py)+eps,2)
-    # 标准化互信息
-    Hx = 0
-    for idA in A_ids:
-        idAOccurCount = 1.0*len(np.where(A==idA)[0])
-        Hx = Hx - (idAOccurCount/total)*math.log(idAOccurCount/total+eps,2)
-    Hy = 0
-    for idB in B_ids:
-        idBOccurCount = 1.0*len(np.where(B==idB)[0])
-        Hy = Hy - (idBOccurCount/total)*math.log(idBOccurCount/total+eps,2)
-    MIhat = 2.0*MI/(Hx+Hy)
-    print(MIhat)
+def NMI(A,B,verbose=False):
+    # 由列联表计算标准化互信息，与原先逐对np.where的实现结果相同；verbose=True时打印结果（交互式训练脚本使用）
+    MIhat = compare_partitions(A, B)['nmi']
+    if verbose:
+        print(MIhat)
 
     # plt.figure(figsize=(8,3), dpi=120)
     #
@@ -73,6 +49,122 @@ def NMI(A,B):
 
     return MIhat
 
+
+def contingency(A, B, sparse=False):
+    """两个划分的列联表，n_ij为同时属于A中第i类和B中第j类的节点数"""
+    a = np.unique(np.asarray(A), return_inverse=True)[1].ravel()
+    b = np.unique(np.asarray(B), return_inverse=True)[1].ravel()
+    ka, kb = a.max() + 1, b.max() + 1
+    if sparse:
+        return sp.coo_matrix((np.ones(len(a), dtype=np.int64), (a, b)), shape=(ka, kb)).tocsr()
+    return np.bincount(a * kb + b, minlength=ka * kb).reshape(ka, kb)
+
+
+def batch_contingency(A, B):
+    """A、B为(P, N)的非负整数标签，一次bincount得到P个列联表 (P, K, K)"""
+    A = np.asarray(A, dtype=np.int64)
+    B = np.asarray(B, dtype=np.int64)
+    P = A.shape[0]
+    K = int(max(A.max(), B.max())) + 1
+    code = (np.arange(P).reshape(-1, 1) * K + A) * K + B
+    return np.bincount(code.ravel(), minlength=P * K * K).reshape(P, K, K)
+
+
+def _entropy(counts, n):
+    p = counts / n.reshape(-1, 1)
+    return -np.sum(np.where(p > 0, p * np.log2(np.where(p > 0, p, 1)), 0), axis=1)
+
+
+def _comb2(x):
+    return x * (x - 1) / 2.
+
+
+def _expected_mutual_info(a, b, n):
+    # 随机置换模型下互信息的期望（Vinh et al. 2010）。
+    # 每个单元(表, i, j)只展开合法的 n_ij ∈ [max(1, a_i+b_j-N), min(a_i, b_j)]，所有单元拼成一维数组向量化计算，
+    # 展开长度不超过 P·Ka·N，log_p只在合法位置上计算，exp不会溢出
+    P = a.shape[0]
+    ai = np.broadcast_to(a.reshape(P, -1, 1), (P, a.shape[1], b.shape[1])).ravel()
+    bj = np.broadcast_to(b.reshape(P, 1, -1), (P, a.shape[1], b.shape[1])).ravel()
+    N = np.broadcast_to(n.reshape(P, 1, 1), (P, a.shape[1], b.shape[1])).ravel()
+    table = np.repeat(np.arange(P), a.shape[1] * b.shape[1])
+    lo = np.maximum(1, ai + bj - N)
+    length = np.maximum(np.minimum(ai, bj) - lo + 1, 0).astype(np.int64)
+    cell = np.repeat(np.arange(len(length)), length)
+    start = np.cumsum(length) - length
+    nij = lo[cell] + (np.arange(cell.size) - start[cell])
+    ai, bj, N, table = ai[cell], bj[cell], N[cell], table[cell]
+    log_p = (gammaln(ai + 1) + gammaln(bj + 1) + gammaln(N - ai + 1) + gammaln(N - bj + 1)
+             - gammaln(N + 1) - gammaln(nij + 1) - gammaln(ai - nij + 1)
+             - gammaln(bj - nij + 1) - gammaln(N - ai - bj + nij + 1))
+    term = nij / N * np.log2(N * nij / (ai * bj)) * np.exp(log_p)
+    return np.bincount(table, term, minlength=P)
+
+
+def _scores(n, a, b, mi, sum_ij):
+    """由总数n、行和a、列和b、互信息mi和 sum C(n_ij, 2) 计算全部指标"""
+    h_a = _entropy(a, n)
+    h_b = _entropy(b, n)
+    h_sum = h_a + h_b
+    nmi = np.where(h_sum > 0, 2.0 * mi / np.where(h_sum > 0, h_sum, 1), 1.0)
+    vi = h_sum - 2.0 * mi
+
+    emi = _expected_mutual_info(a, b, n)
+    denom = 0.5 * h_sum - emi
+    ami = np.where(np.abs(denom) > 1e-12, (mi - emi) / np.where(np.abs(denom) > 1e-12, denom, 1), 1.0)
+
+    sum_a = _comb2(a).sum(axis=1)
+    sum_b = _comb2(b).sum(axis=1)
+    expected = sum_a * sum_b / _comb2(n)
+    max_index = 0.5 * (sum_a + sum_b)
+    ari = np.where(max_index != expected, (sum_ij - expected) / np.where(max_index != expected, max_index - expected, 1), 1.0)
+    return {'nmi': nmi, 'ami': ami, 'ari': ari, 'vi': vi, 'mi': mi}
+
+
+def scores_from_contingency(cont):
+    """
+    由(P, Ka, Kb)个列联表计算NMI、AMI、ARI和信息变差VI（以bit为单位）；
+    cont也可以是一个scipy稀疏列联表（contingency(..., sparse=True)），此时只使用非零单元
+    """
+    if sp.issparse(cont):
+        cont = sp.coo_matrix(cont, dtype=float)
+        a = np.asarray(cont.sum(axis=1), dtype=float).reshape(1, -1)
+        b = np.asarray(cont.sum(axis=0), dtype=float).reshape(1, -1)
+        n = a.sum(axis=1)
+        nz = cont.data > 0
+        data, rows, cols = cont.data[nz], cont.row[nz], cont.col[nz]
+        mi = np.array([np.sum(data / n[0] * np.log2(data * n[0] / (a[0, rows] * b[0, cols])))])
+        return _scores(n, a, b, mi, np.array([_comb2(data).sum()]))
+
+    cont = np.asarray(cont, dtype=float)
+    if cont.ndim == 2:
+        cont = cont[np.newaxis]
+    n = cont.sum(axis=(1, 2))
+    a = cont.sum(axis=2)
+    b = cont.sum(axis=1)
+    outer = a[:, :, np.newaxis] * b[:, np.newaxis, :]
+    ratio = np.where(cont > 0, cont * n.reshape(-1, 1, 1) / np.where(outer > 0, outer, 1), 1)
+    mi = np.sum(cont / n.reshape(-1, 1, 1) * np.log2(ratio), axis=(1, 2))
+    return _scores(n, a, b, mi, _comb2(cont).sum(axis=(1, 2)))
+
+
+def compare_partitions(A, B):
+    """比较两个划分，返回 {'nmi', 'ami', 'ari', 'vi', 'mi'}"""
+    scores = scores_from_contingency(contingency(A, B))
+    return {key: float(value[0]) for key, value in scores.items()}
+
+
+def compare_batch(A, B):
+    """A、B为(P, N)的标签，一次计算P对划分的全部指标，每个指标返回长度为P的数组"""
+    return scores_from_contingency(batch_contingency(A, B))
+
+
+def compare_consecutive(labels):
+    """labels为(T, N)的各时间窗口划分，比较所有相邻窗口 (t-1, t)"""
+    labels = np.asarray(labels)
+    return compare_batch(labels[:-1], labels[1:])
+
+
 def label_change(pred, obje):
     clusters = 7
     sort_pre = Counter(pred).most_common(clusters)
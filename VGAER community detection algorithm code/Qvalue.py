@@ -1,4 +1,5 @@
 import numpy as np
+import scipy.sparse as sp
 
 # def load_csv(path):
 #     data_read = pd.read_csv(path,header=None)
@@ -11,28 +12,67 @@ import numpy as np
 # Member=load_csv('membership.csv')
 
 def Q(array, cluster):
+    # 模块度 Q = tr(C^T B C) / 2m，其中 B = A - kk^T/2m。
+    # 不显式构造N×N的B和CC^T：tr(C^T A C) - ||k^T C||^2 / 2m，array可以是稠密或稀疏矩阵
 
     # 总边数
-    m = sum(sum(array)) / 2
-    k1 = np.sum(array, axis=1)
-    k2 = k1.reshape(k1.shape[0], 1)
-    # 节点度数积
-    k1k2 = k1 * k2
-    # 任意两点连接边数的期望值
-    Eij = k1k2 / (2 * m)
-    # 节点v和w的实际边数与随机网络下边数期望之差
-    B = array - Eij
-    # 获取节点、社区矩阵
-    node_cluster = np.dot(cluster, np.transpose(cluster))
-    results = np.dot(B, node_cluster)
+    m = array.sum() / 2
+    k1 = np.asarray(array.sum(axis=1)).ravel()
+    cluster = np.asarray(cluster, dtype=float)
+    # 社区内部的实际边数
+    internal = np.sum(cluster * np.asarray(array @ cluster))
+    # 随机网络下社区内部边数的期望值
+    expected = np.sum((k1 @ cluster) ** 2) / (2 * m)
     # 求和
-    sum_results = np.trace(results)
+    sum_results = internal - expected
     # 模块度计算
     Q = sum_results / (2 * m)
     print("Q:", Q)
     return Q
 
 
+def edge_list(adj):
+    """邻接矩阵（稠密或稀疏）-> (rows, cols, weights)，对称矩阵中每条边出现两次"""
+    coo = sp.coo_matrix(adj)
+    return coo.row, coo.col, coo.data.astype(float)
+
+
+def _community_sums(labels, rows, cols, weights, degree):
+    # labels为(L, N)，返回每种划分下 社区内部边权之和 与 每个社区度数之和
+    L = labels.shape[0]
+    num_communities = int(labels.max()) + 1
+    internal = (weights * (labels[:, rows] == labels[:, cols])).sum(axis=1)
+    offset = labels + num_communities * np.arange(L).reshape(-1, 1)
+    degree_sums = np.bincount(offset.ravel(), weights=np.tile(degree, L),
+                              minlength=L * num_communities).reshape(L, num_communities)
+    return internal, degree_sums
+
+
+def modularity(adj, labels):
+    """
+    由边列表和节点标签向量计算模块度，复杂度O(E + N)。
+    adj为邻接矩阵（稠密或稀疏）或(rows, cols, weights)边列表；labels为长度N的非负整数标签
+    """
+    return modularity_batch(adj, np.asarray(labels).reshape(1, -1))[0]
+
+
+def modularity_batch(adj, labels):
+    """
+    一次计算多种划分的模块度。
+    adj为单个图时，labels为(L, N)，返回(L,)；
+    adj为多个时间窗口的图组成的列表时，labels为(W, L, N)，返回(W, L)
+    """
+    if isinstance(adj, list):
+        return np.stack([modularity_batch(a, l) for a, l in zip(adj, labels)])
+    rows, cols, weights = adj if isinstance(adj, tuple) else edge_list(adj)
+    labels = np.asarray(labels, dtype=np.int64)
+    n = labels.shape[1]
+    degree = np.bincount(rows, weights=weights, minlength=n)
+    two_m = weights.sum()
+    internal, degree_sums = _community_sums(labels, rows, cols, weights, degree)
+    return internal / two_m - ((degree_sums / two_m) ** 2).sum(axis=1)
+
+
 # if __name__ == '__main__':
 #     # 邻接矩阵，2表示节点2和节点3之间有两条边相连
 #     array = A
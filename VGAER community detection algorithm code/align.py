@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+跨时间窗口（以及k、种子）的社区编号对齐。
+
+重叠矩阵用一次np.bincount构造，匈牙利算法（linear_sum_assignment）在 社区数×社区数 的小矩阵上求最大重叠匹配，
+两个划分的社区数可以不同：没有匹配到的新社区得到新的编号（从已用编号的最大值+1开始），不会并入已有社区。
+标签为负（如-1）的节点表示该窗口中不存在，不参与重叠计数，对齐后保持为-1。
+
+序列对齐的方式：
+    chain      逐个窗口与上一个已对齐的窗口匹配（原match_communities的做法，编号会随链条漂移）
+    memory     与最近memory个已对齐窗口的节点-编号计数匹配：一个社区与编号l的重叠为其节点在近期被标为l的次数之和，
+               单个窗口的噪声不会改变编号
+    reference  所有窗口与同一个参考划分匹配（默认取与其他窗口总重叠最大的medoid窗口），编号全局一致、没有漂移
+
+    aligned = align_sequence(partitions, method='memory', memory=5)     # partitions: (窗口, 节点) 整数数组
+    labels = match_labels(prev, curr)
+"""
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+ALIGN_METHODS = ('none', 'chain', 'memory', 'reference')
+
+
+def overlap(reference, labels, n_ref=None, n_lab=None):
+    """(n_ref, n_lab) 重叠矩阵：reference中社区i与labels中社区j的公共节点数"""
+    reference = np.asarray(reference, dtype=np.int64)
+    labels = np.asarray(labels, dtype=np.int64)
+    valid = (reference >= 0) & (labels >= 0)
+    n_ref = int(reference.max()) + 1 if n_ref is None else n_ref
+    n_lab = int(labels.max()) + 1 if n_lab is None else n_lab
+    counts = np.bincount(reference[valid] * n_lab + labels[valid], minlength=n_ref * n_lab)
+    return counts.reshape(n_ref, n_lab)
+
+
+def overlaps(reference, partitions, n_ref=None, n_lab=None):
+    """一个参考划分与多个划分（如多个种子、多个k）的重叠矩阵，一次bincount得到 (S, n_ref, n_lab)"""
+    reference = np.asarray(reference, dtype=np.int64)
+    partitions = np.atleast_2d(np.asarray(partitions, dtype=np.int64))
+    n_ref = int(reference.max()) + 1 if n_ref is None else n_ref
+    n_lab = int(partitions.max()) + 1 if n_lab is None else n_lab
+    seeds = np.broadcast_to(np.arange(partitions.shape[0])[:, None], partitions.shape)
+    ref = np.broadcast_to(reference, partitions.shape)
+    valid = (ref >= 0) & (partitions >= 0)
+    index = (seeds[valid] * n_ref + ref[valid]) * n_lab + partitions[valid]
+    counts = np.bincount(index, minlength=partitions.shape[0] * n_ref * n_lab)
+    return counts.reshape(partitions.shape[0], n_ref, n_lab)
+
+
+def assignment(score, next_label):
+    """
+    按得分矩阵 (参考编号, 当前社区) 求最大得分匹配，返回 当前社区 -> 编号 的映射数组。
+    当前社区多于参考编号时，未匹配的社区依次得到 next_label, next_label+1, ...
+    """
+    rows, cols = linear_sum_assignment(score, maximize=True)
+    mapping = np.full(score.shape[1], -1, dtype=np.int64)
+    mapping[cols] = rows
+    unmatched = np.flatnonzero(mapping < 0)
+    mapping[unmatched] = next_label + np.arange(len(unmatched))
+    return mapping
+
+
+def relabel(labels, mapping):
+    labels = np.asarray(labels, dtype=np.int64)
+    return np.where(labels >= 0, mapping[np.maximum(labels, 0)], -1)
+
+
+def match_labels(reference, labels):
+    """把labels的社区编号对齐到reference（最大重叠的一一匹配）"""
+    labels = np.asarray(labels, dtype=np.int64)
+    if not (labels >= 0).any():
+        return labels
+    reference = np.asarray(reference, dtype=np.int64)
+    score = overlap(reference, labels, max(int(reference.max()) + 1, 1))
+    return relabel(labels, assignment(score, score.shape[0]))
+
+
+def medoid(partitions):
+    """与其他所有窗口的最大匹配重叠之和最大的窗口编号"""
+    partitions = np.asarray(partitions, dtype=np.int64)
+    n_lab = int(partitions.max()) + 1
+    total = np.zeros(len(partitions))
+    for w, reference in enumerate(partitions):
+        scores = overlaps(reference, partitions, n_lab, n_lab)
+        total[w] = sum(s[linear_sum_assignment(s, maximize=True)].sum() for s in scores)
+    return int(np.argmax(total))
+
+
+def align_sequence(partitions, method='chain', memory=5, reference=None):
+    """
+    对齐一组划分 (窗口, 节点)，返回同形状的对齐后编号。
+    memory: method='memory'时参与计数的最近窗口数；reference: method='reference'时的参考划分
+    （窗口编号或节点标签数组，默认为medoid窗口）
+    """
+    partitions = np.asarray(partitions, dtype=np.int64)
+    if method == 'none' or len(partitions) == 0:
+        return partitions.copy()
+    if method not in ALIGN_METHODS:
+        raise ValueError(f"align method must be one of {ALIGN_METHODS}, got {method!r}")
+
+    aligned = np.empty_like(partitions)
+    if method == 'reference':
+        if reference is None:
+            reference = medoid(partitions)
+        if np.ndim(reference) == 0:
+            reference = partitions[int(reference)]
+        for w, labels in enumerate(partitions):
+            aligned[w] = match_labels(reference, labels)
+        return aligned
+
+    aligned[0] = partitions[0]
+    next_label = int(partitions[0].max()) + 1
+    history = []
+    for w in range(1, len(partitions)):
+        prev, labels = aligned[w - 1], partitions[w]
+        if not (labels >= 0).any():
+            aligned[w] = labels
+            continue
+        if method == 'chain':
+            score = overlap(prev, labels, next_label, int(labels.max()) + 1)
+        else:
+            history.append(prev)
+            if len(history) > memory:
+                history.pop(0)
+            # 节点-编号计数矩阵 (节点, 编号)，只统计最近memory个窗口
+            profile = np.zeros((partitions.shape[1], next_label))
+            for past in history:
+                valid = past >= 0
+                profile[np.flatnonzero(valid), past[valid]] += 1
+            # 当前社区c与编号l的得分 = c中节点近期被标为l的次数之和
+            score_t = np.zeros((int(labels.max()) + 1, next_label))
+            valid = labels >= 0
+            np.add.at(score_t, labels[valid], profile[valid])
+            score = score_t.T
+        mapping = assignment(score, next_label)
+        aligned[w] = relabel(labels, mapping)
+        next_label = max(next_label, int(mapping.max()) + 1)
+    return aligned
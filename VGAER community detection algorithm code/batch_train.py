@@ -0,0 +1,84 @@
+import numpy as np
+import scipy.sparse as sp
+import torch
+import torch.nn.functional as F
+
+from model import BatchedVGAERModel
+from preprocess import block_normalize_adj, normalize_adj, BatchedModularityFeatures, ModularityFeatures
+
+
+def batched_loss_para(A):
+    """对每个窗口分别计算compute_loss_para中的weight_tensor和norm，A为加自环后的(S, N, N)"""
+    n2 = A.shape[1] * A.shape[2]
+    total = A.sum(dim=(1, 2))
+    pos_weight = (n2 - total) / total
+    norm = n2 / ((n2 - total) * 2)
+    weight_tensor = torch.where(A == 1, pos_weight.reshape(-1, 1, 1), torch.ones_like(A))
+    return weight_tensor, norm
+
+
+def batched_loss(vgaer_model, recovered, A_orig_ten, weight_tensor, norm):
+    """
+    每个窗口的损失与单窗口训练完全相同，求和后各窗口的梯度互不影响。
+    A_orig_ten/weight_tensor为 (S, N, N)，或所有模型共用的 (1, N, N)（按模型维扩展为视图，不复制）
+    """
+    logits = torch.sigmoid(recovered.float())  # 应用Sigmoid激活函数
+    bce = F.binary_cross_entropy(logits, A_orig_ten.expand_as(logits), weight=weight_tensor.expand_as(logits),
+                                 reduction='none').mean(dim=(1, 2))
+    mean, log_std = vgaer_model.mean.float(), vgaer_model.log_std.float()
+    kl_divergence = 0.5 / logits.size(1) * (1 + 2 * log_std - mean ** 2 - torch.exp(log_std) ** 2).sum(2).mean(1)
+    return norm * bce - kl_divergence
+
+
+def fit(vgaer_model, A_hat, feats, A_orig_ten, weight_tensor, norm, lr, epochs, device, dtype=None, monitor=None):
+    """批量模型的训练循环；monitor为trainer.EarlyStopping时按所有模型的平均损失提前停止"""
+    optimizer = torch.optim.Adam(vgaer_model.parameters(), lr=lr)
+    print('Total Parameters:', sum([p.nelement() for p in vgaer_model.parameters()]))
+
+    for epoch in range(epochs):
+        vgaer_model.train()
+        with torch.autocast(torch.device(device).type, dtype=torch.bfloat16 if dtype is None else dtype, enabled=dtype is not None):
+            recovered, hidemb = vgaer_model.forward(A_hat, feats)
+        losses = batched_loss(vgaer_model, recovered, A_orig_ten, weight_tensor, norm)
+        optimizer.zero_grad()
+        losses.sum().backward()
+        optimizer.step()
+        if monitor is not None and monitor.step(epoch, losses.mean(), hidemb):
+            print(f"Converged after {epoch + 1} epochs")
+            break
+    return hidemb.detach().float().cpu(), losses.detach().cpu()
+
+
+def train_batched(adjs, hidden1, hidden2, lr, epochs, device, dtype=None, monitor=None):
+    """
+    一次训练S个相互独立的VGAER模型（每个时间窗口一个）。
+    adjs为scipy稀疏邻接矩阵列表，所有窗口的节点集合必须相同；dtype不为None时前向在该精度下autocast。
+    返回 (S, N, hidden2) 的隐变量和最后一个epoch每个窗口的损失。
+    """
+    num_models = len(adjs)
+    feats = BatchedModularityFeatures(adjs, device)
+    A_hat = block_normalize_adj(adjs).to(device)
+    n = feats.shape[1]
+
+    A_orig_ten = torch.from_numpy(np.stack([adj.toarray() for adj in adjs]).astype(np.float32)).to(device)
+    weight_tensor, norm = batched_loss_para(A_orig_ten + torch.eye(n, device=device))
+
+    vgaer_model = BatchedVGAERModel(num_models, n, hidden1, hidden2, device).to(device)
+    return fit(vgaer_model, A_hat, feats, A_orig_ten, weight_tensor, norm, lr, epochs, device, dtype, monitor)
+
+
+def train_ensemble(adj, num_seeds, hidden1, hidden2, lr, epochs, device, dtype=None, monitor=None):
+    """
+    同一个窗口的num_seeds个随机初始化的模型，权重堆叠后一次批量训练（每个模型即一个种子）。
+    A_hat、特征B、目标和权重只构造一份 (N, N)，在种子维上共享，显存不随种子数增长。
+    返回 (num_seeds, N, hidden2) 的隐变量和每个模型的损失
+    """
+    feats = ModularityFeatures(adj, device)
+    A_hat = normalize_adj(adj).to(device)
+    n = feats.shape[0]
+
+    A_orig_ten = torch.from_numpy(sp.csr_matrix(adj).toarray().astype(np.float32)).to(device).unsqueeze(0)
+    weight_tensor, norm = batched_loss_para(A_orig_ten + torch.eye(n, device=device))
+
+    vgaer_model = BatchedVGAERModel(num_seeds, n, hidden1, hidden2, device).to(device)
+    return fit(vgaer_model, A_hat, feats, A_orig_ten, weight_tensor, norm, lr, epochs, device, dtype, monitor)
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+社区发现流程的可复现基准测试。
+
+图：随机块模型（SBM，默认 N = 180, 1000, 5000, 20000，带真实社区标签）和仓库中的真实窗口（P Threshold value networks/gml）。
+对每个图分阶段计时：
+    load        nx.read_gml + 稀疏邻接矩阵（SBM先写入临时GML，写文件不计时）
+    a_hat       A_hat = D^-1/2 (A+I) D^-1/2 和模块度特征B
+    train       VGAER训练，记录每个epoch的平均耗时（N较大时自动改用负采样的稀疏模式）
+    tsne        cluster.embed降到2维
+    kmeans      KMeans(n_init=20)
+    q           Qvalue.modularity
+    nmi         NMI.compare_partitions（SBM与真实标签比较，真实窗口与上一个窗口比较）
+    matching    align.match_labels：bincount重叠矩阵 + 匈牙利算法匹配社区编号（与上一个划分，SBM与真实标签）
+每个阶段记录耗时（--repeat次的中位数），结果写入JSON。每个阶段单独测量内存峰值（阶段开始时重置）：
+    peak_cuda_mb   CUDA上该阶段内torch分配的峰值增量（reset_peak_memory_stats / max_memory_allocated）
+    peak_alloc_mb  --memory时该阶段内Python/NumPy分配的峰值增量（tracemalloc；不含torch的CPU张量，且会拖慢计时）
+进程整个生命周期的常驻内存高水位只在meta.process_peak_rss_mb中记录一次，不作为阶段指标。
+给出 --baseline 时与之前保存的JSON逐阶段比较，慢于 (1 + --tolerance) 倍的阶段视为回归，返回码为1；
+两次结果都有阶段内存时一并列出（不判定回归）。训练路径（mode）、epoch数或计时单位不同的阶段不可比，只标出差异，不判定回归。
+
+    python benchmark.py --output bench.json
+    python benchmark.py --sizes 180 1000 --no_real --output after.json --baseline bench.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import tracemalloc
+import tempfile
+import argparse
+
+import numpy as np
+import scipy.sparse as sp
+import networkx as nx
+import torch
+import torch.nn.functional as F
+from sklearn.cluster import KMeans
+
+import model
+from cluster import embed, CLUSTER_METHODS
+from preprocess import sparse_adjacency, normalize_adj, loss_para, ModularityFeatures
+from sampling import NegativeSampler
+from Qvalue import modularity
+from NMI import compare_partitions
+from align import match_labels
+from graph_store import GML_FOLDER
+from returns_store import window_files
+
+STAGES = ('load', 'a_hat', 'train', 'tsne', 'kmeans', 'q', 'nmi', 'matching')
+# 阶段记录中决定耗时含义的配置，两次结果不同时不比较（如train的dense/sparse/neg）
+COMPARE_KEYS = ('mode', 'epochs', 'unit')
+
+
+def peak_memory_mb():
+    """进程生命周期内的常驻内存高水位（MB）；Windows上需要psutil，不可用时返回None"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024. ** 2 if sys.platform == 'darwin' else peak / 1024.
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 1024. ** 2
+        except (ImportError, AttributeError):
+            return None
+
+
+def sbm_graph(n, clusters=4, degree_in=16., degree_out=4., seed=0):
+    """
+    稀疏随机块模型：每对社区之间的边数按二项分布抽取，再均匀抽取端点，不枚举N^2个节点对。
+    平均每个节点有约degree_in条社区内的边和degree_out条社区间的边。返回 (CSR邻接矩阵, 社区标签)
+    """
+    rng = np.random.default_rng(seed)
+    labels = np.repeat(np.arange(clusters), int(np.ceil(n / float(clusters))))[:n]
+    starts = np.searchsorted(labels, np.arange(clusters + 1))
+    sizes = np.diff(starts)
+    p_in = min(1., degree_in / max(sizes.max() - 1, 1))
+    p_out = min(1., degree_out / max(n - sizes.max(), 1))
+    rows, cols = [], []
+    for a in range(clusters):
+        for b in range(a, clusters):
+            pairs = sizes[a] * (sizes[a] - 1) // 2 if a == b else sizes[a] * sizes[b]
+            count = rng.binomial(pairs, p_in if a == b else p_out)
+            u = rng.integers(starts[a], starts[a + 1], count)
+            v = rng.integers(starts[b], starts[b + 1], count)
+            keep = u != v
+            rows.append(u[keep])
+            cols.append(v[keep])
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    adj = sp.coo_matrix((np.ones(2 * len(rows), dtype=np.float32),
+                         (np.concatenate((rows, cols)), np.concatenate((cols, rows)))), shape=(n, n)).tocsr()
+    adj.data[:] = 1.
+    return adj, labels
+
+
+def write_sbm_gml(adj, folder, name):
+    G = nx.from_scipy_sparse_array(adj)
+    G = nx.relabel_nodes(G, {i: f"{i:06d}" for i in G.nodes()})
+    path = os.path.join(folder, f"{name}.gml")
+    nx.write_gml(G, path)
+    return path
+
+
+class StageTimer(object):
+    """记录每个阶段的耗时和该阶段内的内存峰值增量；CUDA上计时前后同步"""
+
+    def __init__(self, device, memory=False):
+        self.device = device
+        self.memory = memory
+        self.records = {}
+        self.base = {}
+
+    def begin(self):
+        # 重置峰值计数，记录阶段开始时已分配的内存
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            self.base['alloc'] = tracemalloc.get_traced_memory()[0]
+        if self.device.type == 'cuda':
+            torch.cuda.reset_peak_memory_stats(self.device)
+            self.base['cuda'] = torch.cuda.memory_allocated(self.device)
+
+    def stage_memory(self):
+        """begin()以来的峰值增量（MB）"""
+        memory = {}
+        if 'alloc' in self.base:
+            memory['peak_alloc_mb'] = (tracemalloc.get_traced_memory()[1] - self.base.pop('alloc')) / 1024. ** 2
+        if 'cuda' in self.base:
+            memory['peak_cuda_mb'] = (torch.cuda.max_memory_allocated(self.device) - self.base.pop('cuda')) / 1024. ** 2
+        return memory
+
+    def __call__(self, name):
+        timer = self
+
+        class _Stage(object):
+            def __enter__(self):
+                if timer.device.type == 'cuda':
+                    torch.cuda.synchronize()
+                timer.begin()
+                self.start = time.perf_counter()
+                return self
+
+            def __exit__(self, *exc):
+                if timer.device.type == 'cuda':
+                    torch.cuda.synchronize()
+                timer.add(name, time.perf_counter() - self.start, **timer.stage_memory())
+                return False
+
+        return _Stage()
+
+    def add(self, name, seconds, **memory):
+        # 内存取repeat次中的最大值
+        record = self.records.setdefault(name, {'seconds': []})
+        record['seconds'].append(seconds)
+        for key, value in memory.items():
+            record[key] = max(record.get(key, value), value)
+
+
+def train_mode_for(n, mode):
+    if mode != 'auto':
+        return mode
+    return 'dense' if n <= 2000 else 'neg'
+
+
+def train(adj, a_hat, feats, args, device, timer, mode):
+    """与划分算法.py相同的损失；预热warmup个epoch后计时，返回隐变量"""
+    n = adj.shape[0]
+    adj_self = adj + sp.eye(n, dtype=np.float32, format='csr')
+    if mode == 'dense':
+        a_hat = a_hat.to_dense()
+        feats = feats.to_dense()
+    if mode == 'neg':
+        sampler = NegativeSampler(adj_self, adj, args.neg_ratio, device)
+    else:
+        target = torch.from_numpy(adj.toarray()).to(device)
+        pos_weight, norm = loss_para(adj_self)
+        weight_tensor = torch.from_numpy(np.where(adj_self.toarray().reshape(-1) == 1, pos_weight, 1.0)
+                                         .astype(np.float32)).to(device)
+
+    torch.manual_seed(args.seed)
+    vgaer_model = model.VGAERModel(n, args.hidden1, args.hidden2, device).to(device)
+    optimizer = torch.optim.Adam(vgaer_model.parameters(), lr=args.lr)
+
+    def epoch_step():
+        if mode == 'neg':
+            hidemb = vgaer_model.encoder(a_hat, feats)
+            neg_rows, neg_cols, scale = sampler.sample()
+            pos_logits = torch.sigmoid(vgaer_model.decoder_edges(hidemb, sampler.pos_rows, sampler.pos_cols))
+            neg_logits = torch.sigmoid(vgaer_model.decoder_edges(hidemb, neg_rows, neg_cols))
+            loss = sampler.loss(pos_logits, neg_logits, scale)
+        else:
+            recovered = vgaer_model.forward(a_hat, feats)
+            logits = torch.sigmoid(recovered[0])
+            hidemb = recovered[1]
+            loss = norm * F.binary_cross_entropy(logits.view(-1), target.view(-1), weight=weight_tensor)
+        loss = loss - 0.5 / hidemb.size(0) * (
+                1 + 2 * vgaer_model.log_std - vgaer_model.mean ** 2 - torch.exp(vgaer_model.log_std) ** 2).sum(1).mean()
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        return hidemb
+
+    for _ in range(args.warmup):
+        epoch_step()
+    with timer('train'):
+        for _ in range(args.epochs):
+            hidemb = epoch_step()
+    record = timer.records['train']
+    record['seconds'][-1] /= args.epochs
+    record.update({'unit': 'per_epoch', 'mode': mode, 'epochs': args.epochs})
+    return hidemb.detach().cpu().numpy()
+
+
+def run_graph(gml_file, args, device, truth=None, prev=None):
+    """对一个GML文件运行所有阶段repeat次，返回 (结果字典, 最后一次的划分)"""
+    timer = StageTimer(device, args.memory)
+    for _ in range(args.repeat):
+        with timer('load'):
+            G = nx.read_gml(gml_file, label='label')
+            adj = sparse_adjacency(G)
+        with timer('a_hat'):
+            a_hat = normalize_adj(adj).to(device)
+            feats = ModularityFeatures(adj, device)
+        mode = train_mode_for(adj.shape[0], args.train_mode)
+        z = train(adj, a_hat, feats, args, device, timer, mode)
+        if 'tsne' in args.skip:
+            z2 = z
+        else:
+            with timer('tsne'):
+                z2 = embed(z, args.tsne_method)
+        with timer('kmeans'):
+            labels = KMeans(n_clusters=args.cluster, max_iter=1000, tol=0.001, n_init=20, init='k-means++',
+                            random_state=args.seed).fit_predict(z2)
+        with timer('q'):
+            q = modularity(adj, labels)
+        reference = truth if truth is not None else prev
+        if reference is not None:
+            with timer('nmi'):
+                scores = compare_partitions(reference, labels)
+            with timer('matching'):
+                match_labels(reference, labels)
+    result = {
+        'n': int(adj.shape[0]), 'edges': int(adj.nnz // 2),
+        'q': float(q), 'scores': scores if reference is not None else None,
+        'stages': {name: dict(record, seconds=float(np.median(record['seconds'])), runs=record['seconds'])
+                   for name, record in timer.records.items()},
+    }
+    return result, labels
+
+
+def run_benchmark(args):
+    device = torch.device('cuda' if torch.cuda.is_available() and not args.cpu else 'cpu')
+    if args.memory:
+        tracemalloc.start()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            adj, truth = sbm_graph(n, args.cluster, seed=args.seed)
+            gml_file = write_sbm_gml(adj, tmp, f"sbm_{n}")
+            name = f"sbm-{n}"
+            print(f"{name}: {adj.nnz // 2} edges")
+            results[name], _ = run_graph(gml_file, args, device, truth=truth)
+            print_stages(name, results[name])
+    if not args.no_real:
+        windows = window_files(args.gml_folder, '.gml')[:args.max_windows or None]
+        prev = None
+        for label, gml_file in windows:
+            name = f"window-{label}"
+            results[name], prev = run_graph(gml_file, args, device, prev=prev)
+            print_stages(name, results[name])
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'torch': torch.__version__, 'numpy': np.__version__,
+            'device': str(device), 'threads': torch.get_num_threads(),
+            'args': vars(args),
+            'process_peak_rss_mb': peak_memory_mb(),
+        },
+        'results': results,
+    }
+
+
+def print_stages(name, result):
+    cells = ', '.join(f"{stage} {result['stages'][stage]['seconds'] * 1e3:.2f}ms"
+                      for stage in STAGES if stage in result['stages'])
+    print(f"  {name} (N={result['n']}): {cells}")
+
+
+def compare(current, baseline, tolerance=0.1, min_delta=1e-3):
+    """
+    逐(图, 阶段)比较中位数耗时，返回 [(图, 阶段, 基线秒数, 当前秒数, 比值, 基线内存, 当前内存, 配置差异, 是否回归)]。
+    比值超过1+tolerance且绝对差超过min_delta秒才算回归，避免亚毫秒阶段的计时噪声；
+    内存为阶段内的峰值增量（CUDA优先，其次tracemalloc），任一次结果没有时为None；
+    配置差异为 COMPARE_KEYS 中两次记录不同的项（如 'mode dense->neg'），不为None时该行不判定回归
+    """
+    rows = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        for stage, record in result['stages'].items():
+            if stage not in base['stages']:
+                continue
+            before, after = base['stages'][stage]['seconds'], record['seconds']
+            ratio = after / before if before > 0 else float('inf')
+            key = next((k for k in ('peak_cuda_mb', 'peak_alloc_mb') if k in record and k in base['stages'][stage]), None)
+            mem_before = base['stages'][stage][key] if key else None
+            mem_after = record[key] if key else None
+            changed = [f"{k} {base['stages'][stage].get(k)}->{record.get(k)}" for k in COMPARE_KEYS
+                       if base['stages'][stage].get(k) != record.get(k)]
+            mismatch = ', '.join(changed) if changed else None
+            rows.append((name, stage, before, after, ratio, mem_before, mem_after, mismatch,
+                         mismatch is None and ratio > 1. + tolerance and after - before > min_delta))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='*', default=[180, 1000, 5000, 20000], help='Node counts of the synthetic SBM graphs.')
+    parser.add_argument('--gml_folder', type=str, default=GML_FOLDER, help='Folder with the real per-window GML files.')
+    parser.add_argument('--no_real', action='store_true', help='Skip the real windows.')
+    parser.add_argument('--max_windows', type=int, default=0, help='Only benchmark the first N real windows (0 = all).')
+    parser.add_argument('--cluster', type=int, default=4, help='Number of community')
+    parser.add_argument('--epochs', type=int, default=50, help='Timed training epochs per graph.')
+    parser.add_argument('--warmup', type=int, default=5, help='Untimed warm-up epochs.')
+    parser.add_argument('--hidden1', type=int, default=8, help='Number of units in hidden layer 1.')
+    parser.add_argument('--hidden2', type=int, default=2, help='Number of units in hidden layer 2.')
+    parser.add_argument('--lr', type=float, default=0.05, help='Initial learning rate.')
+    parser.add_argument('--train_mode', type=str, default='auto', choices=['auto', 'dense', 'sparse', 'neg'], help='Training path; auto = dense up to 2000 nodes, negative sampling above.')
+    parser.add_argument('--neg_ratio', type=float, default=1., help='Negative samples per edge in neg mode.')
+    parser.add_argument('--tsne_method', type=str, default='tsne_fast', choices=CLUSTER_METHODS, help='Embedding backend timed in the tsne stage.')
+    parser.add_argument('--skip', type=str, nargs='*', default=[], choices=['tsne'], help='Stages to skip.')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per graph; the median is reported.')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed.')
+    parser.add_argument('--threads', type=int, default=None, help='Intra-op threads.')
+    parser.add_argument('--cpu', action='store_true', help='Benchmark on CPU even if CUDA is available.')
+    parser.add_argument('--memory', action='store_true', help='Measure per-stage Python/NumPy peak allocations with tracemalloc (slows the timed stages).')
+    parser.add_argument('--output', type=str, default='benchmark.json', help='Where to write the JSON results.')
+    parser.add_argument('--baseline', type=str, default=None, help='Earlier JSON results to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed relative slowdown before a stage counts as a regression.')
+    parser.add_argument('--min_delta', type=float, default=1e-3, help='Ignore slowdowns smaller than this many seconds.')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    np.random.seed(args.seed)
+    report = run_benchmark(args)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Results have been saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.tolerance, args.min_delta)
+        print(f"{'graph':<22} {'stage':<9} {'baseline':>11} {'current':>11} {'ratio':>7} {'memory (MB)':>19}")
+        for name, stage, before, after, ratio, mem_before, mem_after, mismatch, regressed in rows:
+            memory = f"{mem_before:>8.2f} ->{mem_after:>8.2f}" if mem_before is not None else ' ' * 19
+            print(f"{name:<22} {stage:<9} {before * 1e3:>9.2f}ms {after * 1e3:>9.2f}ms {ratio:>7.2f} {memory}"
+                  + ('  REGRESSION' if regressed else '') + (f'  NOT COMPARABLE ({mismatch})' if mismatch else ''))
+        regressions = sum(row[-1] for row in rows)
+        skipped = sum(row[-2] is not None for row in rows)
+        print(f"{regressions} regression(s) out of {len(rows) - skipped} comparable stages"
+              + (f", {skipped} skipped (different mode/epochs/unit)" if skipped else ''))
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+按内容寻址的窗口结果缓存：键为邻接矩阵内容与VGAER/聚类超参数、种子的SHA-256，
+值为训练得到的隐变量z、社区标签和Q值（np.savez_compressed，z以float32保存）。
+
+    cache = ResultCache('./vgaer_cache', max_mb=512)
+    key = cache.key(A_sp, {'hidden1': 8, 'hidden2': 2, 'lr': 0.05, 'seed': 43, ...})
+    hit = cache.get(key)            # {'z', 'labels', 'Q', ...} 或 None
+    if hit is None:
+        ...训练、聚类...
+        cache.put(key, z=z, labels=labels, Q=Q_value)
+
+GML文件内容或任一超参数变化时键随之改变，只有这些窗口重新训练。
+条目的修改时间即最近使用时间：get命中时更新，put后按修改时间从旧到新删除，直到总大小不超过max_mb（LRU）。
+warm start需要的模型和优化器状态以 <键>.pt 的形式与条目一起保存和淘汰。
+多个进程（--workers）可以共享同一个缓存目录：条目先写临时文件再原子替换，列目录、读取和删除时
+其他进程刚删除的文件都按不存在处理；按键前两位划分的子目录创建后不再删除，避免与其他进程的写入竞争。
+写入中途被终止的进程留下的临时文件（*.tmp）在淘汰时计入总大小，超过STALE_TMP_SECONDS未被替换的直接删除。
+"""
+import os
+import json
+import time
+import hashlib
+import argparse
+
+import numpy as np
+import scipy.sparse as sp
+
+ENTRY_EXT = '.npz'
+STATE_EXT = '.pt'
+TMP_EXT = '.tmp'
+# 写入一个条目只需几秒，超过该时间（秒）仍存在的临时文件视为写入进程已被终止
+STALE_TMP_SECONDS = 3600.
+
+
+def add_cache_args(parser):
+    parser.add_argument('--cache', type=str, default=None,
+                        help='Folder for cached per-window embeddings, labels and Q (only windows whose inputs changed are retrained).')
+    parser.add_argument('--cache_size_mb', type=float, default=1024., help='Size bound of the cache; least recently used entries are evicted.')
+    return parser
+
+
+def adjacency_digest(adj):
+    """邻接矩阵内容的哈希，与存储格式（稠密/稀疏、dtype、重复项）无关"""
+    A = sp.csr_matrix(adj, dtype=np.float32)
+    A.sum_duplicates()
+    A.eliminate_zeros()
+    A.sort_indices()
+    h = hashlib.sha256()
+    h.update(np.asarray(A.shape, dtype=np.int64).tobytes())
+    h.update(A.indptr.astype(np.int64).tobytes())
+    h.update(A.indices.astype(np.int64).tobytes())
+    h.update(A.data.tobytes())
+    return h.hexdigest()
+
+
+class ResultCache(object):
+    """大小有界的LRU结果缓存，条目按键的前两位分目录存放"""
+
+    def __init__(self, root, max_mb=1024.):
+        self.root = root
+        self.max_bytes = None if max_mb is None else int(max_mb * 1024 ** 2)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(adj, params):
+        h = hashlib.sha256()
+        h.update(adjacency_digest(adj).encode())
+        h.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def path(self, key, ext=ENTRY_EXT):
+        return os.path.join(self.root, key[:2], key + ext)
+
+    def get(self, key):
+        """命中时返回条目中的数组（0维数组转为标量）并更新其最近使用时间，否则返回None"""
+        path = self.path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                entry = {name: data[name][()] if data[name].ndim == 0 else data[name] for name in data.files}
+        except (OSError, ValueError, EOFError):
+            # 不存在或写入不完整的条目都视为未命中
+            self.misses += 1
+            return None
+        self._touch(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, state=None, **arrays):
+        """写入条目（先写临时文件再原子替换），state不为None时另存为 <键>.pt，然后按LRU淘汰"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, **{name: np.asarray(value) for name, value in arrays.items()})
+        os.replace(tmp, path)
+        if state is not None:
+            import torch
+            torch.save(state, tmp)
+            os.replace(tmp, self.path(key, STATE_EXT))
+        self.evict()
+
+    def load_state(self, key):
+        """warm start状态，不存在（或已被其他进程淘汰）时返回None"""
+        import torch
+        try:
+            return torch.load(self.path(key, STATE_EXT), map_location='cpu')
+        except FileNotFoundError:
+            return None
+
+    def _touch(self, key):
+        for ext in (ENTRY_EXT, STATE_EXT):
+            try:
+                os.utime(self.path(key, ext))
+            except FileNotFoundError:
+                pass
+
+    def _files(self, exts):
+        """子目录中扩展名在exts中的文件 [(文件名, 路径, os.stat结果)]"""
+        files = []
+        for sub in os.listdir(self.root):
+            folder = os.path.join(self.root, sub)
+            try:
+                names = os.listdir(folder)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            for name in names:
+                if os.path.splitext(name)[1] not in exts:
+                    continue
+                path = os.path.join(folder, name)
+                try:
+                    files.append((name, path, os.stat(path)))
+                except FileNotFoundError:
+                    # 其他进程在listdir之后删除了该文件
+                    continue
+        return files
+
+    def entries(self):
+        """[(最近使用时间, 总字节数, 键)]，按最近使用时间从旧到新排序"""
+        entries = {}
+        for name, _, stat in self._files((ENTRY_EXT, STATE_EXT)):
+            key = os.path.splitext(name)[0]
+            used, size = entries.get(key, (0., 0))
+            entries[key] = (max(used, stat.st_mtime), size + stat.st_size)
+        return sorted((used, size, key) for key, (used, size) in entries.items())
+
+    def clean_temporaries(self, max_age=STALE_TMP_SECONDS):
+        """删除超过max_age秒的临时文件，返回其余（可能正在写入的）临时文件的总字节数"""
+        now = time.time()
+        pending = 0
+        for _, path, stat in self._files((TMP_EXT,)):
+            if now - stat.st_mtime <= max_age:
+                pending += stat.st_size
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return pending
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """删除过期的临时文件，再删除最久未使用的条目直到总大小（含正在写入的临时文件）不超过上限，返回删除的条目数"""
+        pending = self.clean_temporaries()
+        if self.max_bytes is None:
+            return 0
+        entries = self.entries()
+        total = pending + sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            self.remove(key)
+            total -= size
+            removed += 1
+        return removed
+
+    def remove(self, key):
+        # 子目录保留：其他进程可能正在put()中向其写入
+        for ext in (ENTRY_EXT, STATE_EXT):
+            try:
+                os.remove(self.path(key, ext))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        for _, _, key in self.entries():
+            self.remove(key)
+
+    def __repr__(self):
+        return f"ResultCache({self.root!r}, hits={self.hits}, misses={self.misses})"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('cache', type=str, help='Cache folder.')
+    parser.add_argument('--max_mb', type=float, default=None, help='Evict least recently used entries down to this size.')
+    parser.add_argument('--clear', action='store_true', help='Remove all entries.')
+    args = parser.parse_args()
+    cache = ResultCache(args.cache, args.max_mb)
+    if args.clear:
+        cache.clear()
+    removed = cache.evict()
+    print(f"{len(cache.entries())} entries, {cache.size() / 1024 ** 2:.2f} MB ({removed} evicted)")
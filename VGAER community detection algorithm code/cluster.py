@@ -1,9 +1,9 @@
 from sklearn.cluster import KMeans
-import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
 from sklearn.manifold import TSNE
 import os
+import inspect
 #def community (z,clusters):
     #z = z.detach().numpy()
     #C_model = KMeans(n_clusters=clusters, verbose=1, max_iter=100, tol=0.01, n_init=3)
@@ -31,21 +31,45 @@ import os
     # plt.scatter(z[:, 0], z[:, 1], c=commu_predict, marker='o', s=10)  # 不同类别不同颜色
     # plt.title("k-means")
     #return commu_predict
-def community(z1, clusters, save_path, title):
-    z1 = z1.detach().numpy()
-    #for i in range(1,11):
-    #ts = manifold.TSNE(n_components=2, perplexity=3, early_exaggeration=10, n_iter=50000, learning_rate=500,  angle=0.5, init='random')
-    ts = TSNE(n_components=2, perplexity=50, early_exaggeration=500, n_iter=100000, learning_rate=100, angle=0.5,
-                       init='random')
-    z = ts.fit_transform(z1)
-    #C_model = KMeans(n_clusters=clusters, verbose=0, max_iter=1000, tol=0.001, n_init=20, init='k-means++')
-    C_model = KMeans(n_clusters=clusters, verbose=0, max_iter=1000, tol=0.001, n_init=20, init='k-means++')
-    #C_model = KMeans(n_clusters=clusters, verbose=0, max_iter=100, tol=0.01, n_init=3)
-    C_model.fit(z)
-    commu_predict = C_model.labels_
-    #torch.save(commu_predict, './pred.pt')
+# 聚类后端：
+#   tsne      原始流程，TSNE(n_iter=100000) 降到2维后KMeans
+#   tsne_fast Barnes-Hut TSNE，按梯度范数/无进展轮数提前停止
+#   fft       openTSNE的FFT加速TSNE（可选依赖）
+#   kmeans    直接在VGAER隐变量z上做KMeans，不做降维
+CLUSTER_METHODS = ('tsne', 'tsne_fast', 'fft', 'kmeans')
+# scikit-learn 1.5 起TSNE的迭代次数参数为max_iter（n_iter已移除）
+TSNE_ITER = 'max_iter' if 'max_iter' in inspect.signature(TSNE).parameters else 'n_iter'
+
+
+def embed(z1, method='tsne'):
+    if method == 'tsne':
+        #ts = manifold.TSNE(n_components=2, perplexity=3, early_exaggeration=10, n_iter=50000, learning_rate=500,  angle=0.5, init='random')
+        ts = TSNE(n_components=2, perplexity=50, early_exaggeration=500, learning_rate=100, angle=0.5,
+                  init='random', **{TSNE_ITER: 100000})
+        return ts.fit_transform(z1)
+    if method == 'tsne_fast':
+        perplexity = min(50, (z1.shape[0] - 1) / 3.)
+        ts = TSNE(n_components=2, perplexity=perplexity, n_iter_without_progress=50, min_grad_norm=1e-5,
+                  learning_rate='auto', method='barnes_hut', angle=0.5, init='pca', **{TSNE_ITER: 1000})
+        return ts.fit_transform(z1)
+    if method == 'fft':
+        try:
+            from openTSNE import TSNE as FFTTSNE
+        except ImportError:
+            raise ImportError("cluster method 'fft' requires openTSNE (pip install openTSNE)")
+        perplexity = min(50, (z1.shape[0] - 1) / 3.)
+        return np.asarray(FFTTSNE(n_components=2, perplexity=perplexity, negative_gradient_method='fft',
+                                  n_jobs=1).fit(z1))
+    if method == 'kmeans':
+        return z1
+    raise NotImplementedError(method)
+
+
+def save_plot(z, commu_predict, save_path, title):
+    # 仅在需要保存图像时才导入matplotlib并绘图
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(10,10), dpi=80)
-    z = plt.scatter(z[:, 0], z[:, 1], c=commu_predict, marker='o', s=10)  # 不同类别不同颜色
+    plt.scatter(z[:, 0], z[:, 1], c=commu_predict, marker='o', s=10)  # 不同类别不同颜色
     plt.title(title)  # 设置图像标题为时间窗口的标签
 
     # 调试信息
@@ -57,7 +81,49 @@ def community(z1, clusters, save_path, title):
     except Exception as e:
         print(f"Error saving community plot: {e}")
     plt.close()
+
+
+def community(z1, clusters, save_path=None, title=None, method='tsne'):
+    z1 = z1.detach().numpy()
+    z = embed(z1, method)
+    #C_model = KMeans(n_clusters=clusters, verbose=0, max_iter=1000, tol=0.001, n_init=20, init='k-means++')
+    C_model = KMeans(n_clusters=clusters, verbose=0, max_iter=1000, tol=0.001, n_init=20, init='k-means++')
+    #C_model = KMeans(n_clusters=clusters, verbose=0, max_iter=100, tol=0.01, n_init=3)
+    C_model.fit(z)
+    commu_predict = C_model.labels_
+    #torch.save(commu_predict, './pred.pt')
+    if save_path is not None:
+        save_plot(z, commu_predict, save_path, title)
     #plt.savefig('./cora{}.pdf'.format(i))
     #plt.show()
     #print(i)
     return commu_predict
+
+
+# 多种子集成：S个划分的共现矩阵、共识划分和节点稳定性
+def co_association(partitions):
+    """(S, N) 的S个划分 -> (N, N) 共现矩阵，C_ij为节点i、j被分到同一社区的划分比例"""
+    partitions = np.asarray(partitions)
+    num_partitions, n = partitions.shape
+    onehot = np.zeros((num_partitions, n, partitions.max() + 1))
+    onehot[np.arange(num_partitions)[:, None], np.arange(n), partitions] = 1.
+    return np.einsum('snk,smk->nm', onehot, onehot) / num_partitions
+
+
+def consensus_partition(coassoc, clusters):
+    """对距离 1 - C 做平均连接层次聚类并切成clusters个社区，社区编号从0开始连续"""
+    from scipy.cluster.hierarchy import linkage, fcluster
+    from scipy.spatial.distance import squareform
+    dist = 1. - coassoc
+    np.fill_diagonal(dist, 0.)
+    labels = fcluster(linkage(squareform(dist, checks=False), method='average'), clusters, criterion='maxclust')
+    return np.unique(labels, return_inverse=True)[1]
+
+
+def stability_scores(coassoc, labels):
+    """每个节点与同一共识社区中其他节点的平均共现比例，1表示所有种子的划分都一致"""
+    labels = np.asarray(labels)
+    onehot = np.eye(labels.max() + 1)[labels]
+    within = (coassoc @ onehot)[np.arange(len(labels)), labels] - np.diag(coassoc)
+    others = onehot.sum(axis=0)[labels] - 1
+    return np.where(others > 0, within / np.maximum(others, 1), 1.)
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+迁移结果的行业富集分析（industry_classification.json）。
+
+股票代码通过整数索引映射到行业；观测单元为 节点×窗口（或节点×相邻窗口对），每个观测有一个类型：
+    community   该窗口所在的社区 A, B, ...（与 enrichment_all/top50/bottom50.xlsx 相同）
+    transition  相邻窗口之间的迁移类型 'A->B'（含留在原社区的 'A->A'）
+    move        相邻窗口之间是否换了社区 stay / move
+每个节点的类型计数 C (节点, 类型) 和行业编号确定所有 (类型, 行业) 单元：
+    Observed   x = 该类型中属于该行业的观测数
+    Enrichment (x / n_类型) / (K_行业 / N)
+    p_value    超几何分布（即单侧Fisher精确检验），所有单元一次向量化计算；alternative='two-sided'时为双侧Fisher
+    q_value    Benjamini-Hochberg FDR
+同一节点在多个窗口中的观测并不独立，因此还提供置换零分布：在节点之间置换行业标签（保持每个节点的完整路径），
+重新计算富集度，p_perm = (1 + #{置换富集度 >= 观测值}) / (1 + 置换次数)，置换按块分发到进程池。
+
+    python enrichment.py --paths "../Node migration path/migration_paths.json" \
+        --industries "../Node migration path/industry_classification.json" --returns_store ../returns_store \
+        --permutations 10000 --workers 4 --output enrichment_out
+"""
+import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.stats import hypergeom
+
+from migration import community_names, add_source_args, add_split_args, load_migration, load_scores
+
+UNITS = ('community', 'transition', 'move')
+ALTERNATIVES = ('greater', 'less', 'two-sided')
+
+
+def load_industries(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def industry_index(codes, classification):
+    """股票代码 -> 行业编号（不在分类中的为-1），以及行业名称列表"""
+    names = list(classification)
+    lookup = {str(code)[:6]: i for i, name in enumerate(names) for code in classification[name]}
+    return np.array([lookup.get(str(code)[:6], -1) for code in codes], dtype=np.int64), names
+
+
+def type_counts(mig, unit='community'):
+    """每个节点各类型的观测数 (节点, 类型) 和类型名称"""
+    labels = mig.labels.astype(np.int64)
+    k, n = mig.k, labels.shape[1]
+    names = community_names(k)
+    if unit == 'community':
+        valid = labels >= 0
+        types, n_types, type_names = labels, k, names
+    elif unit in ('transition', 'move'):
+        src, dst = labels[:-1], labels[1:]
+        valid = (src >= 0) & (dst >= 0)
+        if unit == 'transition':
+            types, n_types = src * k + dst, k * k
+            type_names = [f'{a}->{b}' for a in names for b in names]
+        else:
+            types, n_types, type_names = (src != dst).astype(np.int64), 2, ['stay', 'move']
+    else:
+        raise ValueError(f"unit must be one of {UNITS}, got {unit!r}")
+    nodes = np.broadcast_to(np.arange(n), types.shape)
+    counts = np.bincount((nodes * n_types + types)[valid], minlength=n * n_types).reshape(n, n_types)
+    return counts, type_names
+
+
+def cell_counts(counts, industries, n_industries):
+    """(类型, 行业) 观测数：按行业编号对节点的类型计数求和（行业为-1的节点不计）"""
+    known = industries >= 0
+    table = np.zeros((n_industries, counts.shape[1]), dtype=np.int64)
+    np.add.at(table, industries[known], counts[known])
+    return table.T
+
+
+def enrichment_ratio(table):
+    """(x / n_类型) / (K_行业 / N)，对 (..., 类型, 行业) 的最后两维计算"""
+    table = np.asarray(table, dtype=np.float64)
+    rows = table.sum(axis=-1, keepdims=True)
+    cols = table.sum(axis=-2, keepdims=True)
+    total = table.sum(axis=(-2, -1), keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (table / rows) / (cols / total)
+
+
+def hypergeom_pvalues(table, alternative='greater'):
+    """所有 (类型, 行业) 单元的超几何/Fisher p值，一次向量化计算"""
+    table = np.asarray(table, dtype=np.int64)
+    x = table
+    n = table.sum(axis=1, keepdims=True)         # 每个类型的观测数
+    K = table.sum(axis=0, keepdims=True)         # 每个行业的观测数
+    N = table.sum()
+    n, K = np.broadcast_to(n, x.shape), np.broadcast_to(K, x.shape)
+    if alternative == 'greater':
+        return hypergeom.sf(x - 1, N, K, n)
+    if alternative == 'less':
+        return hypergeom.cdf(x, N, K, n)
+    if alternative != 'two-sided':
+        raise ValueError(f"alternative must be one of {ALTERNATIVES}, got {alternative!r}")
+    # 双侧Fisher：支撑集上概率不超过观测值概率的取值之和
+    low = np.maximum(0, n + K - N)
+    high = np.minimum(n, K)
+    support = np.arange(int((high - low).max()) + 1)
+    y = low[..., None] + support
+    inside = y <= high[..., None]
+    pmf = np.where(inside, hypergeom.pmf(y, N, K[..., None], n[..., None]), 0.)
+    observed = hypergeom.pmf(x, N, K, n)[..., None]
+    return np.minimum(1., np.where(pmf <= observed * (1 + 1e-7), pmf, 0.).sum(axis=-1))
+
+
+def fdr_bh(pvalues):
+    """Benjamini-Hochberg 校正后的q值，形状与输入相同（NaN保持为NaN）"""
+    p = np.asarray(pvalues, dtype=np.float64)
+    flat = p.ravel()
+    q = np.full(flat.shape, np.nan)
+    valid = np.flatnonzero(~np.isnan(flat))
+    order = valid[np.argsort(flat[valid], kind='stable')]
+    m = len(order)
+    if m:
+        ranked = flat[order] * m / np.arange(1, m + 1)
+        q[order] = np.minimum(1., np.minimum.accumulate(ranked[::-1])[::-1])
+    return q.reshape(p.shape)
+
+
+def permutation_chunk(counts, industries, n_industries, observed, size, seed, batch=256):
+    """size次行业标签置换中富集度 >= / <= 观测值的次数（工作进程中运行）"""
+    rng = np.random.default_rng(seed)
+    known = np.flatnonzero(industries >= 0)
+    counts = counts[known].astype(np.float64)
+    labels = industries[known]
+    eye = np.eye(n_industries)
+    greater = np.zeros(observed.shape, dtype=np.int64)
+    less = np.zeros(observed.shape, dtype=np.int64)
+    tol = 1e-12
+    for start in range(0, size, batch):
+        b = min(batch, size - start)
+        perms = rng.permuted(np.broadcast_to(labels, (b, len(labels))), axis=1)
+        tables = np.einsum('nt,bng->btg', counts, eye[perms])
+        ratio = enrichment_ratio(tables)
+        greater += (ratio >= observed - tol).sum(axis=0)
+        less += (ratio <= observed + tol).sum(axis=0)
+    return greater, less
+
+
+def permutation_pvalues(counts, industries, n_industries, observed, permutations=1000, workers=1, seed=0,
+                        alternative='greater', chunk=1000):
+    """
+    节点间置换行业标签的经验p值；置换按每块chunk次分发到workers个进程，每块使用由seed派生的独立随机种子，
+    分块与进程数无关，因此结果不随workers变化
+    """
+    sizes = [min(chunk, permutations - start) for start in range(0, permutations, chunk)]
+    chunks = len(sizes)
+    seeds = np.random.SeedSequence(seed).spawn(chunks)
+    jobs = [(counts, industries, n_industries, observed, size, s) for size, s in zip(sizes, seeds)]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(permutation_chunk, *zip(*jobs)))
+    else:
+        results = [permutation_chunk(*job) for job in jobs]
+    greater = sum(r[0] for r in results)
+    less = sum(r[1] for r in results)
+    if alternative == 'greater':
+        exceed = greater
+    elif alternative == 'less':
+        exceed = less
+    else:
+        exceed = np.minimum(2 * np.minimum(greater, less), permutations)
+    # 富集度为NaN的单元（子集中没有该行业或该类型的观测）无法比较，p值为NaN，也不计入FDR校正
+    return np.where(np.isnan(observed), np.nan, (1. + exceed) / (1. + permutations))
+
+
+def enrichment(mig, classification, unit='community', nodes=None, alternative='greater', permutations=0, workers=1,
+               seed=0):
+    """
+    富集分析的长表：Community(类型), Industry, Enrichment, Observed, Expected, p_value, q_value
+    （permutations>0时另有 p_perm, q_perm），按类型和行业名称排序。nodes为参与分析的节点子集（如top50）
+    """
+    counts, type_names = type_counts(mig, unit)
+    industries, names = industry_index(mig.codes, classification)
+    if nodes is not None:
+        subset = np.zeros(len(industries), dtype=bool)
+        subset[np.asarray(nodes)] = True
+        industries = np.where(subset, industries, -1)
+    table = cell_counts(counts, industries, len(names))
+    ratio = enrichment_ratio(table)
+    expected = table.sum(axis=1, keepdims=True) * table.sum(axis=0, keepdims=True) / max(table.sum(), 1)
+    pvalues = hypergeom_pvalues(table, alternative)
+
+    t_index, g_index = np.meshgrid(np.arange(len(type_names)), np.arange(len(names)), indexing='ij')
+    df = pd.DataFrame({'Community': np.array(type_names, dtype=object)[t_index.ravel()],
+                       'Industry': np.array(names, dtype=object)[g_index.ravel()],
+                       'Enrichment': ratio.ravel(), 'Observed': table.ravel(), 'Expected': expected.ravel(),
+                       'p_value': pvalues.ravel(), 'q_value': fdr_bh(pvalues).ravel()})
+    if permutations > 0:
+        p_perm = permutation_pvalues(counts, industries, len(names), ratio, permutations, workers, seed, alternative)
+        df['p_perm'] = p_perm.ravel()
+        df['q_perm'] = fdr_bh(p_perm).ravel()
+    # 没有观测的类型（如未出现的迁移类型）和没有观测的行业（如子集中没有该行业的节点）不输出
+    df = df[(df['Observed'].groupby(df['Community']).transform('sum') > 0)
+            & (df['Observed'].groupby(df['Industry']).transform('sum') > 0)]
+    return df.sort_values(['Community', 'Industry']).reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    add_source_args(parser)
+    parser.add_argument('--industries', type=str,
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Node migration path', 'industry_classification.json'),
+                        help='Industry classification JSON {industry: [tickers]}.')
+    parser.add_argument('--unit', type=str, default='community', choices=UNITS, help='Observation type to test.')
+    parser.add_argument('--alternative', type=str, default='greater', choices=ALTERNATIVES, help='Tail of the hypergeometric test.')
+    parser.add_argument('--permutations', type=int, default=0, help='Industry-label permutations for the empirical null (0 = off).')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes for the permutations.')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed of the permutations.')
+    parser.add_argument('--output', type=str, default='enrichment_out', help='Output folder.')
+    add_split_args(parser)
+    args = parser.parse_args()
+
+    mig = load_migration(args)
+    classification = load_industries(args.industries)
+    groups = {'all': None}
+    scores = load_scores(mig, args.scores, args.returns_store, args.split_by_mobility)
+    if scores is not None:
+        top, bottom = mig.split(scores, args.top)
+        groups[f'top{args.top}'] = top
+        groups[f'bottom{args.top}'] = bottom
+
+    os.makedirs(args.output, exist_ok=True)
+    for name, nodes in groups.items():
+        df = enrichment(mig, classification, args.unit, nodes, args.alternative, args.permutations, args.workers,
+                        args.seed)
+        path = os.path.join(args.output, f'enrichment_{name}.xlsx')
+        df.to_excel(path, index=False)
+        significant = df[df['q_value'] < 0.05]
+        print(f"{name}: {len(df)} cells, {len(significant)} with q < 0.05 -> {path}")
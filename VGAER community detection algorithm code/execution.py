@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+VGAER流程的执行配置：进程内线程数、窗口级工作进程数和GCN层/解码器的autocast精度。
+
+入口脚本不再在导入时写死 OMP_NUM_THREADS=1 和 CUDA_LAUNCH_BLOCKING=1，而是：
+    add_execution_args(parser)
+    args = parser.parse_args()
+    profile = configure(args, device)
+    with profile.autocast():
+        recovered = vgaer_model.forward(A_hat, feats)
+--threads 缺省时取环境变量 OMP_NUM_THREADS，否则为 CPU核数 // --workers。
+损失始终在float32下计算，bf16只用于前向中的矩阵乘法。
+
+精度审计：同一个窗口、同一个种子分别用fp32和bf16训练，比较损失、模块度和划分的一致性：
+    python execution.py --audit path/to/window.gml --epochs 1000
+"""
+import os
+import argparse
+
+import numpy as np
+import torch
+
+PRECISIONS = ('fp32', 'bf16')
+
+
+def add_execution_args(parser, workers_help='Worker processes for independent windows (1 = sequential).'):
+    parser.add_argument('--threads', '--threads_per_worker', dest='threads', type=int, default=None,
+                        help='Intra-op threads per process (default: OMP_NUM_THREADS if set, otherwise CPU cores / --workers).')
+    parser.add_argument('--workers', type=int, default=1, help=workers_help)
+    parser.add_argument('--precision', type=str, default='fp32', choices=PRECISIONS,
+                        help='Autocast dtype for the GCN layers and decoder; the loss stays in float32.')
+    parser.add_argument('--cuda_launch_blocking', action='store_true', help='Synchronous CUDA kernel launches (debugging only).')
+    return parser
+
+
+def default_threads(workers=1):
+    if os.environ.get('OMP_NUM_THREADS'):
+        return int(os.environ['OMP_NUM_THREADS'])
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+class ExecutionProfile(object):
+    """线程数、工作进程数和autocast精度"""
+
+    def __init__(self, threads=None, workers=1, precision='fp32', device=None):
+        if precision not in PRECISIONS:
+            raise ValueError(f"precision must be one of {PRECISIONS}, got {precision!r}")
+        self.workers = max(1, workers)
+        self.threads = threads or default_threads(self.workers)
+        self.precision = precision
+        self.device = torch.device(device if device is not None else 'cpu')
+
+    @property
+    def dtype(self):
+        """前向的autocast dtype，fp32时为None"""
+        return torch.bfloat16 if self.precision == 'bf16' else None
+
+    def apply(self):
+        # 环境变量同时传给之后启动的工作进程
+        os.environ['OMP_NUM_THREADS'] = str(self.threads)
+        torch.set_num_threads(self.threads)
+        return self
+
+    def autocast(self):
+        return torch.autocast(self.device.type, dtype=torch.bfloat16, enabled=self.dtype is not None)
+
+    def __repr__(self):
+        return (f"ExecutionProfile(threads={self.threads}, workers={self.workers}, "
+                f"precision={self.precision}, device={self.device})")
+
+
+def configure(args, device=None):
+    """根据命令行参数创建并应用执行配置"""
+    if getattr(args, 'cuda_launch_blocking', False):
+        os.environ['CUDA_LAUNCH_BLOCKING'] = '1'
+    profile = ExecutionProfile(args.threads, getattr(args, 'workers', 1), args.precision, device).apply()
+    print(profile)
+    return profile
+
+
+def init_worker(num_threads):
+    # 每个工作进程使用固定的线程数，避免进程数×线程数超过CPU核数
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    torch.set_num_threads(num_threads)
+
+
+def train_dense(G, hidden1, hidden2, lr, epochs, seed, dtype=None, device='cpu', tail=50):
+    """审计用的稠密VGAER训练（与划分算法.py稠密模式的损失相同），返回 (z, 最后tail个epoch的平均损失)"""
+    import scipy.sparse as sp
+    import model
+    from preprocess import sparse_adjacency, normalize_adj, loss_para, ModularityFeatures
+
+    A_sp = sparse_adjacency(G)
+    n = A_sp.shape[0]
+    A_hat = normalize_adj(A_sp).to_dense().to(device)
+    feats = ModularityFeatures(A_sp).to_dense().to(device)
+    target = torch.from_numpy(A_sp.toarray()).to(device)
+    pos_weight, norm = loss_para(A_sp + sp.eye(n, dtype=np.float32, format='csr'))
+    weight_tensor = torch.where(target.view(-1) + torch.eye(n, device=device).view(-1) == 1,
+                                torch.tensor(float(pos_weight), device=device), torch.tensor(1., device=device))
+    norm = torch.tensor(norm, device=device)
+
+    torch.manual_seed(seed)
+    vgaer_model = model.FusedVGAERModel(n, hidden1, hidden2, device, num_nodes=n).to(device)
+    optimizer = torch.optim.Adam(vgaer_model.parameters(), lr=lr)
+    losses = torch.zeros(epochs, device=device)
+    for epoch in range(epochs):
+        loss, z = model.vgaer_step(vgaer_model, A_hat, feats, target, weight_tensor, norm, dtype=dtype)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        losses[epoch] = loss.detach()
+    return z.detach().float().cpu(), losses[-tail:].mean().item()
+
+
+def audit_precision(gml_file, clusters=4, hidden1=8, hidden2=2, lr=0.05, epochs=1000, seed=42,
+                    loss_tol=0.02, q_tol=0.05):
+    """
+    fp32与bf16训练结果的对比：相对损失差、两种精度下KMeans划分的模块度差和ARI。
+    损失和模块度差都在容差内时通过（ARI只作参考，不同的隐变量可能给出编号和边界不同的等价划分）
+    """
+    import networkx as nx
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import adjusted_rand_score
+    from preprocess import sparse_adjacency
+    from Qvalue import modularity
+
+    G = nx.read_gml(gml_file, label='label')
+    A_sp = sparse_adjacency(G)
+    report = {}
+    for precision, dtype in (('fp32', None), ('bf16', torch.bfloat16)):
+        z, loss = train_dense(G, hidden1, hidden2, lr, epochs, seed, dtype)
+        labels = KMeans(n_clusters=clusters, n_init=20, random_state=seed).fit_predict(z.numpy())
+        report[precision] = {'loss': loss, 'Q': modularity(A_sp, labels), 'labels': labels}
+    rel_loss = abs(report['bf16']['loss'] - report['fp32']['loss']) / abs(report['fp32']['loss'])
+    dq = abs(report['bf16']['Q'] - report['fp32']['Q'])
+    result = {
+        'loss_fp32': report['fp32']['loss'], 'loss_bf16': report['bf16']['loss'], 'rel_loss_diff': rel_loss,
+        'Q_fp32': report['fp32']['Q'], 'Q_bf16': report['bf16']['Q'], 'Q_diff': dq,
+        'ARI': adjusted_rand_score(report['fp32']['labels'], report['bf16']['labels']),
+        'passed': bool(rel_loss <= loss_tol and dq <= q_tol),
+    }
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--audit', type=str, required=True, help='GML file of the window to audit.')
+    parser.add_argument('--cluster', type=int, default=4, help='Number of community')
+    parser.add_argument('--epochs', type=int, default=1000, help='Number of epochs to train.')
+    parser.add_argument('--hidden1', type=int, default=8, help='Number of units in hidden layer 1.')
+    parser.add_argument('--hidden2', type=int, default=2, help='Number of units in hidden layer 2.')
+    parser.add_argument('--lr', type=float, default=0.05, help='Initial learning rate.')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed.')
+    parser.add_argument('--loss_tol', type=float, default=0.02, help='Maximum relative difference of the final loss.')
+    parser.add_argument('--q_tol', type=float, default=0.05, help='Maximum absolute difference of the modularity.')
+    parser.add_argument('--threads', type=int, default=None, help='Intra-op threads.')
+    args = parser.parse_args()
+    ExecutionProfile(args.threads).apply()
+    result = audit_precision(args.audit, args.cluster, args.hidden1, args.hidden2, args.lr, args.epochs, args.seed,
+                             args.loss_tol, args.q_tol)
+    for key, value in result.items():
+        print(f"{key:<15} {value}")
+    raise SystemExit(0 if result['passed'] else 1)
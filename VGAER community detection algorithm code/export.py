@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+社区划分结果的导出：Q值、社区变化、节点稳定性和每个窗口的社区分配，每个文件只写一次。
+
+    export_results(output_folder, 'csv', q_values, community_changes_dict, community_assignments_dict,
+                   community_stability_dict, node_labels)
+
+格式：
+    csv      默认。q_values.csv、community_changes.csv，每个窗口一个 community_assignments_<窗口>.csv
+    xlsx     与原流程相同的文件名和布局，每个窗口一个 community_assignments_<窗口>.xlsx
+    sheets   所有窗口写入同一个 community_assignments.xlsx，每个窗口一个工作表
+    parquet  所有窗口写入一个长表 community_assignments.parquet（窗口, 节点, 社区），需要pyarrow或fastparquet
+csv/xlsx/sheets中每个窗口的社区分配为宽表：每列一个社区（编号从小到大），列中是该社区的股票代码。
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+EXPORT_FORMATS = ('csv', 'xlsx', 'sheets', 'parquet')
+EXTENSIONS = {'csv': '.csv', 'xlsx': '.xlsx', 'sheets': '.xlsx', 'parquet': '.parquet'}
+
+
+def add_export_args(parser):
+    parser.add_argument('--export_format', type=str, default='csv', choices=EXPORT_FORMATS,
+                        help='Output format: csv (one file per window), xlsx (legacy per-window workbooks), '
+                             'sheets (one workbook, one sheet per window) or parquet (one long table).')
+    return parser
+
+
+def assignment_table(assignments):
+    """{股票代码: 社区} -> 宽表，每列一个社区，列内股票按原顺序排列，短列以NaN补齐"""
+    nodes = np.asarray(list(assignments.keys()), dtype=object)
+    labels = np.asarray(list(assignments.values()))
+    order = np.argsort(labels, kind='stable')
+    communities, counts = np.unique(labels[order], return_counts=True)
+    columns = np.split(nodes[order], np.cumsum(counts)[:-1])
+    return pd.concat([pd.Series(members, name=community) for community, members in zip(communities, columns)],
+                     axis=1)
+
+
+def assignment_long(community_assignments_dict):
+    """所有窗口的社区分配 -> 长表 (Time Window, Node, Community)"""
+    frames = [pd.DataFrame({'Time Window': time_window, 'Node': list(assignments.keys()),
+                            'Community': np.asarray(list(assignments.values()), dtype=np.int32)})
+              for time_window, assignments in community_assignments_dict.items()]
+    df = pd.concat(frames, ignore_index=True)
+    df['Time Window'] = df['Time Window'].astype('category')
+    return df
+
+
+def window_table(table_dict, node_labels):
+    """{窗口: {股票代码: 值}} -> 以窗口为行、股票为列的表（社区变化和节点稳定性）"""
+    df = pd.DataFrame.from_dict(table_dict, orient='index').reindex(columns=node_labels)
+    df.index.name = 'Time Window'
+    return df.reset_index()
+
+
+def require_parquet():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        try:
+            import fastparquet  # noqa: F401
+        except ImportError:
+            raise ImportError("export format 'parquet' requires pyarrow or fastparquet (pip install pyarrow)")
+
+
+def write_table(df, path, fmt):
+    if fmt == 'csv':
+        df.to_csv(path, index=False, encoding='utf-8-sig')
+    elif fmt == 'parquet':
+        df.columns = [str(c) for c in df.columns]
+        df.to_parquet(path, index=False)
+    else:
+        df.to_excel(path, index=False)
+
+
+def export_results(output_folder, fmt, q_values, community_changes_dict, community_assignments_dict,
+                   community_stability_dict=None, node_labels=None):
+    """写出全部结果，返回 {结果名: 路径}；每个窗口的社区分配路径以 assignments_<窗口> 为键"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"export format must be one of {EXPORT_FORMATS}, got {fmt!r}")
+    if fmt == 'parquet':
+        require_parquet()
+    os.makedirs(output_folder, exist_ok=True)
+    ext = EXTENSIONS[fmt]
+    written = {}
+
+    tables = {'q_values': pd.DataFrame(q_values, columns=['Time Window', 'Q Value']),
+              'community_changes': window_table(community_changes_dict, node_labels)}
+    if community_stability_dict:
+        tables['community_stability'] = window_table(community_stability_dict, node_labels)
+    for name, df in tables.items():
+        written[name] = os.path.join(output_folder, name + ext)
+        write_table(df, written[name], fmt)
+
+    if fmt == 'parquet':
+        written['assignments'] = os.path.join(output_folder, 'community_assignments.parquet')
+        assignment_long(community_assignments_dict).to_parquet(written['assignments'], index=False)
+    elif fmt == 'sheets':
+        written['assignments'] = os.path.join(output_folder, 'community_assignments.xlsx')
+        with pd.ExcelWriter(written['assignments']) as writer:
+            for time_window, assignments in community_assignments_dict.items():
+                # 工作表名最长31个字符
+                assignment_table(assignments).to_excel(writer, sheet_name=str(time_window)[:31], index=False)
+    else:
+        for time_window, assignments in community_assignments_dict.items():
+            path = os.path.join(output_folder, f'community_assignments_{time_window}{ext}')
+            write_table(assignment_table(assignments), path, fmt)
+            written[f'assignments_{time_window}'] = path
+    return written
+
+
+def report(written, output_folder):
+    for name in ('q_values', 'community_changes', 'community_stability'):
+        if name in written:
+            print(f"{name.replace('_', ' ').capitalize()} have been saved to {written[name]}")
+    if 'assignments' in written:
+        print(f"Community assignments have been saved to {written['assignments']}")
+    else:
+        print(f"Community assignments have been saved to individual files in {output_folder}")
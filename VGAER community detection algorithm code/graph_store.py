@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+P阈值网络的二进制图存储。
+
+把 P Threshold value networks/gml/*.gml（或 csv/*.csv 边列表）中的35个窗口打包为一个CSR集合：
+    indptr.npy   (W, N+1)  每个窗口的行指针（相对于该窗口边的起点）
+    offsets.npy  (W+1,)    每个窗口的边在indices/weights中的起止位置
+    indices.npy  (E,)      列下标（int32）
+    weights.npy  (E,)      边权（float32）
+    index.json             共享的股票代码列表、窗口标签和源文件名
+读取时全部以mmap方式打开，adjacency(i)直接返回scipy CSR矩阵，不再经过networkx解析GML。
+
+    python graph_store.py --store ./graph_store
+    store = GraphStore('./graph_store')
+    A = store.adjacency('2014-01-02_01')
+"""
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import networkx as nx
+
+from returns_store import ROOT, window_files
+
+GML_FOLDER = os.path.join(ROOT, 'P Threshold value networks', 'gml')
+CSV_FOLDER = os.path.join(ROOT, 'P Threshold value networks', 'csv')
+
+
+def read_gml_adjacency(path):
+    """用networkx读取一个GML，返回 (CSR邻接矩阵, 股票代码列表)"""
+    G = nx.read_gml(path, label='label')
+    return sp.csr_matrix(nx.to_scipy_sparse_array(G, format='csr'), dtype=np.float32), list(G.nodes())
+
+
+def read_edge_csv(path, tickers):
+    """
+    快速读取 source,target,weight 边列表，返回对称的CSR邻接矩阵。
+    tickers为节点顺序（边列表中不包含孤立节点，因此必须给出完整的股票列表）
+    """
+    edges = pd.read_csv(path, dtype={'source': str, 'target': str})
+    position = pd.Index(tickers)
+    rows = position.get_indexer(edges['source'])
+    cols = position.get_indexer(edges['target'])
+    if (rows < 0).any() or (cols < 0).any():
+        raise ValueError(f"{path} contains tickers outside the given node list")
+    weights = edges['weight'].to_numpy(dtype=np.float32) if 'weight' in edges else np.ones(len(edges), dtype=np.float32)
+    n = len(tickers)
+    adj = sp.coo_matrix((np.concatenate((weights, weights)), (np.concatenate((rows, cols)), np.concatenate((cols, rows)))),
+                        shape=(n, n))
+    adj = adj.tocsr()
+    adj.sum_duplicates()
+    return adj
+
+
+def read_tickers(path):
+    """节点列表文件：JSON列表或每行一个股票代码的文本"""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.json'):
+            return [str(t) for t in json.load(f)]
+        return [line.strip() for line in f if line.strip()]
+
+
+def universe_tickers(tickers=None, returns_store=None, gml_folder=GML_FOLDER):
+    """
+    csv边列表的完整节点列表。边列表不包含孤立节点，所以节点不能从边的端点推断，依次取：
+    tickers（列表或节点列表文件）、收益率缓存（returns_store.py）的股票代码、第一个GML窗口的节点
+    """
+    if tickers is not None:
+        return read_tickers(tickers) if isinstance(tickers, str) else [str(t) for t in tickers]
+    if returns_store is not None:
+        from returns_store import ReturnsStore
+        return list(ReturnsStore(returns_store).tickers)
+    windows = window_files(gml_folder, '.gml') if os.path.isdir(gml_folder) else []
+    if not windows:
+        raise ValueError("csv edge lists do not list isolated nodes: give the node list with --tickers, "
+                         "--returns_store or a folder of GML windows")
+    return read_gml_adjacency(windows[0][1])[1]
+
+
+def save_graph_store(store_dir, labels, files, adjs, tickers):
+    os.makedirs(store_dir, exist_ok=True)
+    offsets = np.concatenate(([0], np.cumsum([adj.nnz for adj in adjs]))).astype(np.int64)
+    np.save(os.path.join(store_dir, 'indptr.npy'), np.stack([adj.indptr for adj in adjs]).astype(np.int32))
+    np.save(os.path.join(store_dir, 'offsets.npy'), offsets)
+    np.save(os.path.join(store_dir, 'indices.npy'), np.concatenate([adj.indices for adj in adjs]).astype(np.int32))
+    np.save(os.path.join(store_dir, 'weights.npy'), np.concatenate([adj.data for adj in adjs]).astype(np.float32))
+    with open(os.path.join(store_dir, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump({'tickers': [str(t) for t in tickers], 'labels': labels, 'files': files}, f, ensure_ascii=False, indent=2)
+    print(f"Packed {len(adjs)} windows, {len(tickers)} nodes, {offsets[-1]} directed edges into {store_dir}")
+    return GraphStore(store_dir)
+
+
+def build_graph_store(store_dir, gml_folder=GML_FOLDER):
+    """一次性把所有GML窗口打包为CSR集合"""
+    windows = window_files(gml_folder, '.gml')
+    adjs, tickers = [], None
+    for label, path in windows:
+        adj, nodes = read_gml_adjacency(path)
+        if tickers is None:
+            tickers = nodes
+        elif nodes != tickers:
+            raise ValueError(f"{path} has a different node set from the first window")
+        adjs.append(adj)
+    return save_graph_store(store_dir, [label for label, _ in windows],
+                            [os.path.basename(path) for _, path in windows], adjs, tickers)
+
+
+def build_graph_store_from_csv(store_dir, csv_folder=CSV_FOLDER, tickers=None, returns_store=None, gml_folder=GML_FOLDER):
+    """从csv边列表打包；节点列表和顺序由universe_tickers确定，与GML窗口和收益率缓存一致"""
+    windows = window_files(csv_folder, '.csv')
+    tickers = universe_tickers(tickers, returns_store, gml_folder)
+    adjs = [read_edge_csv(path, tickers) for _, path in windows]
+    return save_graph_store(store_dir, [label for label, _ in windows],
+                            [os.path.basename(path) for _, path in windows], adjs, tickers)
+
+
+class GraphStore(object):
+    """以mmap方式读取save_graph_store生成的CSR集合"""
+
+    def __init__(self, store_dir):
+        with open(os.path.join(store_dir, 'index.json'), encoding='utf-8') as f:
+            index = json.load(f)
+        self.store_dir = store_dir
+        self.tickers = index['tickers']
+        self.labels = index['labels']
+        self.files = index['files']
+        load = lambda name: np.load(os.path.join(store_dir, f'{name}.npy'), mmap_mode='r')
+        self.indptr = load('indptr')
+        self.offsets = load('offsets')
+        self.indices = load('indices')
+        self.weights = load('weights')
+
+    def __len__(self):
+        return len(self.labels)
+
+    def position(self, key):
+        """窗口编号、窗口标签或源文件名（可带路径） -> 窗口编号"""
+        if isinstance(key, (int, np.integer)):
+            return int(key)
+        key = os.path.basename(key)
+        if key in self.labels:
+            return self.labels.index(key)
+        stems = [os.path.splitext(name)[0] for name in self.files]
+        return stems.index(os.path.splitext(key)[0])
+
+    def adjacency(self, key):
+        """第key个窗口的CSR邻接矩阵，indices和data直接引用mmap数组"""
+        i = self.position(key)
+        start, end = self.offsets[i], self.offsets[i + 1]
+        n = len(self.tickers)
+        return sp.csr_matrix((self.weights[start:end], self.indices[start:end], self.indptr[i]), shape=(n, n), copy=False)
+
+    def dense(self, key):
+        return self.adjacency(key).toarray()
+
+    def to_networkx(self, key):
+        """需要networkx算法时再构造图对象，节点标签与read_gml(label='label')相同"""
+        G = nx.from_scipy_sparse_array(self.adjacency(key))
+        return nx.relabel_nodes(G, dict(enumerate(self.tickers)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--store', type=str, default=os.path.join(ROOT, 'graph_store'), help='Output folder for the graph store.')
+    parser.add_argument('--source', type=str, default='gml', choices=['gml', 'csv'], help='Build from GML files or csv edge lists.')
+    parser.add_argument('--folder', type=str, default=None, help='Folder with the per-window GML/csv files.')
+    parser.add_argument('--tickers', type=str, default=None, help='Node list for csv sources (JSON list or one ticker per line).')
+    parser.add_argument('--returns_store', type=str, default=None, help='Take the csv node list from a returns_store.py store.')
+    parser.add_argument('--gml_folder', type=str, default=GML_FOLDER, help='Otherwise take the csv node list from the first GML window here.')
+    args = parser.parse_args()
+    if args.source == 'gml':
+        build_graph_store(args.store, args.folder or GML_FOLDER)
+    else:
+        build_graph_store_from_csv(args.store, args.folder or CSV_FOLDER, args.tickers, args.returns_store, args.gml_folder)
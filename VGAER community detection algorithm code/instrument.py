@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+窗口流程的轻量级埋点：分阶段计时、计数器和可选的每窗口性能剖析。
+
+    tracer = Tracer(sync=device.type == 'cuda')
+    with tracer.window('2014-01-02_01'):
+        with tracer.stage('train'):
+            ...
+        tracer.count('epochs', 1000)
+    tracer.dump_json('trace.json')            # 结构化记录：每个阶段一条，每个窗口的计数器
+    tracer.dump_chrome_trace('trace.trace')   # chrome://tracing / Perfetto 可直接打开
+    tracer.print_summary()                    # 按阶段汇总的总耗时和占比
+
+阶段记录为 {'window', 'stage', 'start', 'seconds', 'pid'}，start是相对Tracer创建时刻的秒数。
+sync=True时阶段开始和结束前都调用torch.cuda.synchronize()，使异步的CUDA内核计入所在阶段。
+profile='torch'时每个窗口用torch.profiler采集一次，导出 <profile_dir>/<窗口>.trace.json；
+profile='cprofile'时用cProfile采集，导出 <profile_dir>/<窗口>.prof（snakeviz或pstats查看）。
+工作进程中的记录用 take() 取出随结果返回，主进程用 merge() 合并。
+"""
+import os
+import json
+import time
+import argparse
+import cProfile
+from contextlib import contextmanager
+from collections import OrderedDict
+
+import torch
+
+PROFILERS = ('none', 'torch', 'cprofile')
+
+
+def add_instrument_args(parser):
+    parser.add_argument('--trace', type=str, default=None, help='Write per-stage timing records and counters to this JSON file.')
+    parser.add_argument('--chrome_trace', type=str, default=None, help='Write the stage timings as a Chrome trace (chrome://tracing, Perfetto).')
+    parser.add_argument('--profile', type=str, default='none', choices=PROFILERS,
+                        help='Capture a torch.profiler or cProfile profile for every window.')
+    parser.add_argument('--profile_dir', type=str, default='profiles', help='Output folder for the per-window profiles.')
+    return parser
+
+
+class Tracer(object):
+    """分阶段计时、计数器和每窗口剖析的记录器"""
+
+    def __init__(self, sync=False, profile='none', profile_dir='profiles'):
+        if profile not in PROFILERS:
+            raise ValueError(f"profile must be one of {PROFILERS}, got {profile!r}")
+        self.sync = sync
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.origin = time.time()
+        self.records = []
+        self.counters = OrderedDict()
+        self.current = None
+
+    def _synchronize(self):
+        if self.sync and torch.cuda.is_available():
+            torch.cuda.synchronize()
+
+    @contextmanager
+    def stage(self, name, **meta):
+        """计时一个阶段，记录归属于当前窗口"""
+        self._synchronize()
+        start = time.perf_counter()
+        wall = time.time()
+        try:
+            yield
+        finally:
+            self._synchronize()
+            record = {'window': self.current, 'stage': name, 'start': wall - self.origin,
+                      'seconds': time.perf_counter() - start, 'pid': os.getpid()}
+            record.update(meta)
+            self.records.append(record)
+
+    def count(self, name, value=1, window=None):
+        """累加当前窗口（或指定窗口）的计数器"""
+        counters = self.counters.setdefault(window if window is not None else self.current, OrderedDict())
+        counters[name] = counters.get(name, 0) + value
+
+    @contextmanager
+    def window(self, label):
+        """窗口作用域：其中的阶段和计数器归属于label，profile不为none时剖析整个窗口"""
+        prev, self.current = self.current, label
+        try:
+            with self.stage('window'), self._profiler(label):
+                yield
+        finally:
+            self.current = prev
+
+    @contextmanager
+    def _profiler(self, label):
+        if self.profile == 'none':
+            yield
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        if self.profile == 'torch':
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            with torch.profiler.profile(activities=activities, record_shapes=True) as prof:
+                yield
+            prof.export_chrome_trace(os.path.join(self.profile_dir, f'{label}.trace.json'))
+        else:
+            prof = cProfile.Profile()
+            prof.enable()
+            try:
+                yield
+            finally:
+                prof.disable()
+                prof.dump_stats(os.path.join(self.profile_dir, f'{label}.prof'))
+
+    def take(self):
+        """取出并清空已有的记录（工作进程把它随结果返回）"""
+        state = {'origin': self.origin, 'records': self.records, 'counters': self.counters}
+        self.records, self.counters = [], OrderedDict()
+        return state
+
+    def merge(self, state):
+        # 工作进程的start相对于它自己的Tracer创建时刻，按墙钟时间换算到本Tracer
+        shift = state.get('origin', self.origin) - self.origin
+        self.records.extend(dict(record, start=record['start'] + shift) for record in state['records'])
+        for window, counters in state['counters'].items():
+            for name, value in counters.items():
+                self.count(name, value, window)
+
+    def summary(self):
+        """按阶段汇总：次数、总耗时、平均耗时、最大耗时（不含window本身）"""
+        stages = OrderedDict()
+        for record in self.records:
+            if record['stage'] == 'window':
+                continue
+            entry = stages.setdefault(record['stage'], {'calls': 0, 'total': 0., 'max': 0.})
+            entry['calls'] += 1
+            entry['total'] += record['seconds']
+            entry['max'] = max(entry['max'], record['seconds'])
+        for entry in stages.values():
+            entry['mean'] = entry['total'] / entry['calls']
+        return stages
+
+    def totals(self):
+        """所有窗口的计数器之和"""
+        totals = OrderedDict()
+        for counters in self.counters.values():
+            for name, value in counters.items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def print_summary(self):
+        stages = self.summary()
+        grand = sum(entry['total'] for entry in stages.values()) or 1.
+        print(f"{'stage':<12}{'calls':>7}{'total(s)':>11}{'mean(s)':>10}{'max(s)':>10}{'share':>8}")
+        for name, entry in stages.items():
+            print(f"{name:<12}{entry['calls']:>7}{entry['total']:>11.3f}{entry['mean']:>10.4f}"
+                  f"{entry['max']:>10.4f}{entry['total'] / grand:>8.1%}")
+        for name, value in self.totals().items():
+            print(f"{name}: {value}")
+
+    def to_dict(self):
+        return {'origin': self.origin, 'records': self.records,
+                'counters': {str(window): counters for window, counters in self.counters.items()},
+                'summary': self.summary(), 'totals': self.totals()}
+
+    def dump_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    def chrome_events(self):
+        """Chrome trace事件：每个阶段一个完整事件(ph='X')，时间单位为微秒，每个进程一条轨道"""
+        events = []
+        for record in self.records:
+            args = {key: value for key, value in record.items() if key not in ('stage', 'start', 'seconds', 'pid')}
+            events.append({'name': record['stage'], 'cat': 'window' if record['stage'] == 'window' else 'stage',
+                           'ph': 'X', 'ts': record['start'] * 1e6, 'dur': record['seconds'] * 1e6,
+                           'pid': record['pid'], 'tid': record['pid'], 'args': args})
+        for window, counters in self.counters.items():
+            ends = [r['start'] + r['seconds'] for r in self.records if r['window'] == window]
+            events.append({'name': str(window), 'ph': 'C', 'ts': max(ends, default=0.) * 1e6,
+                           'pid': os.getpid(), 'args': dict(counters)})
+        return events
+
+    def dump_chrome_trace(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': self.chrome_events(), 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+
+    def dump(self, json_path=None, chrome_path=None):
+        if json_path:
+            self.dump_json(json_path)
+            print(f"Stage timings have been saved to {json_path}")
+        if chrome_path:
+            self.dump_chrome_trace(chrome_path)
+            print(f"Chrome trace has been saved to {chrome_path}")
+
+
+if __name__ == '__main__':
+    # 汇总之前保存的JSON记录
+    parser = argparse.ArgumentParser()
+    parser.add_argument('trace', type=str, help='JSON file written with --trace.')
+    parser.add_argument('--chrome_trace', type=str, default=None, help='Convert the records to a Chrome trace.')
+    args = parser.parse_args()
+    with open(args.trace, encoding='utf-8') as f:
+        saved = json.load(f)
+    tracer = Tracer()
+    tracer.origin = saved['origin']
+    tracer.merge(saved)
+    tracer.print_summary()
+    if args.chrome_trace:
+        tracer.dump_chrome_trace(args.chrome_trace)
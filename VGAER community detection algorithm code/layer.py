@@ -33,6 +33,8 @@ import torch
 from torch.nn.parameter import Parameter
 from torch.nn.modules.module import Module
 
+from preprocess import sparse_mm
+
 
 class GraphConvolution(Module):
     """
@@ -58,9 +60,10 @@ class GraphConvolution(Module):
             self.bias.data.uniform_(-stdv, stdv)
 
     def forward(self, adj, input):
-        self.weight.cuda()
-        support = torch.mm(input, self.weight)
-        output = torch.spmm(adj, support)
+        # input既可以是稠密张量，也可以是preprocess.ModularityFeatures（稀疏模式）
+        support = input.mm(self.weight)
+        # adj既可以是稠密矩阵，也可以是稀疏COO矩阵（稀疏乘法不参与autocast，按adj的精度计算）
+        output = sparse_mm(adj, support) if adj.is_sparse else torch.mm(adj, support)
 
         # 如果使用vgaer，需要使用激活函数
         # output = self.act(output)
@@ -73,3 +76,51 @@ class GraphConvolution(Module):
         return self.__class__.__name__ + ' (' \
                + str(self.in_features) + ' -> ' \
                + str(self.out_features) + ')'
+
+
+class BatchedGraphConvolution(Module):
+    """
+    S个相互独立的GCN层堆叠在一起：weight为(S, in, out)，
+    adj为块对角稀疏矩阵(S*N, S*N)或稠密的(S, N, N)
+    """
+
+    def __init__(self, num_models, in_features, out_features, bias=True, act=F.tanh):
+        super(BatchedGraphConvolution, self).__init__()
+        self.num_models = num_models
+        self.in_features = in_features
+        self.out_features = out_features
+        self.weight = Parameter(torch.FloatTensor(num_models, in_features, out_features))
+        self.act = act
+        if bias:
+            self.bias = Parameter(torch.FloatTensor(num_models, 1, out_features))
+        else:
+            self.register_parameter('bias', None)
+        self.reset_parameters()
+
+    def reset_parameters(self):
+        stdv = 1. / math.sqrt(self.out_features)
+        self.weight.data.uniform_(-stdv, stdv)
+        if self.bias is not None:
+            self.bias.data.uniform_(-stdv, stdv)
+
+    def forward(self, adj, input):
+        # input为(S, N, in)的稠密张量或preprocess.BatchedModularityFeatures
+        support = input.bmm(self.weight)
+        S, n, out = support.shape
+        if adj.is_sparse and adj.shape[0] == n and S > 1:
+            # 所有模型共享同一个 (N, N) 的A_hat（同一窗口的多个种子）：一次稀疏乘法作用于 (N, S*out)
+            output = sparse_mm(adj, support.transpose(0, 1).reshape(n, S * out)).reshape(n, S, out).transpose(0, 1)
+        elif adj.is_sparse:
+            output = sparse_mm(adj, support.reshape(S * n, out)).reshape(S, n, out)
+        else:
+            output = torch.bmm(adj, support)
+        if self.bias is not None:
+            return output + self.bias
+        else:
+            return output
+
+    def __repr__(self):
+        return self.__class__.__name__ + ' (' \
+               + str(self.num_models) + ' x ' \
+               + str(self.in_features) + ' -> ' \
+               + str(self.out_features) + ')'
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+节点迁移分析：社区分配保存为 (窗口, 节点) 的int8数组，迁移矩阵、迁移路径、停留时长和top/bottom划分都由NumPy向量化计算。
+
+    mig = Migration.from_paths('Node migration path/migration_paths.json')
+    mig = Migration.from_assignments('community assignments')        # community_assignments_<窗口>.xlsx/.csv
+    T = mig.transitions()                    # (K, K) 迁移次数，T[a, b] 为相邻窗口 a -> b 的次数
+    P = mig.transition_frame(top)            # 行归一化的迁移矩阵，行列为社区字母 A, B, ...
+    paths = mig.paths()                      # {股票代码: '0033...'}，与migration_paths.json格式相同
+    runs = mig.dwell_times()                 # 每段连续停留 (节点, 社区, 起始窗口, 长度)
+    top, bottom = mig.split(scores, 50)      # 按得分取前/后50个节点
+    mig.save('migration.npz')                # int8数组 + 股票代码 + 窗口标签（np.savez_compressed）
+
+标签-1表示该节点在该窗口中不存在，不计入迁移和停留。
+
+    python migration.py --paths "../Node migration path/migration_paths.json" --output migration_out
+    python migration.py --assignments "../community assignments" --returns_store ../returns_store --top 50
+"""
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from returns_store import window_files
+
+ALPHABET = np.frombuffer(b'0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ', dtype=np.uint8)
+
+
+def community_names(k):
+    """社区的字母名称 A, B, C, ...（迁移矩阵的行列标签）"""
+    return [chr(ord('A') + i) for i in range(k)]
+
+
+def read_assignment_table(path):
+    # 宽表：每列一个社区，列中为股票代码
+    df = pd.read_csv(path, dtype=str) if path.endswith('.csv') else pd.read_excel(path, dtype=str)
+    return {str(code): int(community) for community in df.columns for code in df[community].dropna()}
+
+
+class Migration(object):
+    """(窗口, 节点) int8 社区分配及其迁移统计"""
+
+    def __init__(self, labels, codes, windows=None):
+        labels = np.asarray(labels)
+        if labels.ndim != 2 or labels.shape[1] != len(codes):
+            raise ValueError(f"labels must be (windows, {len(codes)}), got {labels.shape}")
+        if labels.max(initial=-1) > np.iinfo(np.int8).max:
+            raise ValueError("community labels must fit in int8")
+        self.labels = labels.astype(np.int8)
+        self.codes = [str(c) for c in codes]
+        self.windows = list(windows) if windows is not None else [str(w) for w in range(labels.shape[0])]
+        self.k = int(self.labels.max(initial=-1)) + 1
+
+    def __repr__(self):
+        return f"Migration(windows={self.labels.shape[0]}, nodes={self.labels.shape[1]}, communities={self.k})"
+
+    # ---------------------------------------------------------------- 构造与序列化
+    @classmethod
+    def from_partitions(cls, partitions, windows=None):
+        """{窗口: {股票代码: 社区}}（如community_assignments_dict），缺失的节点为-1"""
+        windows = list(partitions) if windows is None else list(windows)
+        position = {}
+        for window in windows:
+            for code in partitions[window]:
+                position.setdefault(str(code)[:6], len(position))
+        labels = np.full((len(windows), len(position)), -1, dtype=np.int8)
+        for w, window in enumerate(windows):
+            assignments = partitions[window]
+            nodes = np.fromiter((position[str(code)[:6]] for code in assignments), dtype=np.int64, count=len(assignments))
+            labels[w, nodes] = np.fromiter(assignments.values(), dtype=np.int8, count=len(assignments))
+        return cls(labels, list(position), windows)
+
+    @classmethod
+    def from_assignments(cls, folder, ext=None):
+        """读取 community_assignments_<窗口>.xlsx（或.csv）文件夹"""
+        if ext is None:
+            ext = '.csv' if window_files(folder, '.csv') else '.xlsx'
+        files = window_files(folder, ext)
+        if not files:
+            raise FileNotFoundError(f"no community_assignments_*{ext} files in {folder}")
+        return cls.from_partitions({label: read_assignment_table(path) for label, path in files})
+
+    @classmethod
+    def from_paths(cls, path_or_dict, windows=None):
+        """migration_paths.json格式：{股票代码: 每个窗口一个字符的社区编号串}"""
+        if not isinstance(path_or_dict, dict):
+            with open(path_or_dict, encoding='utf-8') as f:
+                path_or_dict = json.load(f)
+        codes = list(path_or_dict)
+        chars = np.frombuffer(''.join(path_or_dict[c] for c in codes).encode('ascii'), dtype=np.uint8)
+        lookup = np.full(256, -1, dtype=np.int8)
+        lookup[ALPHABET] = np.arange(len(ALPHABET))
+        labels = lookup[chars].reshape(len(codes), -1).T
+        return cls(labels, codes, windows)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['labels'], data['codes'].tolist(), data['windows'].tolist())
+
+    def save(self, path):
+        np.savez_compressed(path, labels=self.labels, codes=np.array(self.codes), windows=np.array(self.windows))
+
+    def paths(self):
+        """{股票代码: 社区编号串}；窗口中不存在的节点记为 '-'"""
+        chars = np.where(self.labels.T >= 0, ALPHABET[np.maximum(self.labels.T, 0)], ord('-')).astype(np.uint8)
+        text = chars.tobytes().decode('ascii')
+        width = self.labels.shape[0]
+        return {code: text[i * width:(i + 1) * width] for i, code in enumerate(self.codes)}
+
+    # ---------------------------------------------------------------- 统计
+    def _nodes(self, nodes):
+        if nodes is None:
+            return slice(None)
+        if len(nodes) and isinstance(nodes[0], str):
+            position = {code: i for i, code in enumerate(self.codes)}
+            return np.array([position[code] for code in nodes], dtype=np.int64)
+        return np.asarray(nodes)
+
+    def transitions(self, nodes=None, lag=1, per_window=False):
+        """
+        相邻(间隔lag个)窗口之间的迁移次数 (K, K)，对角线为留在原社区的次数；
+        per_window=True时返回每一对窗口各自的矩阵 (窗口数-lag, K, K)
+        """
+        labels = self.labels[:, self._nodes(nodes)].astype(np.int64)
+        src, dst = labels[:-lag], labels[lag:]
+        valid = (src >= 0) & (dst >= 0)
+        k = self.k
+        index = src * k + dst
+        if per_window:
+            index = index + (np.arange(src.shape[0])[:, None] * k * k)
+            return np.bincount(index[valid], minlength=src.shape[0] * k * k).reshape(-1, k, k)
+        return np.bincount(index[valid], minlength=k * k).reshape(k, k)
+
+    def transition_frame(self, nodes=None, normalize=True, name=None):
+        """迁移矩阵的DataFrame（与 Node migration matrix_top.xlsx 相同的布局），normalize时按行归一化"""
+        T = self.transitions(nodes).astype(np.float64)
+        if normalize:
+            T = T / np.maximum(T.sum(axis=1, keepdims=True), 1)
+        names = community_names(self.k)
+        df = pd.DataFrame(T, index=pd.Index(names, name=name), columns=names)
+        return df
+
+    def changes(self):
+        """每个节点在相邻窗口之间是否换了社区 (窗口数-1, 节点)"""
+        src, dst = self.labels[:-1], self.labels[1:]
+        return (src >= 0) & (dst >= 0) & (src != dst)
+
+    def mobility(self):
+        """每个节点的换社区次数"""
+        return self.changes().sum(axis=0)
+
+    def change_table(self):
+        """community_changes 的 'a->b' 字符串表（第二个窗口起，行=窗口，列=股票代码），不变的节点为 'b'"""
+        src, dst = self.labels[:-1], self.labels[1:]
+        text = dst.astype(str)
+        moved = (src >= 0) & (dst >= 0) & (src != dst)
+        text = np.where(moved, np.char.add(np.char.add(src.astype(str), '->'), text), text)
+        text = np.where(dst >= 0, text, None)
+        df = pd.DataFrame(text, index=pd.Index(self.windows[1:], name='Time Window'), columns=self.codes)
+        return df
+
+    def dwell_times(self):
+        """
+        每段连续停留：DataFrame(node, community, start, length)，start为起始窗口编号。
+        一段停留在节点换社区、节点缺失或序列结束处结束
+        """
+        L = self.labels.T.astype(np.int64)
+        n, w = L.shape
+        # boundary[i, j]：第j个窗口开始一段新的停留（j=w处为结束哨兵）
+        boundary = np.ones((n, w + 1), dtype=bool)
+        boundary[:, 1:w] = L[:, 1:] != L[:, :-1]
+        rows, cols = np.nonzero(boundary)
+        same_row = rows[1:] == rows[:-1]
+        starts, lengths, nodes = cols[:-1][same_row], np.diff(cols)[same_row], rows[:-1][same_row]
+        communities = L[nodes, starts]
+        keep = communities >= 0
+        return pd.DataFrame({'node': np.array(self.codes, dtype=object)[nodes[keep]], 'community': communities[keep],
+                             'start': starts[keep], 'length': lengths[keep]})
+
+    def dwell_summary(self, runs=None):
+        """每个社区的停留段数、平均和最长停留窗口数"""
+        runs = self.dwell_times() if runs is None else runs
+        summary = runs.groupby('community')['length'].agg(['count', 'mean', 'max'])
+        summary.index = [community_names(self.k)[c] for c in summary.index]
+        return summary
+
+    def occupancy(self):
+        """每个窗口各社区的节点数 (窗口, K)"""
+        labels = self.labels.astype(np.int64)
+        valid = labels >= 0
+        index = np.arange(labels.shape[0])[:, None] * self.k + labels
+        return np.bincount(index[valid], minlength=labels.shape[0] * self.k).reshape(-1, self.k)
+
+    def split(self, scores, n=50):
+        """按得分（数组或{股票代码: 得分}）取得分最高和最低的n个节点编号；没有得分的节点不参与"""
+        if isinstance(scores, dict):
+            scores = np.array([scores.get(code, np.nan) for code in self.codes], dtype=np.float64)
+        scores = np.asarray(scores, dtype=np.float64)
+        valid = np.flatnonzero(~np.isnan(scores))
+        order = valid[np.argsort(-scores[valid], kind='stable')]
+        return order[:n], order[::-1][:n]
+
+
+def add_source_args(parser):
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--paths', type=str, help='migration_paths.json to read the community histories from.')
+    source.add_argument('--assignments', type=str, help='Folder of community_assignments_<window>.xlsx/.csv files.')
+    source.add_argument('--npz', type=str, help='migration.npz written by an earlier run.')
+    return parser
+
+
+def load_migration(args):
+    if args.paths:
+        return Migration.from_paths(args.paths)
+    if args.assignments:
+        return Migration.from_assignments(args.assignments)
+    return Migration.load(args.npz)
+
+
+def return_scores(store_dir, dataset='log_returns'):
+    """ReturnsStore中每只股票全部窗口的累计对数收益率，键为6位股票代码"""
+    from returns_store import ReturnsStore
+    store = ReturnsStore(store_dir)
+    total = np.nansum(np.asarray(store.arrays[dataset]), axis=1)
+    return {ticker[:6]: float(value) for ticker, value in zip(store.tickers, total)}
+
+
+def load_scores(mig, scores_path=None, returns_store=None, mobility=False):
+    """top/bottom划分的得分：{股票代码: 得分} JSON、累计对数收益率或换社区次数，都未给出时返回None"""
+    if scores_path:
+        with open(scores_path, encoding='utf-8') as f:
+            return {str(code)[:6]: float(value) for code, value in json.load(f).items()}
+    if returns_store:
+        return return_scores(returns_store)
+    if mobility:
+        return mig.mobility()
+    return None
+
+
+def add_split_args(parser):
+    parser.add_argument('--scores', type=str, default=None, help='JSON {ticker: score} used for the top/bottom split.')
+    parser.add_argument('--returns_store', type=str, default=None, help='Split by cumulative log return from a returns_store.py store.')
+    parser.add_argument('--split_by_mobility', action='store_true', help='Split by the number of community changes.')
+    parser.add_argument('--top', type=int, default=50, help='Nodes in each of the top and bottom groups.')
+    return parser
+
+
+def write_report(mig, output_folder, scores=None, n=50):
+    """写出 migration.npz、migration_paths.json、全部/top/bottom迁移矩阵和停留时长"""
+    os.makedirs(output_folder, exist_ok=True)
+    mig.save(os.path.join(output_folder, 'migration.npz'))
+    with open(os.path.join(output_folder, 'migration_paths.json'), 'w', encoding='utf-8') as f:
+        json.dump(mig.paths(), f, ensure_ascii=False, indent=4)
+    frames = {'all': mig.transition_frame(name='all')}
+    if scores is not None:
+        top, bottom = mig.split(scores, n)
+        frames['top'] = mig.transition_frame(top, name='top')
+        frames['bottom'] = mig.transition_frame(bottom, name='bottom')
+    for name, df in frames.items():
+        df.reset_index().to_excel(os.path.join(output_folder, f'Node migration matrix_{name}.xlsx'), index=False)
+    runs = mig.dwell_times()
+    runs.to_csv(os.path.join(output_folder, 'dwell_times.csv'), index=False, encoding='utf-8-sig')
+    return frames, mig.dwell_summary(runs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    add_source_args(parser)
+    parser.add_argument('--output', type=str, default='migration_out', help='Output folder.')
+    add_split_args(parser)
+    args = parser.parse_args()
+
+    mig = load_migration(args)
+    print(mig)
+
+    scores = load_scores(mig, args.scores, args.returns_store, args.split_by_mobility)
+    frames, summary = write_report(mig, args.output, scores, args.top)
+    for name, df in frames.items():
+        print(f"\n{name}:\n{df.round(4)}")
+    print(f"\ndwell times (windows):\n{summary.round(2)}")
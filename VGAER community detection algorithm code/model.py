@@ -3,7 +3,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 from dgl.nn.pytorch import GraphConv
 
-from layer import GraphConvolution
+from layer import GraphConvolution, BatchedGraphConvolution
 
 class GAER(nn.Module):
     def __init__(self,  input_feat_dim, hidden_dim1, hidden_dim2, dropout):
@@ -77,7 +77,120 @@ class VGAERModel(nn.Module):
         adj_rec = torch.sigmoid(torch.matmul(z, z.t()))#解码器点乘还原邻接矩阵A'
         return adj_rec
 
+    def decoder_edges(self, z, rows, cols):
+        # 只还原给定节点对(rows[i], cols[i])的连边概率，避免构造N×N矩阵
+        return torch.sigmoid((z[rows] * z[cols]).sum(1))
+
     def forward(self,a_hat, features ):#前向传播
         z = self.encoder(a_hat,features )#编码器得到隐变量
         adj_rec = self.decoder(z)#解码器还原邻接矩阵
         return adj_rec,z
+
+
+#VGAERModel的优化版本：参数与VGAERModel相同（state_dict可以互相加载），但
+#  - 噪声缓冲区预先分配（给出num_nodes时在构造时分配），每个epoch原地normal_()，不再重新分配并.to(device)
+#  - mean和log_std作为forward的返回值，不保存为模型属性，便于torch.compile把前向和损失编译为一个图
+class FusedVGAERModel(nn.Module):
+    def __init__(self, in_dim, hidden1_dim, hidden2_dim, device=None, num_nodes=None):
+        super(FusedVGAERModel, self).__init__()
+        self.in_dim = in_dim
+        self.hidden1_dim = hidden1_dim
+        self.hidden2_dim = hidden2_dim
+
+        layers = [GraphConvolution(self.in_dim, self.hidden1_dim, act=F.tanh),
+                  GraphConvolution(self.hidden1_dim, self.hidden2_dim, act=lambda x: x),
+                  GraphConvolution(self.hidden1_dim, self.hidden2_dim, act=lambda x: x)]
+        self.layers = nn.ModuleList(layers)
+        self.device = device
+        self.register_buffer('noise', torch.empty(0 if num_nodes is None else num_nodes, hidden2_dim, device=device),
+                             persistent=False)
+
+    def encoder(self, a_hat, features):
+        h = self.layers[0](a_hat, features)
+        mean = self.layers[1](a_hat, h)
+        log_std = self.layers[2](a_hat, h)
+        if self.noise.shape != mean.shape:
+            self.noise = torch.empty_like(mean)
+        sampled_z = mean + self.noise.normal_() * torch.exp(log_std)
+        return sampled_z, mean, log_std
+
+    def decoder(self, z):
+        adj_rec = torch.sigmoid(torch.matmul(z, z.t()))
+        return adj_rec
+
+    def forward(self, a_hat, features):
+        z, mean, log_std = self.encoder(a_hat, features)
+        adj_rec = self.decoder(z)
+        return adj_rec, z, mean, log_std
+
+
+def kl_divergence(mean, log_std):
+    """VGAER损失中的KL项，与训练脚本中的写法相同"""
+    return 0.5 / mean.size(0) * (1 + 2 * log_std - mean ** 2 - torch.exp(log_std) ** 2).sum(1).mean()
+
+
+def vgaer_loss(adj_rec, target, weight_tensor, norm, mean, log_std):
+    """与划分算法.py稠密模式相同的损失：加权BCE减去KL项，始终在float32下计算"""
+    logits = torch.sigmoid(adj_rec.float())  # 应用Sigmoid激活函数
+    loss = norm * F.binary_cross_entropy(logits.view(-1), target.view(-1), weight=weight_tensor)
+    return loss - kl_divergence(mean.float(), log_std.float())
+
+
+def vgaer_step(vgaer_model, a_hat, features, target, weight_tensor, norm, dtype=None):
+    """FusedVGAERModel的一次前向和损失，返回 (loss, z)；dtype不为None时前向在该精度下autocast"""
+    with torch.autocast(a_hat.device.type, dtype=torch.bfloat16 if dtype is None else dtype, enabled=dtype is not None):
+        adj_rec, z, mean, log_std = vgaer_model(a_hat, features)
+    return vgaer_loss(adj_rec, target, weight_tensor, norm, mean, log_std), z.float()
+
+
+_compiled_steps = {}
+
+
+def loss_step(compile=False, mode=None):
+    """
+    返回vgaer_step；compile=True时用torch.compile把前向和损失（及其反向）编译为融合的kernel图，
+    mode='reduce-overhead'在CUDA上还会用CUDA graph捕获整个图。模型作为参数传入，
+    同样形状的新窗口模型不会触发重新编译；norm应以张量传入，避免每个窗口按新的常数重新编译。
+    torch版本不支持时退回eager执行。稀疏A_hat和ModularityFeatures会导致graph break，编译只对稠密模式有效
+    """
+    if not compile:
+        return vgaer_step
+    if not hasattr(torch, 'compile'):
+        print('torch.compile is not available, running the model eagerly')
+        return vgaer_step
+    if mode not in _compiled_steps:
+        _compiled_steps[mode] = torch.compile(vgaer_step, mode=mode, dynamic=False)
+    return _compiled_steps[mode]
+
+
+#多个时间窗口（或多个随机种子）的VGAE堆叠为一个模型，参数互不共享
+class BatchedVGAERModel(nn.Module):
+    def __init__(self, num_models, in_dim, hidden1_dim, hidden2_dim, device):
+        super(BatchedVGAERModel, self).__init__()
+        self.num_models = num_models
+        self.in_dim = in_dim
+        self.hidden1_dim = hidden1_dim
+        self.hidden2_dim = hidden2_dim
+
+        layers = [BatchedGraphConvolution(num_models, self.in_dim, self.hidden1_dim, act=F.tanh),
+                  BatchedGraphConvolution(num_models, self.hidden1_dim, self.hidden2_dim, act=lambda x: x),
+                  BatchedGraphConvolution(num_models, self.hidden1_dim, self.hidden2_dim, act=lambda x: x)]
+        self.layers = nn.ModuleList(layers)
+        self.device = device
+
+    def encoder(self, a_hat, features):
+        h = self.layers[0](a_hat, features)
+        self.mean = self.layers[1](a_hat, h)
+        self.log_std = self.layers[2](a_hat, h)
+        gaussian_noise = torch.randn(self.mean.shape, device=self.mean.device)
+        sampled_z = self.mean + gaussian_noise * torch.exp(self.log_std)
+        return sampled_z
+
+    def decoder(self, z):
+        adj_rec = torch.sigmoid(torch.bmm(z, z.transpose(1, 2)))#每个窗口各自还原邻接矩阵，(S, N, N)
+        return adj_rec
+
+    def forward(self, a_hat, features):
+        z = self.encoder(a_hat, features)
+        adj_rec = self.decoder(z)
+        return adj_rec, z
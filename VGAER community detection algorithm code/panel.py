@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+面板回归数据（Panel Data Regression/*.json）的向量化构造。
+
+从收益率缓存（returns_store.py）和 (窗口, 节点) 社区分配数组（migration.Migration）一次得到所有窗口、所有社区的长表：
+    Time Window  窗口编号 01, 02, ...（与原JSON的键相同）
+    Community    社区编号
+    size         社区节点数
+    rates        平均收益率：窗口第一个交易日收盘价 / 上一窗口第一个交易日收盘价 - 1，按该窗口的社区取均值
+    std          平均收益率标准差：同一收益率在社区内的总体标准差
+    turnover     平均换手率：每只股票窗口内日换手率的均值（缓存中的turnover数据集或 --turnover 表），按社区取均值
+    beta         平均BETA值：每只股票窗口内对数收益率对市场（等权平均或 --market 指定的股票）的回归系数，
+                 或 --beta 表给出的每只股票每个窗口的BETA，按社区取均值
+    attractiveness 社区吸引力：(本窗口节点数 - 上一窗口节点数) / 上一窗口节点数，即 (流入 - 流出) / 上一窗口节点数
+每只股票的窗口值为 (节点, 窗口) 数组，按社区的均值和标准差由一次np.bincount分组求和得到，缺失值（NaN）不计入。
+rates、std、attractiveness与仓库中的JSON完全一致；原始BETA和换手率来自行情数据，不在仓库中，需要用 --beta/--turnover 提供。
+
+    python panel.py --paths "../Node migration path/migration_paths.json" --returns_store ../returns_store \
+        --beta beta.csv --turnover turnover.csv --output panel_out --legacy_json
+"""
+import os
+import re
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from migration import add_source_args, load_migration
+from export import require_parquet, write_table
+
+METRICS = ('rates', 'std', 'turnover', 'beta', 'attractiveness')
+# 原JSON文件中的指标名称和文件名
+LEGACY_NAMES = {'rates': '平均收益率', 'std': '平均收益率标准差', 'turnover': '平均换手率', 'beta': '平均BETA值',
+                'attractiveness': '社区吸引力'}
+LEGACY_FILES = {'rates': 'community_yield_rates.json', 'std': 'community_yield_std.json',
+                'turnover': 'community_yield_turnoverrate.json', 'beta': 'community_yield_beta.json',
+                'attractiveness': 'community_attractiveness.json'}
+PANEL_FORMATS = ('csv', 'xlsx', 'parquet')
+
+
+def window_key(i):
+    return f'{i + 1:02d}'
+
+
+def store_rows(store, codes):
+    """股票代码在收益率缓存中的行号，按6位代码匹配，缓存中没有的为-1"""
+    lookup = {ticker[:6]: i for i, ticker in enumerate(store.tickers)}
+    return np.array([lookup.get(str(code)[:6], -1) for code in codes], dtype=np.int64)
+
+
+def take_rows(data, rows):
+    """data的第rows行，行号为-1时为NaN"""
+    out = np.asarray(data, dtype=np.float64)[np.maximum(rows, 0)]
+    out[rows < 0] = np.nan
+    return out
+
+
+def window_bounds(store, dataset):
+    windows = store.windows[dataset]
+    return (np.array([w['start'] for w in windows], dtype=np.int64),
+            np.array([w['end'] for w in windows], dtype=np.int64))
+
+
+def window_sums(values, starts):
+    """(股票, 交易日) 中每个窗口的非NaN值之和与个数，窗口在交易日上连续排列"""
+    valid = ~np.isnan(values)
+    return (np.add.reduceat(np.where(valid, values, 0.), starts, axis=1),
+            np.add.reduceat(valid.astype(np.float64), starts, axis=1))
+
+
+def window_returns(store, rows, dataset='close'):
+    """(节点, 窗口) 收益率：窗口第一个交易日收盘价 / 上一窗口第一个交易日收盘价 - 1，第一个窗口为NaN"""
+    starts, _ = window_bounds(store, dataset)
+    first = take_rows(store.arrays[dataset][:, starts], rows)
+    returns = np.full(first.shape, np.nan)
+    returns[:, 1:] = first[:, 1:] / first[:, :-1] - 1
+    return returns
+
+
+def window_mean(store, rows, dataset):
+    """(节点, 窗口) 窗口内日数据的均值"""
+    starts, _ = window_bounds(store, dataset)
+    total, count = window_sums(take_rows(store.arrays[dataset], rows), starts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return total / count
+
+
+def window_beta(store, rows, dataset='log_returns', market=None):
+    """
+    (节点, 窗口) BETA：窗口内日对数收益率对市场收益率的最小二乘斜率 cov(r, m) / var(m)，
+    只使用股票和市场都有数据的交易日。market为None时市场收益率为缓存中所有股票的等权平均，否则为该股票代码的收益率
+    """
+    starts, _ = window_bounds(store, dataset)
+    data = np.asarray(store.arrays[dataset], dtype=np.float64)
+    if market is None:
+        with np.errstate(invalid='ignore'):
+            m = np.nanmean(data, axis=0)
+    else:
+        row = store_rows(store, [market])[0]
+        if row < 0:
+            raise ValueError(f"market ticker {market!r} is not in the returns store")
+        m = data[row]
+    r = take_rows(data, rows)
+    valid = ~np.isnan(r) & ~np.isnan(m)
+    r, mm = np.where(valid, r, 0.), np.where(valid, m, 0.)
+    n, sr, sm, srm, smm = (np.add.reduceat(x, starts, axis=1)
+                           for x in (valid.astype(np.float64), r, mm, r * mm, mm * mm))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (srm - sr * sm / n) / (smm - sm * sm / n)
+
+
+def read_stock_table(path, codes, n_windows):
+    """
+    每只股票每个窗口的值（如BETA、换手率）-> (节点, 窗口) 数组。
+    csv/xlsx为宽表：第一列为窗口（01、2014-01-02_01 等，取末尾的数字为窗口编号），其余每列一只股票；
+    json为 {窗口: {股票代码: 值}}
+    """
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            df = pd.DataFrame.from_dict(json.load(f), orient='index')
+    elif path.endswith('.csv'):
+        df = pd.read_csv(path, index_col=0)
+    else:
+        df = pd.read_excel(path, index_col=0)
+    windows = [int(re.search(r'(\d+)$', str(w)).group(1)) - 1 for w in df.index]
+    columns = {str(c)[:6]: i for i, c in enumerate(df.columns)}
+    values = df.to_numpy(dtype=np.float64)
+    out = np.full((len(codes), n_windows), np.nan)
+    nodes = np.array([i for i, code in enumerate(codes) if str(code)[:6] in columns], dtype=np.int64)
+    cols = np.array([columns[str(codes[i])[:6]] for i in nodes], dtype=np.int64)
+    for row, w in enumerate(windows):
+        if 0 <= w < n_windows:
+            out[nodes, w] = values[row, cols]
+    return out
+
+
+def grouped_stats(values, labels, k):
+    """
+    按社区分组的均值、总体标准差和节点数，values为 (节点, 窗口)，labels为 (窗口, 节点)；
+    所有窗口、所有社区一次bincount，返回三个 (窗口, 社区) 数组，NaN和标签为-1的节点不计入
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64).T
+    valid = (labels >= 0) & ~np.isnan(values)
+    index = (np.arange(labels.shape[0])[:, None] * k + labels)[valid]
+    size = labels.shape[0] * k
+    count = np.bincount(index, minlength=size).reshape(-1, k)
+    total = np.bincount(index, values[valid], minlength=size).reshape(-1, k)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        # 第二遍对离差平方求和，避免 E[x^2] - E[x]^2 的精度损失
+        deviation = values - mean[np.arange(labels.shape[0])[:, None], np.maximum(labels, 0)]
+        var = np.bincount(index, deviation[valid] ** 2, minlength=size).reshape(-1, k) / count
+    return mean, np.sqrt(var), count
+
+
+def attractiveness(occupancy):
+    """(窗口, 社区) 社区吸引力，第一个窗口为NaN"""
+    occupancy = np.asarray(occupancy, dtype=np.float64)
+    out = np.full(occupancy.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[1:] = (occupancy[1:] - occupancy[:-1]) / occupancy[:-1]
+    return out
+
+
+def community_panel(mig, store, beta=None, turnover=None, market=None):
+    """
+    面板长表，每个 (窗口, 社区) 一行。beta/turnover为 (节点, 窗口) 数组时直接使用，
+    为None时BETA由对数收益率计算，换手率取缓存中的turnover数据集（没有时为NaN）
+    """
+    n_windows = mig.labels.shape[0]
+    rows = store_rows(store, mig.codes)
+    returns = window_returns(store, rows)
+    if returns.shape[1] != n_windows:
+        raise ValueError(f"returns store has {returns.shape[1]} windows, community assignments have {n_windows}")
+    if beta is None:
+        beta = window_beta(store, rows, market=market)
+    if turnover is None:
+        turnover = (window_mean(store, rows, 'turnover') if 'turnover' in store.arrays
+                    else np.full(returns.shape, np.nan))
+
+    k = mig.k
+    rates, std, _ = grouped_stats(returns, mig.labels, k)
+    columns = {'size': mig.occupancy(), 'rates': rates, 'std': std,
+               'turnover': grouped_stats(turnover, mig.labels, k)[0],
+               'beta': grouped_stats(beta, mig.labels, k)[0],
+               'attractiveness': attractiveness(mig.occupancy())}
+    df = pd.DataFrame({'Time Window': np.repeat([window_key(w) for w in range(n_windows)], k),
+                       'Community': np.tile(np.arange(k), n_windows)})
+    for name, values in columns.items():
+        df[name] = values.ravel()
+    return df
+
+
+def to_nested(df, metrics, names=None):
+    """
+    长表 -> {窗口: {社区: 值}}（一个指标）或 {窗口: {社区: {名称: 值}}}（多个指标）；
+    NaN不输出，所有指标都为NaN的 (窗口, 社区) 整个不输出
+    """
+    single = isinstance(metrics, str)
+    metrics = [metrics] if single else list(metrics)
+    names = metrics if names is None else [names.get(m, m) for m in metrics]
+    df = df.dropna(subset=metrics, how='all')
+    nested = {}
+    for window, community, *values in df[['Time Window', 'Community'] + metrics].itertuples(index=False):
+        if single:
+            value = values[0]
+        else:
+            value = {name: v for name, v in zip(names, values) if not np.isnan(v)}
+        nested.setdefault(window, {})[str(community)] = value
+    return nested
+
+
+def write_legacy_json(df, output_folder):
+    """写出与 Panel Data Regression 中相同结构的JSON文件"""
+    written = {}
+    for metric, name in LEGACY_FILES.items():
+        written[metric] = os.path.join(output_folder, name)
+        nested = to_nested(df, metric)
+        with open(written[metric], 'w', encoding='utf-8') as f:
+            json.dump(nested, f, ensure_ascii=False, indent=4)
+    merged = {'merged_community_data.json': (METRICS[:4], LEGACY_NAMES),
+              'merged_community_data_with_attractiveness.json': (METRICS, LEGACY_NAMES),
+              'panel_data.json': (METRICS, None)}
+    for name, (metrics, names) in merged.items():
+        written[name] = os.path.join(output_folder, name)
+        # 与原文件一致从第二个窗口（有收益率的窗口）开始
+        nested = to_nested(df.dropna(subset=['rates']), metrics, names)
+        with open(written[name], 'w', encoding='utf-8') as f:
+            json.dump(nested, f, ensure_ascii=False, indent=2)
+    return written
+
+
+if __name__ == '__main__':
+    from returns_store import ReturnsStore, ROOT
+
+    parser = argparse.ArgumentParser()
+    add_source_args(parser)
+    parser.add_argument('--returns_store', type=str, default=os.path.join(ROOT, 'returns_store'),
+                        help='Store built by returns_store.py (close and log_returns).')
+    parser.add_argument('--beta', type=str, default=None, help='Per-stock beta per window (csv/xlsx/json); computed from log returns if omitted.')
+    parser.add_argument('--market', type=str, default=None, help='Ticker used as the market for computed betas (default: equal-weighted universe).')
+    parser.add_argument('--turnover', type=str, default=None, help='Per-stock turnover per window (csv/xlsx/json); taken from the store if omitted.')
+    parser.add_argument('--format', type=str, default='csv', choices=PANEL_FORMATS, help='Format of the panel table.')
+    parser.add_argument('--legacy_json', action='store_true', help='Also write the nested JSON files of Panel Data Regression.')
+    parser.add_argument('--output', type=str, default='panel_out', help='Output folder.')
+    args = parser.parse_args()
+    if args.format == 'parquet':
+        require_parquet()
+
+    mig = load_migration(args)
+    store = ReturnsStore(args.returns_store)
+    n_windows = mig.labels.shape[0]
+    beta = read_stock_table(args.beta, mig.codes, n_windows) if args.beta else None
+    turnover = read_stock_table(args.turnover, mig.codes, n_windows) if args.turnover else None
+    df = community_panel(mig, store, beta, turnover, args.market)
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f'panel.{args.format}')
+    write_table(df, path, args.format)
+    print(f"{len(df)} rows ({n_windows} windows x {mig.k} communities) -> {path}")
+    if df['turnover'].isna().all():
+        print("No turnover data: pass --turnover or add a 'turnover' dataset to the returns store")
+    if args.legacy_json:
+        write_legacy_json(df, args.output)
+        print(f"Legacy JSON files have been saved to {args.output}")
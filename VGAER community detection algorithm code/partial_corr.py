@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+由对数收益率窗口构建偏相关网络。
+
+对每个窗口计算协方差（可选Ledoit-Wolf收缩），所有窗口的协方差矩阵堆叠为 (W, N, N)，
+通过一次批量的 np.linalg.inv（无收缩时为伪逆 np.linalg.pinv，窗口交易日数少于股票数时样本协方差不可逆）
+得到精度矩阵，偏相关 rho_ij = -P_ij / sqrt(P_ii P_jj)。
+再按P值阈值保留显著的边，输出与仓库中相同格式的文件：
+    Partial corr matrix/partial_corr_<窗口>.xlsx
+    P Threshold value networks/csv/partial_corr_<窗口>.csv
+    P Threshold value networks/gml/partial_corr_<窗口>.gml
+
+所有窗口的t统计量和P值一次向量化计算；每个窗口的上三角边按P值排序一次（edge_ranking），
+任一阈值下的网络都是排序后边数组的前缀。给出多个阈值时每个阈值写入 P Threshold value networks/p<alpha>/，
+并在 P Threshold value networks/ranked/ 下保存带P值的排序边列表，之后换阈值只需 ranked_prefix 截取：
+
+    python partial_corr.py --alpha 0.01 --output_root ./rebuilt_networks
+    python partial_corr.py --alpha 0.001 0.005 0.01 0.05
+"""
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+import networkx as nx
+from scipy import stats
+
+from returns_store import ROOT, DATASETS, window_files, ReturnsStore
+
+
+def load_windows(store=None, folder=DATASETS['log_returns']):
+    """返回 [(窗口标签, 文件名主干, 股票列表, X)]，X为 (交易日, 股票)"""
+    windows = []
+    if store is not None:
+        store = ReturnsStore(store) if isinstance(store, str) else store
+        for i, label in enumerate(store.labels()):
+            X = np.asarray(store.window(i)).T
+            windows.append((label, f"log_returns_window_{label.rsplit('_', 1)[0]}_{int(label.rsplit('_', 1)[1])}",
+                            store.tickers, X))
+        return windows
+    for label, path in window_files(folder):
+        df = pd.read_excel(path)
+        windows.append((label, os.path.splitext(os.path.basename(path))[0], [str(c) for c in df.columns],
+                        df.to_numpy(dtype=float)))
+    return windows
+
+
+def ledoit_wolf(X):
+    """Ledoit-Wolf收缩协方差（与sklearn.covariance.ledoit_wolf相同），返回 (协方差, 收缩系数)"""
+    n, p = X.shape
+    X = X - X.mean(axis=0)
+    emp_cov = X.T @ X / n
+    X2 = X ** 2
+    emp_cov_trace = X2.sum(axis=0) / n
+    mu = emp_cov_trace.sum() / p
+    beta_ = np.sum(X2.T @ X2)
+    delta_ = np.sum(emp_cov ** 2)
+    beta = 1. / (p * n) * (beta_ / n - delta_)
+    delta = (delta_ - 2. * mu * emp_cov_trace.sum() + p * mu ** 2) / p
+    beta = min(beta, delta)
+    shrinkage = 0. if beta == 0 else beta / delta
+    cov = (1. - shrinkage) * emp_cov
+    cov.flat[::p + 1] += shrinkage * mu
+    return cov, shrinkage
+
+
+def covariances(Xs, shrinkage=None):
+    """
+    每个窗口的协方差矩阵，堆叠为 (W, N, N)。
+    shrinkage: 'ledoit_wolf'、None（样本协方差）或 [0, 1] 之间的固定收缩系数
+    """
+    covs = []
+    for X in Xs:
+        if np.isnan(X).any():
+            raise ValueError("log-return windows must not contain NaN")
+        if shrinkage == 'ledoit_wolf':
+            cov, _ = ledoit_wolf(X)
+        else:
+            Xc = X - X.mean(axis=0)
+            cov = Xc.T @ Xc / X.shape[0]
+            if shrinkage:
+                mu = np.trace(cov) / cov.shape[0]
+                cov = (1. - shrinkage) * cov
+                cov.flat[::cov.shape[0] + 1] += shrinkage * mu
+        covs.append(cov)
+    return np.stack(covs)
+
+
+def partial_correlation(covs, pseudo_inverse=False):
+    """(W, N, N) 协方差 -> (W, N, N) 偏相关矩阵（对角线为0），所有窗口一次批量求逆"""
+    precision = np.linalg.pinv(covs, hermitian=True) if pseudo_inverse else np.linalg.inv(covs)
+    d = np.sqrt(np.diagonal(precision, axis1=-2, axis2=-1))
+    pcorr = -precision / (d[..., :, np.newaxis] * d[..., np.newaxis, :])
+    idx = np.arange(pcorr.shape[-1])
+    pcorr[..., idx, idx] = 0.
+    return pcorr
+
+
+def t_statistics(pcorr, n_obs, n_controls=0):
+    """
+    偏相关系数的t统计量 |r| sqrt(df / (1 - r^2))，df = n_obs - 2 - n_controls。
+    pcorr可以是单个窗口 (N, N) 或堆叠的 (W, N, N)，此时n_obs可以是每个窗口的交易日数 (W,)。
+    返回 (t, df)，df已整形为可与t广播的形状
+    """
+    df = np.asarray(n_obs, dtype=float) - 2 - n_controls
+    if np.any(df <= 0):
+        raise ValueError(f"not enough observations ({n_obs}) for {n_controls} control variables")
+    df = df.reshape(df.shape + (1, 1)) if df.ndim else df
+    r2 = np.clip(pcorr ** 2, 0., 1. - 1e-12)
+    return np.abs(pcorr) * np.sqrt(df / (1. - r2)), df
+
+
+def p_values(pcorr, n_obs, n_controls=0):
+    """
+    偏相关系数的双侧t检验P值，df = n_obs - 2 - n_controls。
+    仓库中的网络按相关系数的检验（n_controls=0）设定阈值。
+    """
+    t, df = t_statistics(pcorr, n_obs, n_controls)
+    return 2. * stats.t.sf(t, df)
+
+
+def threshold_edges(pcorr, pvals, alpha):
+    """上三角中P值小于alpha的边，按(source, target)的行优先顺序返回"""
+    rows, cols = np.triu_indices(pcorr.shape[0], 1)
+    keep = pvals[rows, cols] < alpha
+    return rows[keep], cols[keep]
+
+
+def edge_ranking(pvals):
+    """上三角的边按P值升序排列（P值相同时保持行优先顺序），返回 (rows, cols, 排序后的P值)"""
+    rows, cols = np.triu_indices(pvals.shape[0], 1)
+    p = pvals[rows, cols]
+    order = np.argsort(p, kind='stable')
+    return rows[order], cols[order], p[order]
+
+
+def threshold_counts(sorted_p, alphas):
+    """每个alpha下保留的边数，即排序后P值 < alpha 的前缀长度"""
+    return np.searchsorted(sorted_p, alphas, side='left')
+
+
+def ranked_prefix(path, alpha):
+    """从write_ranking保存的排序边列表中截取P值 < alpha 的网络，不需要重新计算偏相关"""
+    edges = pd.read_csv(path, dtype={'source': str, 'target': str})
+    return edges.iloc[:threshold_counts(edges['p_value'].to_numpy(), alpha)]
+
+
+def window_overlap(prev, cur):
+    """
+    相邻窗口按月滚动、交易日大量重合。返回偏移s，使 prev[s:] 与 cur 的开头逐行相同，
+    即有s个交易日移出窗口；两个窗口没有重合时返回len(prev)
+    """
+    for shift in range(len(prev)):
+        overlap = len(prev) - shift
+        if overlap <= len(cur) and np.array_equal(prev[shift:], cur[:overlap]):
+            return shift
+    return len(prev)
+
+
+class RollingPrecision(object):
+    """
+    滚动窗口的流式精度矩阵。
+
+    维护窗口内的离差平方和矩阵 S = sum (x - mean)(x - mean)^T 和 K = S + rho*I 的逆。
+    交易日移出/移入窗口时，S 的变化是一个低秩修正 U diag(signs) U^T（中心化后的行加上一列均值偏移），
+    用Woodbury公式更新 K^{-1}，每次代价 O(N^2 r) 而不是 O(N^3)。
+    偏相关对 K 的整体缩放不变，因此不需要除以样本数。
+    rho 在第一个窗口上按 ridge * mean(diag(S)) 确定后保持不变（保证K可逆，使低秩修正有意义）。
+    每 refresh_every 次更新、或Woodbury的capacitance矩阵条件数超过 max_cond 时，从窗口数据重新计算。
+    """
+
+    def __init__(self, X, ridge=1e-2, refresh_every=12, max_cond=1e10):
+        X = np.asarray(X, dtype=float)
+        self.rows = X.copy()
+        self.n_features = X.shape[1]
+        Xc = X - X.mean(axis=0)
+        self.rho = ridge * np.trace(Xc.T @ Xc) / self.n_features
+        self.refresh_every = refresh_every
+        self.max_cond = max_cond
+        self.refreshes = 0
+        self.refresh()
+
+    def refresh(self):
+        """从当前窗口的数据重新计算 S 和 K^{-1}"""
+        self.mean = self.rows.mean(axis=0)
+        Xc = self.rows - self.mean
+        self.scatter = Xc.T @ Xc
+        K = self.scatter.copy()
+        K.flat[::self.n_features + 1] += self.rho
+        self.precision = np.linalg.inv(K)
+        self.updates_since_refresh = 0
+        self.refreshes += 1
+
+    def _block(self, block, n_rest, mean_rest):
+        # 一组行与其余n_rest行合并时 S 的增量：块内离差 + 均值偏移项
+        k = block.shape[0]
+        mean_block = block.mean(axis=0)
+        shift = np.sqrt(n_rest * k / float(n_rest + k)) * (mean_block - mean_rest)
+        return np.column_stack(((block - mean_block).T, shift))
+
+    def update(self, entering, n_leaving):
+        """窗口最早的n_leaving行移出，entering（k行）移入"""
+        entering = np.asarray(entering, dtype=float).reshape(-1, self.n_features)
+        leaving, kept = self.rows[:n_leaving], self.rows[n_leaving:]
+        if len(kept) == 0:
+            self.rows = entering.copy()
+            self.refresh()
+            return self
+
+        blocks, signs = [], []
+        if n_leaving:
+            blocks.append(self._block(leaving, len(kept), kept.mean(axis=0)))
+            signs.append(-np.ones(blocks[-1].shape[1]))
+        if len(entering):
+            blocks.append(self._block(entering, len(kept), kept.mean(axis=0)))
+            signs.append(np.ones(blocks[-1].shape[1]))
+        self.rows = np.vstack((kept, entering))
+        self.updates_since_refresh += 1
+        if not blocks:
+            return self
+        if self.updates_since_refresh >= self.refresh_every:
+            self.refresh()
+            return self
+
+        U = np.hstack(blocks)
+        signs = np.concatenate(signs)
+        PU = self.precision @ U
+        capacitance = np.diag(1. / signs) + U.T @ PU
+        if np.linalg.cond(capacitance) > self.max_cond:
+            self.refresh()
+            return self
+        self.precision -= PU @ np.linalg.solve(capacitance, PU.T)
+        self.precision = 0.5 * (self.precision + self.precision.T)
+        self.scatter += (U * signs) @ U.T
+        self.mean = self.rows.mean(axis=0)
+        return self
+
+    def pcorr(self):
+        """当前窗口的偏相关矩阵（对角线为0），直接由维护的精度矩阵得到"""
+        d = np.sqrt(np.diag(self.precision))
+        pcorr = -self.precision / np.outer(d, d)
+        np.fill_diagonal(pcorr, 0.)
+        return pcorr
+
+
+def rolling_partial_correlations(Xs, ridge=1e-2, refresh_every=12):
+    """
+    按时间顺序逐个窗口产出偏相关矩阵。相邻窗口重合的交易日通过window_overlap识别，
+    只对移出和移入的交易日做低秩更新
+    """
+    engine = None
+    prev = None
+    for X in Xs:
+        X = np.asarray(X, dtype=float)
+        if engine is None:
+            engine = RollingPrecision(X, ridge, refresh_every)
+        else:
+            shift = window_overlap(prev, X)
+            engine.update(X[len(prev) - shift:], shift)
+        prev = X
+        yield engine.pcorr()
+
+
+def write_matrix(stem, tickers, pcorr, output_root):
+    """偏相关矩阵(xlsx)，与阈值无关，每个窗口只写一次"""
+    matrix_dir = os.path.join(output_root, 'Partial corr matrix')
+    os.makedirs(matrix_dir, exist_ok=True)
+    pd.DataFrame(pcorr, index=tickers, columns=tickers).to_excel(os.path.join(matrix_dir, f"partial_corr_{stem}.xlsx"))
+
+
+def write_ranking(stem, tickers, pcorr, rows, cols, sorted_p, network_root):
+    """按P值排序的全部上三角边（含偏相关系数和P值），供ranked_prefix按任意阈值截取"""
+    ranked_dir = os.path.join(network_root, 'ranked')
+    os.makedirs(ranked_dir, exist_ok=True)
+    tickers = np.asarray(tickers)
+    pd.DataFrame({'source': tickers[rows], 'target': tickers[cols], 'pcorr': pcorr[rows, cols], 'p_value': sorted_p}).to_csv(
+        os.path.join(ranked_dir, f"partial_corr_{stem}.csv"), index=False)
+
+
+def write_network(stem, tickers, rows, cols, network_root):
+    """按仓库中的格式写出一个阈值下的边列表(csv)和图(gml)"""
+    name = f"partial_corr_{stem}"
+    csv_dir = os.path.join(network_root, 'csv')
+    gml_dir = os.path.join(network_root, 'gml')
+    for folder in (csv_dir, gml_dir):
+        os.makedirs(folder, exist_ok=True)
+
+    tickers = np.asarray(tickers)
+    pd.DataFrame({'source': tickers[rows], 'target': tickers[cols], 'weight': 1}).to_csv(
+        os.path.join(csv_dir, f"{name}.csv"), index=False)
+    G = nx.Graph()
+    G.add_nodes_from(tickers)
+    G.add_edges_from(zip(tickers[rows], tickers[cols]), weight=1)
+    nx.write_gml(G, os.path.join(gml_dir, f"{name}.gml"))
+
+
+def build_networks(output_root, alpha=0.01, shrinkage=None, n_controls=0, store=None,
+                   folder=DATASETS['log_returns'], incremental=False, ridge=1e-2):
+    """
+    重建所有窗口的偏相关矩阵和P阈值网络，返回 {窗口标签: 边数}。
+    alpha为列表时每个窗口只排序一次，各阈值的网络取排序边数组的前缀，返回 {窗口标签: {alpha: 边数}}。
+    incremental=True 时使用RollingPrecision逐窗口低秩更新（岭正则 ridge，忽略shrinkage）
+    """
+    windows = load_windows(store, folder)
+    tickers = windows[0][2]
+    if any(w[2] != tickers for w in windows):
+        raise ValueError("all windows must share the same tickers")
+    Xs = [X for _, _, _, X in windows]
+    if incremental:
+        pcorrs = np.stack(list(rolling_partial_correlations(Xs, ridge)))
+    else:
+        pcorrs = partial_correlation(covariances(Xs, shrinkage), pseudo_inverse=not shrinkage)
+    pvals = p_values(pcorrs, [X.shape[0] for X in Xs], n_controls)
+
+    multi = np.ndim(alpha) > 0
+    alphas = np.atleast_1d(np.asarray(alpha, dtype=float))
+    network_root = os.path.join(output_root, 'P Threshold value networks')
+    counts = {}
+    for (label, stem, _, _), pcorr, pval in zip(windows, pcorrs, pvals):
+        write_matrix(stem, tickers, pcorr, output_root)
+        rows, cols, sorted_p = edge_ranking(pval)
+        sizes = threshold_counts(sorted_p, alphas)
+        if multi:
+            write_ranking(stem, tickers, pcorr, rows, cols, sorted_p, network_root)
+            for a, k in zip(alphas, sizes):
+                write_network(stem, tickers, rows[:k], cols[:k], os.path.join(network_root, f"p{a:g}"))
+            counts[label] = dict(zip(alphas.tolist(), sizes.tolist()))
+        else:
+            # 单一阈值时保持仓库中的行优先边顺序和目录结构
+            write_network(stem, tickers, *threshold_edges(pcorr, pval, alphas[0]), network_root)
+            counts[label] = int(sizes[0])
+        print(f"{label}: " + ', '.join(f"p<{a:g} {k} edges" for a, k in zip(alphas, sizes)))
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--alpha', type=float, nargs='+', default=[0.01], help='P-value threshold(s) for keeping an edge; several values emit one network per threshold.')
+    parser.add_argument('--shrinkage', type=str, default='none', help="'none' (pseudo-inverse), 'ledoit_wolf' or a fixed shrinkage in [0, 1].")
+    parser.add_argument('--n_controls', type=int, default=0, help='Control variables subtracted from the t-test degrees of freedom.')
+    parser.add_argument('--incremental', action='store_true', help='Update the precision matrix across overlapping windows instead of recomputing it.')
+    parser.add_argument('--ridge', type=float, default=1e-2, help='Relative ridge added to the scatter matrix in --incremental mode (a ridge estimator, so fewer edges than the pinv default).')
+    parser.add_argument('--store', type=str, default=None, help='Read log returns from a returns_store.py bundle.')
+    parser.add_argument('--output_root', type=str, default=os.path.join(ROOT, 'rebuilt_networks'), help='Root folder for the matrix/csv/gml outputs.')
+    args = parser.parse_args()
+    shrinkage = {'ledoit_wolf': 'ledoit_wolf', 'none': None}.get(args.shrinkage)
+    if shrinkage is None and args.shrinkage != 'none':
+        shrinkage = float(args.shrinkage)
+    alpha = args.alpha[0] if len(args.alpha) == 1 else args.alpha
+    build_networks(args.output_root, alpha, shrinkage, args.n_controls, args.store,
+                   incremental=args.incremental, ridge=args.ridge)
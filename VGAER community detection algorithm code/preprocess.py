@@ -0,0 +1,126 @@
+import numpy as np
+import scipy.sparse as sp
+import networkx as nx
+import torch
+
+
+def sparse_adjacency(G):
+    """读取networkx图的邻接矩阵，直接得到CSR稀疏矩阵（不经过稠密N×N矩阵）"""
+    return sp.csr_matrix(nx.to_scipy_sparse_array(G, format='csr'), dtype=np.float32)
+
+
+def to_torch_sparse(mat):
+    """scipy稀疏矩阵 -> torch COO稀疏张量"""
+    coo = sp.coo_matrix(mat)
+    indices = torch.from_numpy(np.vstack((coo.row, coo.col)).astype(np.int64))
+    values = torch.from_numpy(coo.data.astype(np.float32))
+    return torch.sparse_coo_tensor(indices, values, coo.shape).coalesce()
+
+
+def sparse_mm(adj, dense):
+    """稀疏×稠密乘法。torch的稀疏乘法不支持autocast的混合精度反向，这里关闭autocast并按adj的精度计算"""
+    with torch.autocast(adj.device.type, enabled=False):
+        return torch.sparse.mm(adj, dense.to(adj.dtype))
+
+
+def _normalize(adj):
+    adj = sp.csr_matrix(adj) + sp.eye(adj.shape[0], dtype=np.float32, format='csr')
+    d_inv_sqrt = np.power(np.asarray(adj.sum(axis=1)).ravel(), -0.5)
+    D = sp.diags(d_inv_sqrt)
+    return D @ adj @ D
+
+
+def normalize_adj(adj):
+    """计算 A_hat = D^-1/2 (A + I) D^-1/2，全程稀疏"""
+    return to_torch_sparse(_normalize(adj))
+
+
+def block_normalize_adj(adjs):
+    """多个时间窗口的A_hat拼成一个块对角稀疏矩阵 (S*N, S*N)"""
+    return to_torch_sparse(sp.block_diag([_normalize(adj) for adj in adjs], format='csr'))
+
+
+def loss_para(adj):
+    """与compute_loss_para相同的pos_weight和norm（adj为加自环后的稀疏矩阵）"""
+    n2 = adj.shape[0] * adj.shape[0]
+    total = float(adj.sum())
+    pos_weight = (n2 - total) / total
+    norm = n2 / float((n2 - total) * 2)
+    return pos_weight, norm
+
+
+class ModularityFeatures(object):
+    """
+    模块度矩阵 B = A - k k^T / 2m 的低秩表示，用作VGAER的输入特征。
+    B本身是稠密的，这里不显式构造，而是计算 B @ W = A @ W - k (k^T W) / 2m。
+    """
+
+    def __init__(self, adj, device=None):
+        adj = sp.csr_matrix(adj)
+        self.adj = to_torch_sparse(adj)
+        self.degree = torch.from_numpy(np.asarray(adj.sum(axis=1), dtype=np.float32).reshape(-1, 1))
+        self.two_m = float(adj.sum())
+        if device is not None:
+            self.to(device)
+
+    def to(self, device):
+        self.adj = self.adj.to(device)
+        self.degree = self.degree.to(device)
+        return self
+
+    @property
+    def shape(self):
+        return self.adj.shape
+
+    def size(self, dim=None):
+        return self.adj.size() if dim is None else self.adj.size(dim)
+
+    def mm(self, weight):
+        return sparse_mm(self.adj, weight) - self.degree @ (self.degree.t() @ weight) / self.two_m
+
+    def bmm(self, weight):
+        # S组堆叠权重 (S, N, out) 共享同一个B：一次稀疏乘法得到每个 B @ W_s
+        S, n, out = weight.shape
+        support = sparse_mm(self.adj, weight.transpose(0, 1).reshape(n, S * out)).reshape(n, S, out).transpose(0, 1)
+        return support - self.degree @ (self.degree.t() @ weight) / self.two_m
+
+    def to_dense(self):
+        return self.adj.to_dense() - self.degree @ self.degree.t() / self.two_m
+
+
+class BatchedModularityFeatures(object):
+    """
+    S个时间窗口的模块度特征。配合块对角的A，
+    一次稀疏乘法即可得到每个窗口的 B_s @ W_s，W为(S, N, out)的堆叠权重。
+    """
+
+    def __init__(self, adjs, device=None):
+        adjs = [sp.csr_matrix(adj) for adj in adjs]
+        n = adjs[0].shape[0]
+        if any(adj.shape != (n, n) for adj in adjs):
+            raise ValueError("all windows must share the same node set")
+        self.num_models = len(adjs)
+        self.adj = to_torch_sparse(sp.block_diag(adjs, format='csr'))
+        self.degree = torch.from_numpy(np.stack([np.asarray(adj.sum(axis=1), dtype=np.float32).reshape(-1, 1)
+                                                 for adj in adjs]))
+        self.two_m = torch.tensor([float(adj.sum()) for adj in adjs]).reshape(-1, 1, 1)
+        if device is not None:
+            self.to(device)
+
+    def to(self, device):
+        self.adj = self.adj.to(device)
+        self.degree = self.degree.to(device)
+        self.two_m = self.two_m.to(device)
+        return self
+
+    @property
+    def shape(self):
+        return self.degree.shape[:2] + (self.degree.shape[1],)
+
+    def size(self, dim=None):
+        return self.shape if dim is None else self.shape[dim]
+
+    def bmm(self, weight):
+        S, n, out = weight.shape
+        support = sparse_mm(self.adj, weight.reshape(S * n, out)).reshape(S, n, out)
+        return support - self.degree @ (self.degree.transpose(1, 2) @ weight) / self.two_m
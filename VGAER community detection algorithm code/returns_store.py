@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+收盘价和对数收益率的二进制列式缓存。
+
+一次性把 Stocks_close price/window_*.xlsx 和 Stocks_close price_log retunrs/log_returns_window_*.xlsx
+转换为内存映射的 .npy 文件（股票 × 交易日，Fortran顺序），并用 index.json 记录股票代码和每个窗口的列范围。
+之后每个窗口都是内存映射数组上的零拷贝切片，不再需要用openpyxl解析Excel。
+
+    python returns_store.py --store ./returns_store
+    store = ReturnsStore('./returns_store')
+    X = store.window(0)              # (股票, 交易日) 的只读视图
+    df = store.frame(0)              # 与 pd.read_excel 相同形状的 DataFrame (交易日 × 股票)
+"""
+import os
+import re
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DATASETS = {
+    'log_returns': os.path.join(ROOT, 'Stocks_close price_log retunrs'),
+    'close': os.path.join(ROOT, 'Stocks_close price'),
+}
+WINDOW_PATTERN = re.compile(r'(\d{4}-\d{2}-\d{2})_(\d+)(\.\w+)$')
+
+
+def window_files(folder, ext='.xlsx'):
+    """按窗口编号排序的 (标签, 路径) 列表，标签与get_time_window_label一致，如 2014-01-02_01"""
+    windows = []
+    for name in os.listdir(folder):
+        match = WINDOW_PATTERN.search(name)
+        if match and match.group(3) == ext:
+            windows.append((int(match.group(2)), f"{match.group(1)}_{int(match.group(2)):02d}", os.path.join(folder, name)))
+    windows.sort()
+    return [(label, path) for _, label, path in windows]
+
+
+def build_store(store_dir, datasets=None, dtype=np.float64):
+    """一次性转换：解析所有窗口的xlsx，写入 <dataset>.npy 和 index.json"""
+    datasets = DATASETS if datasets is None else datasets
+    os.makedirs(store_dir, exist_ok=True)
+    index = {'tickers': None, 'datasets': {}}
+    for name, folder in datasets.items():
+        frames = [(label, pd.read_excel(path)) for label, path in window_files(folder)]
+        if index['tickers'] is None:
+            tickers = []
+            for _, df in frames:
+                tickers.extend(t for t in df.columns if t not in tickers)
+            index['tickers'] = [str(t) for t in tickers]
+        tickers = index['tickers']
+
+        lengths = [len(df) for _, df in frames]
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        data = np.full((len(tickers), offsets[-1]), np.nan, dtype=dtype, order='F')
+        for (label, df), start, end in zip(frames, offsets[:-1], offsets[1:]):
+            # 缺失的股票保持为NaN
+            data[:, start:end] = df.reindex(columns=tickers).to_numpy(dtype=dtype).T
+        np.save(os.path.join(store_dir, f'{name}.npy'), data)
+        index['datasets'][name] = {
+            'dtype': np.dtype(dtype).name,
+            'windows': [{'label': label, 'start': int(start), 'end': int(end)}
+                        for (label, _), start, end in zip(frames, offsets[:-1], offsets[1:])],
+        }
+        print(f"{name}: {len(frames)} windows, {len(tickers)} tickers, {offsets[-1]} rows")
+    with open(os.path.join(store_dir, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    return ReturnsStore(store_dir)
+
+
+class ReturnsStore(object):
+    """以内存映射方式读取build_store生成的缓存"""
+
+    def __init__(self, store_dir):
+        with open(os.path.join(store_dir, 'index.json'), encoding='utf-8') as f:
+            index = json.load(f)
+        self.store_dir = store_dir
+        self.tickers = index['tickers']
+        self.windows = {name: info['windows'] for name, info in index['datasets'].items()}
+        self.arrays = {name: np.load(os.path.join(store_dir, f'{name}.npy'), mmap_mode='r')
+                       for name in self.windows}
+
+    def __len__(self):
+        return len(self.windows['log_returns'])
+
+    def labels(self, dataset='log_returns'):
+        return [w['label'] for w in self.windows[dataset]]
+
+    def window(self, i, dataset='log_returns'):
+        """第i个窗口 (股票, 交易日) 的零拷贝视图；i可以是编号或窗口标签"""
+        windows = self.windows[dataset]
+        if isinstance(i, str):
+            i = self.labels(dataset).index(i)
+        w = windows[i]
+        return self.arrays[dataset][:, w['start']:w['end']]
+
+    def frame(self, i, dataset='log_returns'):
+        """与 pd.read_excel 读取的窗口相同的 DataFrame（交易日 × 股票），底层数据不复制"""
+        return pd.DataFrame(self.window(i, dataset).T, columns=self.tickers, copy=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--store', type=str, default=os.path.join(ROOT, 'returns_store'), help='Output folder for the binary store.')
+    parser.add_argument('--dtype', type=str, default='float64', choices=['float32', 'float64'], help='Storage dtype.')
+    args = parser.parse_args()
+    build_store(args.store, dtype=np.dtype(args.dtype))
@@ -0,0 +1,59 @@
+import numpy as np
+import scipy.sparse as sp
+import torch
+import torch.nn.functional as F
+
+
+class NegativeSampler(object):
+    """
+    只对观测到的边和采样的非边计算重构损失，每个epoch的代价为O(E)而不是O(N^2)。
+
+    adj为加自环后的稀疏邻接矩阵（与compute_loss_para中的A一致），
+    target为原始邻接矩阵（不含自环），用于给正样本赋标签。
+    负样本的损失乘以 非边总数/采样数，使其成为稠密损失的无偏估计，
+    pos_weight和norm的计算方式与compute_loss_para相同。
+    """
+
+    def __init__(self, adj, target, neg_ratio=1.0, device=None):
+        adj = sp.csr_matrix(adj)
+        target = sp.csr_matrix(target)
+        self.n = adj.shape[0]
+        self.device = device
+
+        coo = adj.tocoo()
+        self.pos_rows = torch.from_numpy(coo.row.astype(np.int64))
+        self.pos_cols = torch.from_numpy(coo.col.astype(np.int64))
+        self.pos_target = torch.from_numpy(np.asarray(target[coo.row, coo.col], dtype=np.float32).ravel())
+        # 正样本的一维键值（有序），用于在采样时剔除正样本
+        self.pos_keys = torch.sort(self.pos_rows * self.n + self.pos_cols)[0]
+
+        n2 = self.n * self.n
+        total = float(adj.sum())
+        self.pos_weight = (n2 - total) / total
+        self.norm = n2 / float((n2 - total) * 2)
+        self.num_neg_total = n2 - adj.nnz
+        self.num_neg = max(1, int(neg_ratio * adj.nnz))
+        if device is not None:
+            self.to(device)
+
+    def to(self, device):
+        self.device = device
+        self.pos_rows = self.pos_rows.to(device)
+        self.pos_cols = self.pos_cols.to(device)
+        self.pos_target = self.pos_target.to(device)
+        self.pos_keys = self.pos_keys.to(device)
+        return self
+
+    def sample(self):
+        """均匀采样非边，返回(rows, cols, scale)"""
+        keys = torch.randint(0, self.n * self.n, (self.num_neg,), device=self.pos_keys.device)
+        idx = torch.searchsorted(self.pos_keys, keys).clamp_(max=self.pos_keys.numel() - 1)
+        keys = keys[self.pos_keys[idx] != keys]
+        scale = self.num_neg_total / float(max(keys.numel(), 1))
+        return keys // self.n, keys % self.n, scale
+
+    def loss(self, pos_logits, neg_logits, scale):
+        """pos_logits/neg_logits为正负样本上的概率，与稠密训练中的logits含义相同"""
+        pos_loss = F.binary_cross_entropy(pos_logits, self.pos_target, reduction='sum')
+        neg_loss = F.binary_cross_entropy(neg_logits, torch.zeros_like(neg_logits), reduction='sum')
+        return self.norm * (self.pos_weight * pos_loss + scale * neg_loss) / (self.n * self.n)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+enrichment.py 的测试：节点子集中没有某个行业时，该行业不应被报告为显著富集。
+
+    python -m pytest test_enrichment.py
+"""
+import numpy as np
+
+from migration import Migration
+from enrichment import type_counts, industry_index, cell_counts, enrichment_ratio, permutation_pvalues, enrichment
+
+
+def small_migration():
+    # 3个窗口、6个节点、2个社区；行业 X: 000001-000002，Y: 000003-000004，Z: 000005-000006
+    labels = np.array([[0, 0, 1, 1, 0, 1],
+                       [0, 1, 1, 0, 0, 1],
+                       [1, 0, 1, 1, 0, 0]])
+    codes = ['000001', '000002', '000003', '000004', '000005', '000006']
+    classification = {'X': ['000001', '000002'], 'Y': ['000003', '000004'], 'Z': ['000005', '000006']}
+    return Migration(labels, codes), classification
+
+
+def test_permutation_pvalues_nan_for_empty_industry():
+    mig, classification = small_migration()
+    counts, _ = type_counts(mig)
+    industries, names = industry_index(mig.codes, classification)
+    industries[[4, 5]] = -1                     # 子集中没有行业Z
+    observed = enrichment_ratio(cell_counts(counts, industries, len(names)))
+    assert np.isnan(observed[:, 2]).all()
+    p = permutation_pvalues(counts, industries, len(names), observed, permutations=200, seed=0)
+    assert np.isnan(p[:, 2]).all()
+    assert not np.isnan(p[:, :2]).any()
+
+
+def test_subset_drops_empty_industry():
+    mig, classification = small_migration()
+    df = enrichment(mig, classification, nodes=[0, 1, 2, 3], permutations=200, seed=0)
+    assert set(df['Industry']) == {'X', 'Y'}
+    assert not df['Enrichment'].isna().any()
+    assert (df['q_perm'] >= 0.05).all()
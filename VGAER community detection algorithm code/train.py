@@ -2,7 +2,7 @@ from __future__ import division
 from __future__ import print_function
 
 import os
-os.environ["OMP_NUM_THREADS"] = '1'
+os.environ.setdefault("OMP_NUM_THREADS", '1')
 import argparse
 import time
 import networkx as nx
@@ -45,6 +45,10 @@ args = parser.parse_args()
 use_cuda = torch.cuda.is_available()
 device = torch.device("cuda" if use_cuda else "cpu")
 
+# Fix random seeds (model init, latent sampling and TSNE/KMeans)
+torch.manual_seed(args.seed)
+np.random.seed(args.seed)
+
 
 def vgaer():
     # Load dataset
@@ -18,6 +18,7 @@ import model
 from model import VGAERModel
 import torch.nn.functional as F
 from cluster import community
+from trainer import EarlyStopping
 from NMI import load_label, NMI, label_change
 from Qvalue import Q
 from sklearn import manifold
@@ -36,12 +37,21 @@ parser.add_argument('--lr', type=float, default=0.05, help='Initial learning rat
 parser.add_argument('--dropout', type=float, default=0., help='Dropout rate (1 - keep probability).')
 parser.add_argument('--dataset', type=str, default='pubmed', help='type of dataset.')
 parser.add_argument('--cluster', type=str, default=3, help='Number of community')
+parser.add_argument('--tol', type=float, default=0., help='Stop when the mean loss over --tol_window epochs changes by less than this relative amount (0 = train all --epochs).')
+parser.add_argument('--tol_window', type=int, default=50, help='Epochs between convergence checks.')
+parser.add_argument('--patience', type=int, default=None, help='Also stop after this many epochs without improvement.')
+parser.add_argument('--min_epochs', type=int, default=200, help='Minimum epochs before early stopping applies.')
+parser.add_argument('--log_every', type=int, default=100, help='Print the training loss every N epochs (0 = silent).')
 args = parser.parse_args()
 
 #Check device
 use_cuda = torch.cuda.is_available()
 device = torch.device("cuda" if use_cuda else "cpu")
 
+# Fix random seeds (model init, latent sampling and TSNE/KMeans)
+torch.manual_seed(args.seed)
+np.random.seed(args.seed)
+
 def vgaer():
     # Load form DGL dataset
     if args.dataset == 'cora':
@@ -127,6 +137,7 @@ def vgaer():
         return weight_tensor,norm
 
     weight_tensor, norm = compute_loss_para(A)
+    monitor = EarlyStopping(args.tol, args.tol_window, args.min_epochs, patience=args.patience, log_every=args.log_every)
 
         #create traing epoch
     for epoch in range(args.epochs):
@@ -141,11 +152,12 @@ def vgaer():
                 1 + 2 * vgaer_model.log_std - vgaer_model.mean ** 2 - torch.exp(vgaer_model.log_std) ** 2).sum(
             1).mean()
         loss -= kl_divergence
-        print("Epoch:", '%04d' % (epoch + 1), "train_loss=", "{:.5f}".format(loss.item()))
         optimizer.zero_grad()
         loss.backward()
         optimizer.step()
-        if epoch == args.epochs-1:
+        stop = monitor.step(epoch, loss, hidemb)
+        if stop or epoch == args.epochs-1:
+            print("Stopped after", monitor.epochs, "epochs")
             hidemb = hidemb.cpu()
             #torch.save(hidemb, './z.pt')pip
             # NMI_count=[]
@@ -165,7 +177,7 @@ def vgaer():
             #feats = feats.cpu()
             Q(A_orig, np.eye(args.cluster)[commu_pred])
             #print(Q_NUMBER)
-            NMI(commu_pred, label_orig)
+            NMI(commu_pred, label_orig, verbose=True)
             #x_num.append(epoch)
             #y_num.append(nmi * 100)
             # ts = manifold.TSNE(n_components=2, perplexity=35, early_exaggeration=500, n_iter=2000, learning_rate=500,
@@ -178,6 +190,7 @@ def vgaer():
             # plt.scatter(z[:, 0], z[:, 1], c=commu_pred, marker='o', s=5)  # 不同类别不同颜色
             # plt.title("k-means")
             # plt.show()
+            break
     # np.save('./{}_epoch_x.npy'.format(args.dataset), x_num)
     # np.save('./{}_epoch_y.npy'.format(args.dataset), y_num)
 if __name__ == '__main__':
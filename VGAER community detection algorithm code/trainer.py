@@ -0,0 +1,81 @@
+import torch
+
+
+class EarlyStopping(object):
+    """
+    VGAER训练循环共用的早停/日志组件，每个epoch在optimizer.step()之后调用 step(epoch, loss, hidemb)。
+
+    所有记录都留在设备上，不在每个epoch调用loss.item()：
+      - 损失在设备上累加，每window个epoch同步一次，比较相邻两段的平均损失（隐变量采样使单个epoch的损失有噪声），
+        相对变化不超过tol时停止（tol<=0时不启用）；
+      - patience不为None时，损失连续patience个epoch没有相对改进tol（tol=0即严格下降）也停止，
+        计数器在设备上用torch.where更新，同样只在检查点同步；
+      - keep_best=True时，损失最低的隐变量用torch.where保存在设备上，不在每次改进时复制到CPU。
+    两种停止判据都只在epoch+1 >= min_epochs之后生效。log_every>0时每log_every个epoch打印一次损失。
+    """
+
+    def __init__(self, tol=0., window=50, min_epochs=0, patience=None, keep_best=False, log_every=0):
+        self.tol = tol
+        self.window = max(1, window)
+        self.min_epochs = min_epochs
+        self.patience = patience
+        self.keep_best = keep_best
+        self.log_every = log_every
+        self.total = None
+        self.prev_mean = None
+        self.best_loss = None
+        self.best_embedding = None
+        self.last_embedding = None
+        self.ref_loss = None
+        self.since_improved = None
+        self.epochs = 0
+
+    @property
+    def active(self):
+        return self.tol > 0 or self.patience is not None
+
+    def step(self, epoch, loss, hidemb=None):
+        """记录一个epoch，返回是否应停止训练"""
+        loss = loss.detach()
+        self.epochs = epoch + 1
+        if hidemb is not None:
+            self.last_embedding = hidemb.detach()
+        if self.best_loss is None:
+            self.best_loss = loss.clone()
+            self.ref_loss = loss.clone()
+            self.since_improved = torch.zeros((), dtype=torch.long, device=loss.device)
+            self.total = torch.zeros((), dtype=loss.dtype, device=loss.device)
+            if self.keep_best and hidemb is not None:
+                self.best_embedding = hidemb.detach().clone()
+        else:
+            better = loss < self.best_loss
+            if self.keep_best and hidemb is not None:
+                self.best_embedding = torch.where(better, hidemb.detach(), self.best_embedding)
+            self.best_loss = torch.where(better, loss, self.best_loss)
+            improved = loss < self.ref_loss - self.tol * self.ref_loss.abs()
+            self.ref_loss = torch.where(improved, loss, self.ref_loss)
+            self.since_improved = torch.where(improved, torch.zeros_like(self.since_improved), self.since_improved + 1)
+        self.total = self.total + loss
+
+        if self.log_every > 0 and self.epochs % self.log_every == 0:
+            print("Epoch:", '%04d' % self.epochs, "train_loss=", "{:.5f}".format(loss.item()))
+        if self.epochs % self.window:
+            return False
+        stop = self.active and self.check()
+        self.total = torch.zeros_like(self.total)
+        return stop
+
+    def check(self):
+        # 检查点：一次同步取回本段的平均损失和未改进的epoch数
+        total, since_improved = torch.stack([self.total, self.since_improved.to(self.total.dtype)]).tolist()
+        mean = total / self.window
+        prev, self.prev_mean = self.prev_mean, mean
+        if self.epochs < self.min_epochs:
+            return False
+        if self.patience is not None and since_improved >= self.patience:
+            return True
+        return self.tol > 0 and prev is not None and abs(prev - mean) <= self.tol * abs(prev)
+
+    def embedding(self):
+        """keep_best时返回损失最低的隐变量，否则返回最后一个epoch的隐变量"""
+        return self.best_embedding if self.keep_best else self.last_embedding
@@ -2,9 +2,9 @@ from __future__ import division
 from __future__ import print_function
 
 import os
-os.environ["OMP_NUM_THREADS"] = '1'
-os.environ['CUDA_LAUNCH_BLOCKING'] = '1'
+import copy
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 import time
 import networkx as nx
 import numpy as np
@@ -18,11 +18,21 @@ from dgl.data import CoraGraphDataset, CiteseerGraphDataset , PubmedGraphDataset
 import csv
 # import scanpy
 import model
-from model import VGAERModel
+from model import VGAERModel, loss_step
 import torch.nn.functional as F
-from cluster import community
+from cluster import community, CLUSTER_METHODS, co_association, consensus_partition, stability_scores
 from NMI import load_label, NMI, label_change
-from Qvalue import Q
+from Qvalue import modularity
+from preprocess import sparse_adjacency, normalize_adj, loss_para, ModularityFeatures
+from sampling import NegativeSampler
+from batch_train import train_batched, train_ensemble
+from trainer import EarlyStopping
+from execution import add_execution_args, configure, init_worker
+from instrument import add_instrument_args, Tracer
+from cache import add_cache_args, ResultCache
+from export import add_export_args, export_results, report, require_parquet
+from align import ALIGN_METHODS, align_sequence
+from migration import Migration, write_report
 
 # 定义命令行参数
 parser = argparse.ArgumentParser()
@@ -36,13 +46,69 @@ parser.add_argument('--dropout', type=float, default=0., help='Dropout rate (1 -
 parser.add_argument('--dataset', type=str, default='stock', help='type of dataset.')
 parser.add_argument('--cluster', type=int, default=4, help='Number of community')
 parser.add_argument('--gml_folder', type=str, default='D:\\管科-机器学习\\基于动态网络的股票市场内在关联特征分析及其应用\\Test\\动态演化分析\\gml', help='Path to the folder containing GML files.')
+parser.add_argument('--cluster_method', type=str, default='tsne', choices=CLUSTER_METHODS, help='Clustering backend for the VGAER embeddings.')
+parser.add_argument('--no_plot', action='store_true', help='Skip rendering the per-window community plots.')
+parser.add_argument('--sparse', action='store_true', help='Use sparse A_hat, sparse modularity features and the negative-sampled reconstruction loss (--neg_ratio defaults to 1).')
+parser.add_argument('--neg_ratio', type=float, default=None, help='Negative samples per observed edge for the sampled reconstruction loss (implies --sparse; 0 = full N×N loss; default 1 with --sparse, otherwise 0).')
+parser.add_argument('--batched', action='store_true', help='Train independent models for all windows in one batched run.')
+parser.add_argument('--fused', action='store_true', help='Use FusedVGAERModel (preallocated noise, explicit mean/log_std) in the dense path.')
+parser.add_argument('--compile', action='store_true', help='Compile the fused forward + loss with torch.compile (implies --fused).')
+parser.add_argument('--compile_mode', type=str, default=None, choices=['default', 'reduce-overhead', 'max-autotune'], help='torch.compile mode; reduce-overhead adds CUDA graph capture on GPU.')
+parser.add_argument('--ensemble', type=int, default=0, help='Train this many seeds per window in one batched run and take the co-association consensus partition (0 = single model).')
+parser.add_argument('--warm_start', action='store_true', help="Initialise each window from the previous window's trained weights and Adam state (ignored with --batched).")
+parser.add_argument('--tol', type=float, default=None, help='Stop when the mean loss over --tol_window epochs changes by less than this relative amount (default 1e-4 with --warm_start, otherwise 0 = train all --epochs).')
+parser.add_argument('--tol_window', type=int, default=50, help='Epochs averaged per convergence check.')
+parser.add_argument('--min_epochs', type=int, default=200, help='Minimum epochs before the convergence check applies to a cold-started window.')
+parser.add_argument('--log_every', type=int, default=0, help='Print the training loss every N epochs (0 = silent).')
 parser.add_argument('--output_folder', type=str, default='D:\\管科-机器学习\\基于动态网络的股票市场内在关联特征分析及其应用\\Test\\动态演化分析\\社区划分', help='Output folder for results.')
+parser.add_argument('--align', type=str, default='chain', choices=ALIGN_METHODS,
+                    help='Community label alignment across windows: chain (previous window), memory (label counts of the last --align_memory windows), reference (medoid window) or none.')
+parser.add_argument('--align_memory', type=int, default=5, help='Windows counted by --align memory.')
+parser.add_argument('--migration', action='store_true', help='Also write migration.npz, migration paths, the transition matrix and dwell times to <output_folder>/migration.')
+add_export_args(parser)
+add_execution_args(parser, 'Worker processes that train independent windows in parallel (1 = sequential).')
+add_instrument_args(parser)
+add_cache_args(parser)
 args = parser.parse_args()
+if args.export_format == 'parquet':
+    require_parquet()  # 训练前检查可选依赖
+if args.tol is None:
+    args.tol = 1e-4 if args.warm_start else 0.
+if args.neg_ratio is None:
+    # --sparse 默认使用负采样损失，否则重构损失仍需稠密的N×N目标和权重
+    args.neg_ratio = 1. if args.sparse else 0.
+elif args.sparse and args.neg_ratio == 0:
+    print('Warning: --sparse with --neg_ratio 0 keeps the dense N×N reconstruction loss; only the encoder is sparse')
+if args.compile:
+    args.fused = True
+if args.workers > 1 and (args.warm_start or args.batched):
+    parser.error('--workers > 1 trains windows independently and cannot be combined with --warm_start or --batched')
+if args.fused and (args.sparse or args.neg_ratio > 0 or args.batched or args.ensemble > 1):
+    parser.error('--fused/--compile only apply to the dense single-model path')
+if args.ensemble > 1 and (args.warm_start or args.sparse or args.neg_ratio > 0 or args.batched):
+    parser.error('--ensemble > 1 trains cold-started dense models and cannot be combined with --warm_start, --sparse, --neg_ratio or --batched')
+if args.cache and args.batched:
+    parser.error('--cache applies to per-window training and cannot be combined with --batched')
 
 # 检查设备
 use_cuda = torch.cuda.is_available()
 device = torch.device("cuda" if use_cuda else "cpu")
 
+# 固定随机种子（模型初始化、隐变量采样和TSNE/KMeans）
+torch.manual_seed(args.seed)
+np.random.seed(args.seed)
+
+# 线程数、工作进程数和autocast精度
+profile = configure(args, device)
+
+# 分阶段计时和计数器（CUDA上阶段边界同步）
+tracer = Tracer(device.type == 'cuda', args.profile, args.profile_dir)
+
+# 窗口结果缓存：键为邻接矩阵内容 + 影响训练和聚类结果的超参数 + 该窗口的种子
+cache = ResultCache(args.cache, args.cache_size_mb) if args.cache else None
+CACHE_PARAMS = ('model', 'hidden1', 'hidden2', 'lr', 'dropout', 'epochs', 'cluster', 'cluster_method', 'sparse', 'neg_ratio',
+                'fused', 'compile', 'compile_mode', 'ensemble', 'warm_start', 'tol', 'tol_window', 'min_epochs', 'precision')
+
 # 定义函数来计算和存储 Q 值
 q_values = []
 community_changes = []
@@ -51,34 +117,150 @@ community_assignments = []
 # 用于存储所有时间窗口的社区划分和变化
 community_assignments_dict = {}
 community_changes_dict = {}
+# 多种子集成时每个窗口各节点的稳定性
+community_stability_dict = {}
+# 每个窗口用于聚类的隐变量（写入缓存）
+embedding_dict = {}
 node_labels = []
 
+# warm start：上一个窗口训练结束时的模型参数和Adam状态，以及上一个窗口的缓存键
+warm_state = None
+prev_cache_key = None
+
 def get_time_window_label(gml_file, index):
     date_str = gml_file.split('_')[5]
     return f"{date_str}_{index:02d}"
 
-def match_communities(prev_communities, current_communities):
-    from scipy.optimize import linear_sum_assignment
-    import numpy as np
+def make_model(in_dim, fused=False):
+    # 创建模型和优化器；warm start时从上一个窗口的参数和Adam状态继续训练
+    if fused:
+        vgaer_model = model.FusedVGAERModel(in_dim, args.hidden1, args.hidden2, device, num_nodes=in_dim)
+    else:
+        vgaer_model = model.VGAERModel(in_dim, args.hidden1, args.hidden2, device)
+    vgaer_model = vgaer_model.to(device)
+    optimizer = torch.optim.Adam(vgaer_model.parameters(), lr=args.lr)
+    warm = args.warm_start and warm_state is not None and warm_state['in_dim'] == in_dim
+    if warm:
+        vgaer_model.load_state_dict(warm_state['model'])
+        optimizer.load_state_dict(warm_state['optimizer'])
+        print('Warm start from the previous window')
+    print('Total Parameters:', sum([p.nelement() for p in vgaer_model.parameters()]))
+    return vgaer_model, optimizer, warm
+
+def save_warm_state(vgaer_model, optimizer):
+    global warm_state
+    if args.warm_start:
+        warm_state = {'in_dim': vgaer_model.in_dim,
+                      'model': copy.deepcopy(vgaer_model.state_dict()),
+                      'optimizer': copy.deepcopy(optimizer.state_dict())}
+
+def cluster_window(hidemb, A_orig, G, time_window_label, output_folder):
+    # 对训练好的隐变量聚类，计算Q值并记录社区分配
+    save_path = None if args.no_plot else os.path.join(output_folder, f"{time_window_label}.png")
+    embedding_dict[time_window_label] = torch.as_tensor(hidemb).detach().float().numpy()
+    with tracer.stage('cluster'):
+        commu_pred = community(hidemb, args.cluster, save_path, time_window_label, method=args.cluster_method)
+    return record_partition(commu_pred, A_orig, G, time_window_label)
+
+def record_partition(commu_pred, A_orig, G, time_window_label, Q_value=None):
+    # 社区编号在所有窗口完成后由align_windows统一对齐，这里只记录原始划分
+    if Q_value is None:
+        with tracer.stage('modularity'):
+            Q_value = modularity(A_orig, commu_pred)
+    q_values.append((time_window_label, Q_value))
+    community_assignments_dict[time_window_label] = {label[:6]: commu_pred[node] for node, label in enumerate(G.nodes())}
+    print(f"Q value for {time_window_label}: {Q_value}")
+    return commu_pred
+
+def vgaer(gml_file, time_window_label, output_folder, G=None):
+    # 读取GML文件
+    if G is None:
+        with tracer.stage('load'):
+            G = nx.read_gml(gml_file, label='label')
+    if args.ensemble > 1:
+        return vgaer_ensemble(G, gml_file, time_window_label, output_folder)
+    if args.sparse or args.neg_ratio > 0:
+        return vgaer_sparse(G, gml_file, time_window_label, output_folder)
+    print(f"Processing {gml_file}")
+    print(f"Nodes: {G.number_of_nodes()}, Edges: {G.number_of_edges()}")
 
-    # Create a cost matrix
-    num_communities = max(max(prev_communities), max(current_communities)) + 1
-    cost_matrix = np.zeros((num_communities, num_communities))
+    global node_labels
+    if not node_labels:
+        node_labels = list(G.nodes())
+        node_labels = [label[:6] for label in node_labels]  # 仅需要标签的前6位
 
-    for i in range(len(prev_communities)):
-        cost_matrix[prev_communities[i], current_communities[i]] -= 1
+    with tracer.stage('preprocess'):
+        A = torch.Tensor(nx.adjacency_matrix(G).todense())
+        A_orig = A.detach().numpy()
+        A_orig_ten = A.to(device)
+
+        # 计算B矩阵
+        K = 1 / (A.sum().item()) * (A.sum(dim=1).reshape(A.shape[0], 1) @ A.sum(dim=1).reshape(1, A.shape[0]))
+        B = A - K
+        B = B.to(device)
+
+        # 计算A_hat矩阵
+        A = A + torch.eye(A.shape[0])
+        D = torch.diag(torch.pow(A.sum(dim=1), -0.5))  # D = D^-1/2
+        A_hat = D @ A @ D
+        A_hat = A_hat.to(device)
+        A = A.to(device)
+
+        feats = B
+        in_dim = feats.shape[-1]
+
+        def compute_loss_para(adj):
+            pos_weight = ((adj.shape[0] * adj.shape[0] - adj.sum()) / adj.sum())
+            norm = adj.shape[0] * adj.shape[0] / float((adj.shape[0] * adj.shape[0] - adj.sum()) * 2)
+            weight_mask = adj.view(-1) == 1
+            weight_tensor = torch.ones(weight_mask.size(0)).to(device)
+            weight_tensor[weight_mask] = pos_weight
+            return weight_tensor, norm
+
+        weight_tensor, norm = compute_loss_para(A)
+    print(f"Weight Tensor:\n{weight_tensor}")
+    print(f"Norm: {norm}")
 
-    row_ind, col_ind = linear_sum_assignment(cost_matrix)
-    community_map = {col: row for row, col in zip(row_ind, col_ind)}
+    # 创建模型和训练组件
+    vgaer_model, optimizer, warm = make_model(in_dim, args.fused)
+    monitor = EarlyStopping(args.tol, args.tol_window, args.tol_window if warm else args.min_epochs, log_every=args.log_every)
 
-    matched_communities = [community_map[comm] for comm in current_communities]
+    # 融合模型：前向和损失在同一个（可被torch.compile编译的）函数中完成，norm以张量传入避免重新编译
+    step = loss_step(args.compile, args.compile_mode) if args.fused else None
+    norm_ten = torch.tensor(norm, device=device)
 
-    return matched_communities
+    # 训练循环
+    with tracer.stage('train'):
+        for epoch in range(args.epochs):
+            vgaer_model.train()
+            if step is not None:
+                loss, hidemb = step(vgaer_model, A_hat, feats, A_orig_ten, weight_tensor, norm_ten, profile.dtype)
+            else:
+                with profile.autocast():
+                    recovered = vgaer_model.forward(A_hat, feats)
+                logits = torch.sigmoid(recovered[0].float())  # 应用Sigmoid激活函数
+                hidemb = recovered[1].float()
+                mean, log_std = vgaer_model.mean.float(), vgaer_model.log_std.float()
+
+                loss = norm * F.binary_cross_entropy(logits.view(-1), A_orig_ten.view(-1), weight=weight_tensor)
+                kl_divergence = 0.5 / logits.size(0) * (
+                        1 + 2 * log_std - mean ** 2 - torch.exp(log_std) ** 2).sum(1).mean()
+                loss -= kl_divergence
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            if monitor.step(epoch, loss, hidemb):
+                print(f"Converged after {epoch + 1} epochs")
+                tracer.count('early_stops')
+                break
+    tracer.count('epochs', monitor.epochs)
+    tracer.count('warm_starts', int(warm))
+    save_warm_state(vgaer_model, optimizer)
+    commu_pred = cluster_window(hidemb.cpu(), A_orig, G, time_window_label, output_folder)
+    return commu_pred, G
 
-def vgaer(gml_file, time_window_label, output_folder, prev_communities=None):
-    # 读取GML文件
-    G = nx.read_gml(gml_file, label='label')
-    A = torch.Tensor(nx.adjacency_matrix(G).todense())
+def vgaer_sparse(G, gml_file, time_window_label, output_folder):
+    # 稀疏模式：A_hat、度归一化和特征B都不构造稠密N×N矩阵
     print(f"Processing {gml_file}")
     print(f"Nodes: {G.number_of_nodes()}, Edges: {G.number_of_edges()}")
 
@@ -87,120 +269,262 @@ def vgaer(gml_file, time_window_label, output_folder, prev_communities=None):
         node_labels = list(G.nodes())
         node_labels = [label[:6] for label in node_labels]  # 仅需要标签的前6位
 
-    A_orig = A.detach().numpy()
-    A_orig_ten = A.to(device)
-
-    # 计算B矩阵
-    K = 1 / (A.sum().item()) * (A.sum(dim=1).reshape(A.shape[0], 1) @ A.sum(dim=1).reshape(1, A.shape[0]))
-    B = A - K
-    B = B.to(device)
+    with tracer.stage('preprocess'):
+        A_sp = sparse_adjacency(G)
+
+        # B = A - kk^T/2m 以低秩形式参与第一层GCN的计算
+        feats = ModularityFeatures(A_sp, device)
+        in_dim = feats.shape[-1]
+
+        # 稀疏的 A_hat = D^-1/2 (A+I) D^-1/2
+        A_hat = normalize_adj(A_sp).to(device)
+
+        # 与稠密模式一致，pos_weight按加自环后的邻接矩阵计算
+        A_self = A_sp + sp.eye(A_sp.shape[0], dtype=np.float32, format='csr')
+        if args.neg_ratio > 0:
+            # 负采样：每个epoch只计算观测边和采样的非边
+            sampler = NegativeSampler(A_self, A_sp, args.neg_ratio, device)
+            norm = sampler.norm
+        else:
+            # --neg_ratio 0：编码器仍为稀疏计算，但重构损失使用稠密的N×N目标和权重
+            A_orig_ten = torch.from_numpy(A_sp.toarray()).to(device)
+            pos_weight, norm = loss_para(A_self)
+            weight_tensor = torch.from_numpy(np.where(A_self.toarray().reshape(-1) == 1, pos_weight, 1.0).astype(np.float32)).to(device)
+    print(f"Norm: {norm}")
 
-    # 计算A_hat矩阵
-    A = A + torch.eye(A.shape[0])
-    D = torch.diag(torch.pow(A.sum(dim=1), -0.5))  # D = D^-1/2
-    A_hat = D @ A @ D
-    A_hat = A_hat.to(device)
-    A = A.to(device)
+    # 创建模型和训练组件
+    vgaer_model, optimizer, warm = make_model(in_dim)
+    monitor = EarlyStopping(args.tol, args.tol_window, args.tol_window if warm else args.min_epochs, log_every=args.log_every)
 
-    feats = B
-    in_dim = feats.shape[-1]
+    # 训练循环
+    with tracer.stage('train'):
+        for epoch in range(args.epochs):
+            vgaer_model.train()
+            if args.neg_ratio > 0:
+                with profile.autocast():
+                    hidemb = vgaer_model.encoder(A_hat, feats)
+                    neg_rows, neg_cols, scale = sampler.sample()
+                    pos_logits = vgaer_model.decoder_edges(hidemb, sampler.pos_rows, sampler.pos_cols)
+                    neg_logits = vgaer_model.decoder_edges(hidemb, neg_rows, neg_cols)
+                pos_logits = torch.sigmoid(pos_logits.float())  # 应用Sigmoid激活函数
+                neg_logits = torch.sigmoid(neg_logits.float())
+                hidemb = hidemb.float()
+                loss = sampler.loss(pos_logits, neg_logits, scale)
+            else:
+                with profile.autocast():
+                    recovered = vgaer_model.forward(A_hat, feats)
+                logits = torch.sigmoid(recovered[0].float())  # 应用Sigmoid激活函数
+                hidemb = recovered[1].float()
+                loss = norm * F.binary_cross_entropy(logits.view(-1), A_orig_ten.view(-1), weight=weight_tensor)
+
+            mean, log_std = vgaer_model.mean.float(), vgaer_model.log_std.float()
+            kl_divergence = 0.5 / hidemb.size(0) * (
+                    1 + 2 * log_std - mean ** 2 - torch.exp(log_std) ** 2).sum(1).mean()
+            loss -= kl_divergence
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            if monitor.step(epoch, loss, hidemb):
+                print(f"Converged after {epoch + 1} epochs")
+                tracer.count('early_stops')
+                break
+    tracer.count('epochs', monitor.epochs)
+    tracer.count('warm_starts', int(warm))
+    save_warm_state(vgaer_model, optimizer)
+    commu_pred = cluster_window(hidemb.cpu(), A_sp, G, time_window_label, output_folder)
+    return commu_pred, G
 
-    # 创建模型
-    vgaer_model = model.VGAERModel(in_dim, args.hidden1, args.hidden2, device)
-    vgaer_model = vgaer_model.to(device)
+def vgaer_ensemble(G, gml_file, time_window_label, output_folder):
+    # 同一窗口训练args.ensemble个种子（堆叠权重，一次批量前向），每个种子分别聚类后取共现矩阵的共识划分
+    with tracer.stage('preprocess'):
+        A_sp = sparse_adjacency(G)
+    print(f"Processing {gml_file} with {args.ensemble} seeds")
+    print(f"Nodes: {G.number_of_nodes()}, Edges: {G.number_of_edges()}")
 
-    # 创建训练组件
-    optimizer = torch.optim.Adam(vgaer_model.parameters(), lr=args.lr)
-    print('Total Parameters:', sum([p.nelement() for p in vgaer_model.parameters()]))
+    global node_labels
+    if not node_labels:
+        node_labels = [label[:6] for label in G.nodes()]  # 仅需要标签的前6位
+
+    # 与单模型训练相同的早停设置，按所有种子的平均损失判断
+    monitor = EarlyStopping(args.tol, args.tol_window, args.min_epochs, log_every=args.log_every)
+    with tracer.stage('train', seeds=args.ensemble):
+        hidemb, losses = train_ensemble(A_sp, args.ensemble, args.hidden1, args.hidden2, args.lr, args.epochs, device,
+                                       profile.dtype, monitor)
+    embedding_dict[time_window_label] = torch.as_tensor(hidemb).detach().float().cpu().numpy()
+    tracer.count('epochs', monitor.epochs * args.ensemble)
+    tracer.count('early_stops', int(monitor.epochs < args.epochs))
+    with tracer.stage('cluster', seeds=args.ensemble):
+        partitions = np.stack([community(hidemb[s], args.cluster, None, None, method=args.cluster_method)
+                               for s in range(args.ensemble)])
+    with tracer.stage('consensus'):
+        coassoc = co_association(partitions)
+        commu_pred = consensus_partition(coassoc, args.cluster)
+        stability = stability_scores(coassoc, commu_pred)
+    print(f"Mean node stability for {time_window_label}: {stability.mean():.4f}")
+    community_stability_dict[time_window_label] = {label[:6]: stability[node] for node, label in enumerate(G.nodes())}
+    commu_pred = record_partition(list(commu_pred), A_sp, G, time_window_label)
+    return commu_pred, G
 
-    def compute_loss_para(adj):
-        pos_weight = ((adj.shape[0] * adj.shape[0] - adj.sum()) / adj.sum())
-        norm = adj.shape[0] * adj.shape[0] / float((adj.shape[0] * adj.shape[0] - adj.sum()) * 2)
-        weight_mask = adj.view(-1) == 1
-        weight_tensor = torch.ones(weight_mask.size(0)).to(device)
-        weight_tensor[weight_mask] = pos_weight
-        return weight_tensor, norm
+def list_windows(gml_folder):
+    # 与主循环相同的窗口编号和标签
+    return [(get_time_window_label(gml_file, index), os.path.join(gml_folder, gml_file))
+            for index, gml_file in enumerate(sorted(os.listdir(gml_folder)), start=1) if gml_file.endswith('.gml')]
 
-    weight_tensor, norm = compute_loss_para(A)
-    print(f"Weight Tensor:\n{weight_tensor}")
-    print(f"Norm: {norm}")
+def vgaer_batched(gml_folder, output_folder):
+    # 所有时间窗口堆叠成块对角矩阵，一次训练全部窗口的独立模型
+    windows = list_windows(gml_folder)
+    with tracer.stage('load', windows=len(windows)):
+        graphs = [nx.read_gml(gml_file, label='label') for _, gml_file in windows]
+    with tracer.stage('preprocess', windows=len(windows)):
+        adjs = [sparse_adjacency(G) for G in graphs]
+    print(f"Training {len(windows)} windows in one batched run")
 
-    # 训练循环
-    for epoch in range(args.epochs):
-        vgaer_model.train()
-        recovered = vgaer_model.forward(A_hat, feats)
-        logits = torch.sigmoid(recovered[0])  # 应用Sigmoid激活函数
-        hidemb = recovered[1]
-
-        loss = norm * F.binary_cross_entropy(logits.view(-1), A_orig_ten.view(-1), weight=weight_tensor)
-        kl_divergence = 0.5 / logits.size(0) * (
-                1 + 2 * vgaer_model.log_std - vgaer_model.mean ** 2 - torch.exp(vgaer_model.log_std) ** 2).sum(1).mean()
-        loss -= kl_divergence
-        optimizer.zero_grad()
-        loss.backward()
-        optimizer.step()
-        if epoch == args.epochs - 1:
-            hidemb = hidemb.cpu()
-            save_path = os.path.join(output_folder, f"{time_window_label}.png")
-            commu_pred = community(hidemb, args.cluster, save_path, time_window_label)
-            if prev_communities is not None:
-                commu_pred = match_communities(prev_communities, commu_pred)
-            Q_value = Q(A_orig, np.eye(args.cluster)[commu_pred])
-            q_values.append((time_window_label, Q_value))
-            community_assignments_dict[time_window_label] = {label[:6]: commu_pred[node] for node, label in enumerate(G.nodes())}
-            print(f"Q value for {time_window_label}: {Q_value}")
+    global node_labels
+    if not node_labels:
+        node_labels = [label[:6] for label in graphs[0].nodes()]  # 仅需要标签的前6位
+
+    with tracer.stage('train', windows=len(windows)):
+        hidemb, losses = train_batched(adjs, args.hidden1, args.hidden2, args.lr, args.epochs, device, profile.dtype)
+    results = {}
+    for s, (time_window_label, gml_file) in enumerate(windows):
+        print(f"Processing {gml_file}, train_loss={losses[s].item():.5f}")
+        with tracer.window(time_window_label):
+            tracer.count('epochs', args.epochs)
+            commu_pred = cluster_window(hidemb[s], adjs[s], graphs[s], time_window_label, output_folder)
+        results[time_window_label] = (commu_pred, graphs[s])
+    return results
+
+def cached_vgaer(index, gml_file, time_window_label, output_folder):
+    # 按内容查找缓存：命中时直接恢复隐变量、社区标签和Q值，否则训练并写入缓存。
+    # 缓存时每个窗口按(seed, 窗口编号)设定种子（与--workers一致），结果不依赖前面哪些窗口命中了缓存；
+    # warm start时键还包含上一个窗口的键，上一个窗口重新训练后其后的窗口也随之重新训练
+    global warm_state, prev_cache_key, node_labels
+    seed = args.seed + index
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    with tracer.stage('load'):
+        G = nx.read_gml(gml_file, label='label')
+    params = {name: getattr(args, name) for name in CACHE_PARAMS}
+    params.update(seed=seed, device=device.type, prev=prev_cache_key if args.warm_start else None)
+    key = cache.key(sparse_adjacency(G), params)
+    prev_cache_key = key
+    entry = cache.get(key)
+    state = cache.load_state(key) if entry is not None and args.warm_start else None
+    if entry is not None and (not args.warm_start or state is not None):
+        print(f"Cache hit for {time_window_label} ({gml_file})")
+        tracer.count('cache_hits')
+        if not node_labels:
+            node_labels = [label[:6] for label in G.nodes()]  # 仅需要标签的前6位
+        if args.warm_start:
+            warm_state = state
+        embedding_dict[time_window_label] = entry['z']
+        if 'stability' in entry:
+            community_stability_dict[time_window_label] = {label[:6]: entry['stability'][node]
+                                                           for node, label in enumerate(G.nodes())}
+        commu_pred = record_partition([int(c) for c in entry['labels']], None, G, time_window_label,
+                                      Q_value=float(entry['Q']))
+        return commu_pred, G
+    tracer.count('cache_misses')
+    commu_pred, G = vgaer(gml_file, time_window_label, output_folder, G=G)
+    arrays = {'z': embedding_dict[time_window_label], 'labels': np.asarray(commu_pred, dtype=np.int32), 'Q': q_values[-1][1]}
+    if time_window_label in community_stability_dict:
+        arrays['stability'] = np.array([community_stability_dict[time_window_label][label[:6]] for label in G.nodes()])
+    cache.put(key, state=warm_state if args.warm_start else None, **arrays)
     return commu_pred, G
 
+def window_job(index, gml_file, time_window_label, output_folder):
+    # 在工作进程中训练并聚类一个窗口；该进程中记录的Q值、社区分配和阶段计时随结果返回，由主进程按窗口顺序合并
+    with tracer.window(time_window_label):
+        if cache is not None:
+            commu_pred, G = cached_vgaer(index, gml_file, time_window_label, output_folder)
+        else:
+            torch.manual_seed(args.seed + index)
+            np.random.seed(args.seed + index)
+            commu_pred, G = vgaer(gml_file, time_window_label, output_folder)
+    return (commu_pred, G, q_values[-1][1], community_assignments_dict[time_window_label],
+            community_stability_dict.get(time_window_label), tracer.take())
+
+def parallel_windows(gml_folder, output_folder):
+    # 各窗口相互独立，分发到args.workers个进程，每个进程使用profile.threads个线程
+    windows = list_windows(gml_folder)
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(profile.threads,)) as executor:
+        futures = [executor.submit(window_job, index, gml_file, time_window_label, output_folder)
+                   for index, (time_window_label, gml_file) in enumerate(windows, start=1)]
+        outcomes = [future.result() for future in futures]
+
+    global node_labels
+    results = {}
+    for (time_window_label, _), (commu_pred, G, Q_value, assignments, stability, trace) in zip(windows, outcomes):
+        q_values.append((time_window_label, Q_value))
+        tracer.merge(trace)
+        community_assignments_dict[time_window_label] = assignments
+        if stability is not None:
+            community_stability_dict[time_window_label] = stability
+        if not node_labels:
+            node_labels = [label[:6] for label in G.nodes()]  # 仅需要标签的前6位
+        results[time_window_label] = (commu_pred, G)
+    return results
+
+def align_windows(windows):
+    # 按股票代码把所有窗口的划分排成 (窗口, 节点) 矩阵（窗口中不存在的节点为-1），统一对齐社区编号，
+    # 然后重写社区分配和相邻窗口之间的社区变化
+    codes = list(node_labels)
+    position = {code: i for i, code in enumerate(codes)}
+    window_nodes = []
+    for _, _, G in windows:
+        nodes = np.array([position.setdefault(label[:6], len(position)) for label in G.nodes()], dtype=np.int64)
+        window_nodes.append(nodes)
+    codes = list(position)
+    partitions = np.full((len(windows), len(codes)), -1, dtype=np.int64)
+    for w, (_, commu_pred, _) in enumerate(windows):
+        partitions[w, window_nodes[w]] = np.asarray(commu_pred, dtype=np.int64)
+    aligned = align_sequence(partitions, args.align, args.align_memory)
+    migration = Migration(aligned, codes, [time_window_label for time_window_label, _, _ in windows])
+
+    codes = np.array(codes, dtype=object)
+    changes = migration.change_table().to_numpy()
+    for w, (time_window_label, _, _) in enumerate(windows):
+        nodes = window_nodes[w]
+        community_assignments_dict[time_window_label] = dict(zip(codes[nodes], aligned[w, nodes].tolist()))
+        if w > 0:
+            community_changes_dict[time_window_label] = dict(zip(codes[nodes], changes[w - 1, nodes].tolist()))
+    return migration
+
 if __name__ == '__main__':
-    prev_communities = None
-    prev_graph = None
+    windows = []
+    batched_results = None
+    if args.batched:
+        batched_results = vgaer_batched(args.gml_folder, args.output_folder)
+    elif args.workers > 1:
+        batched_results = parallel_windows(args.gml_folder, args.output_folder)
     for index, gml_file in enumerate(sorted(os.listdir(args.gml_folder)), start=1):
         if gml_file.endswith('.gml'):
             time_window_label = get_time_window_label(gml_file, index)
             print(time_window_label)
-            current_communities, G = vgaer(os.path.join(args.gml_folder, gml_file), time_window_label, args.output_folder)
-            if prev_communities is not None:
-                changes = {}
-                for node, label in enumerate(G.nodes()):
-                    short_label = label[:6]
-                    if current_communities[node] != prev_communities[node]:
-                        changes[short_label] = f"{prev_communities[node]}->{current_communities[node]}"
+            if batched_results is not None:
+                current_communities, G = batched_results[time_window_label]
+            else:
+                with tracer.window(time_window_label):
+                    if cache is not None:
+                        current_communities, G = cached_vgaer(index, os.path.join(args.gml_folder, gml_file),
+                                                              time_window_label, args.output_folder)
                     else:
-                        changes[short_label] = str(current_communities[node])
-                community_changes_dict[time_window_label] = changes
-            prev_communities = current_communities
-            prev_graph = G
-
-
-    # 创建输出文件夹
-    os.makedirs(args.output_folder, exist_ok=True)
-
-    # 确保输出文件名具有正确的扩展名
-    output_excel_q = os.path.join(args.output_folder, 'q_values.xlsx')
-    output_excel_changes = os.path.join(args.output_folder, 'community_changes.xlsx')
-
-    # 将Q值保存到Excel文件中
-    df_q = pd.DataFrame(q_values, columns=['Time Window', 'Q Value'])
-    df_q.to_excel(output_excel_q, index=False)
-
-    # 将社区变化保存到另一个Excel文件中
-    df_changes = pd.DataFrame.from_dict(community_changes_dict, orient='index').reindex(columns=node_labels)
-    df_changes.index.name = 'Time Window'
-    df_changes.reset_index(inplace=True)
-    df_changes.to_excel(output_excel_changes, index=False)
-
-    # 将每个时间窗口的社区分配分别保存到单独的Excel文件中
-    for time_window, assignments in community_assignments_dict.items():
-        community_dict = {}
-        for node, community in assignments.items():
-            if community not in community_dict:
-                community_dict[community] = []
-            community_dict[community].append(node)
-            df_assignments = pd.DataFrame(dict([(k, pd.Series(v)) for k, v in community_dict.items()]))
-            df_assignments = df_assignments.reindex(sorted(df_assignments.columns), axis=1)  # 社区编号从小到大排列
-            output_excel_assignments = os.path.join(args.output_folder, f'community_assignments_{time_window}.xlsx')
-            df_assignments.to_excel(output_excel_assignments, index=False)
-
-        print(f"Q values have been saved to {output_excel_q}")
-        print(f"Community changes have been saved to {output_excel_changes}")
-        print(f"Community assignments have been saved to individual files in {args.output_folder}")
\ No newline at end of file
+                        current_communities, G = vgaer(os.path.join(args.gml_folder, gml_file), time_window_label, args.output_folder)
+            windows.append((time_window_label, current_communities, G))
+
+    # 所有窗口完成后统一对齐社区编号（与训练方式、缓存命中无关）
+    with tracer.stage('align'):
+        migration = align_windows(windows)
+
+    with tracer.stage('export'):
+        # 每个文件只写一次；默认写CSV，--export_format xlsx 与原来的Excel输出相同
+        written = export_results(args.output_folder, args.export_format, q_values, community_changes_dict,
+                                 community_assignments_dict, community_stability_dict, node_labels)
+        report(written, args.output_folder)
+        if args.migration:
+            write_report(migration, os.path.join(args.output_folder, 'migration'))
+            print(f"Node migration results have been saved to {os.path.join(args.output_folder, 'migration')}")
+
+    # 分阶段耗时汇总；--trace/--chrome_trace 时保存完整记录
+    tracer.print_summary()
+    tracer.dump(args.trace, args.chrome_trace)
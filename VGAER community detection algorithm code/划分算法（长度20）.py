@@ -2,8 +2,8 @@ from __future__ import division
 from __future__ import print_function
 
 import os
-os.environ["OMP_NUM_THREADS"] = '1'
-os.environ['CUDA_LAUNCH_BLOCKING'] = '1'
+os.environ.setdefault("OMP_NUM_THREADS", '1')
+os.environ.setdefault('CUDA_LAUNCH_BLOCKING', '1')
 import argparse
 import time
 import networkx as nx
@@ -23,6 +23,7 @@ import torch.nn.functional as F
 from cluster import community
 from NMI import load_label, NMI, label_change
 from Qvalue import Q
+from export import add_export_args, export_results, report, require_parquet
 
 # 定义命令行参数
 parser = argparse.ArgumentParser()
@@ -37,12 +38,19 @@ parser.add_argument('--dataset', type=str, default='stock', help='type of datase
 parser.add_argument('--cluster', type=int, default=4, help='Number of community')
 parser.add_argument('--gml_folder', type=str, default='D:\\管科-机器学习\\基于动态网络的股票市场内在关联特征分析及其应用\\中美贸易战\\gml', help='Path to the folder containing GML files.')
 parser.add_argument('--output_folder', type=str, default='D:\\管科-机器学习\\基于动态网络的股票市场内在关联特征分析及其应用\\中美贸易战\\社区划分', help='Output folder for results.')
+add_export_args(parser)
 args = parser.parse_args()
+if args.export_format == 'parquet':
+    require_parquet()  # 训练前检查可选依赖
 
 # 检查设备
 use_cuda = torch.cuda.is_available()
 device = torch.device("cuda" if use_cuda else "cpu")
 
+# 固定随机种子（模型初始化、隐变量采样和TSNE/KMeans）
+torch.manual_seed(args.seed)
+np.random.seed(args.seed)
+
 # 定义函数来计算和存储 Q 值
 q_values = []
 community_changes = []
@@ -172,35 +180,7 @@ if __name__ == '__main__':
             prev_graph = G
 
 
-    # 创建输出文件夹
-    os.makedirs(args.output_folder, exist_ok=True)
-
-    # 确保输出文件名具有正确的扩展名
-    output_excel_q = os.path.join(args.output_folder, 'q_values.xlsx')
-    output_excel_changes = os.path.join(args.output_folder, 'community_changes.xlsx')
-
-    # 将Q值保存到Excel文件中
-    df_q = pd.DataFrame(q_values, columns=['Time Window', 'Q Value'])
-    df_q.to_excel(output_excel_q, index=False)
-
-    # 将社区变化保存到另一个Excel文件中
-    df_changes = pd.DataFrame.from_dict(community_changes_dict, orient='index').reindex(columns=node_labels)
-    df_changes.index.name = 'Time Window'
-    df_changes.reset_index(inplace=True)
-    df_changes.to_excel(output_excel_changes, index=False)
-
-    # 将每个时间窗口的社区分配分别保存到单独的Excel文件中
-    for time_window, assignments in community_assignments_dict.items():
-        community_dict = {}
-        for node, community in assignments.items():
-            if community not in community_dict:
-                community_dict[community] = []
-            community_dict[community].append(node)
-            df_assignments = pd.DataFrame(dict([(k, pd.Series(v)) for k, v in community_dict.items()]))
-            df_assignments = df_assignments.reindex(sorted(df_assignments.columns), axis=1)  # 社区编号从小到大排列
-            output_excel_assignments = os.path.join(args.output_folder, f'community_assignments_{time_window}.xlsx')
-            df_assignments.to_excel(output_excel_assignments, index=False)
-
-        print(f"Q values have been saved to {output_excel_q}")
-        print(f"Community changes have been saved to {output_excel_changes}")
-        print(f"Community assignments have been saved to individual files in {args.output_folder}")
\ No newline at end of file
+    # 每个文件只写一次；默认写CSV，--export_format xlsx 与原来的Excel输出相同
+    written = export_results(args.output_folder, args.export_format, q_values, community_changes_dict,
+                             community_assignments_dict, node_labels=node_labels)
+    report(written, args.output_folder)
\ No newline at end of file
@@ -4,10 +4,9 @@ from __future__ import print_function
 
 import os
 
-os.environ["OMP_NUM_THREADS"] = '1'
-os.environ['CUDA_LAUNCH_BLOCKING'] = '1'
 import argparse
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import networkx as nx
 import numpy as np
 import torch
@@ -17,8 +16,12 @@ import torch.nn.functional as F
 # 模型和自定义函数
 import model
 from model import VGAERModel
-from cluster import community
-from Qvalue import Q
+from cluster import community, CLUSTER_METHODS
+from Qvalue import modularity
+from graph_store import GraphStore
+from trainer import EarlyStopping
+from execution import add_execution_args, configure, init_worker
+from cache import add_cache_args, ResultCache
 
 # 进度条库
 from tqdm import tqdm
@@ -37,7 +40,15 @@ parser.add_argument('--cluster', type=int, default=4, help='Number of community
 parser.add_argument('--gml_folder', type=str,
                     default='D:\\管科-机器学习\\基于动态网络的股票市场内在关联特征分析及其应用\\Test\\动态演化分析\\gml',
                     help='Path to the folder containing GML files.')
+parser.add_argument('--cluster_method', type=str, default='tsne', choices=CLUSTER_METHODS, help='Clustering backend for the VGAER embeddings.')
+parser.add_argument('--graph_store', type=str, default=None, help='Read adjacency matrices from a graph_store.py bundle instead of parsing GML.')
 parser.add_argument('--patience', type=int, default=100, help='Patience for early stopping.')
+parser.add_argument('--tol', type=float, default=0., help='Relative loss improvement that resets the patience counter; also stops when the mean loss over --tol_window epochs changes by less than this (0 = strict improvement only).')
+parser.add_argument('--tol_window', type=int, default=50, help='Epochs between loss checks (the only points where the loss is copied to the host).')
+parser.add_argument('--min_epochs', type=int, default=200, help='Minimum epochs before early stopping applies.')
+parser.add_argument('--log_every', type=int, default=0, help='Print the training loss every N epochs (0 = silent).')
+add_execution_args(parser, 'Number of worker processes for the (k, window) sweep (1 = sequential).')
+add_cache_args(parser)
 
 args = parser.parse_args()
 
@@ -45,8 +56,21 @@ args = parser.parse_args()
 use_cuda = torch.cuda.is_available()
 device = torch.device("cuda" if use_cuda else "cpu")
 
+# 固定随机种子（模型初始化、隐变量采样和TSNE/KMeans）
+torch.manual_seed(args.seed)
+np.random.seed(args.seed)
+
+# 线程数、工作进程数和autocast精度
+profile = configure(args, device)
+
 # 全局变量列表只用于在单次运行中临时存储Q值
 q_values = []
+# 以mmap方式打开的图存储，每个进程只打开一次
+graph_store = None
+# (k, 窗口)结果缓存：键为邻接矩阵内容 + 超参数 + k + 该任务的种子
+cache = ResultCache(args.cache, args.cache_size_mb) if args.cache else None
+CACHE_PARAMS = ('model', 'hidden1', 'hidden2', 'lr', 'dropout', 'epochs', 'cluster_method', 'patience', 'tol', 'tol_window',
+                'min_epochs', 'precision')
 
 
 def get_time_window_label(gml_file, index):
@@ -54,22 +78,20 @@ def get_time_window_label(gml_file, index):
     return f"{date_str}_{index:02d}"
 
 
-def match_communities(prev_communities, current_communities):
-    from scipy.optimize import linear_sum_assignment
-    num_communities = max(max(prev_communities), max(current_communities)) + 1
-    cost_matrix = np.zeros((num_communities, num_communities))
-    for i in range(len(prev_communities)):
-        cost_matrix[prev_communities[i], current_communities[i]] -= 1
-    row_ind, col_ind = linear_sum_assignment(cost_matrix)
-    community_map = {col: row for row, col in zip(row_ind, col_ind)}
-    matched_communities = [community_map.get(comm, comm) for comm in current_communities]
-    return matched_communities
-
-
 # (修改) vgaer函数直接接收 num_clusters 参数
-def vgaer(gml_file, num_clusters, prev_communities=None):
+def load_adjacency(gml_file):
+    # 优先从图存储中读取邻接矩阵，否则解析GML
+    global graph_store
+    if args.graph_store:
+        if graph_store is None:
+            graph_store = GraphStore(args.graph_store)
+        return None, torch.Tensor(graph_store.dense(gml_file))
     G = nx.read_gml(gml_file, label='label')
-    A = torch.Tensor(nx.adjacency_matrix(G).todense())
+    return G, torch.Tensor(nx.adjacency_matrix(G).todense())
+
+
+def vgaer(gml_file, num_clusters, adjacency=None):
+    G, A = load_adjacency(gml_file) if adjacency is None else adjacency
     A_orig = A.detach().numpy()
     A_orig_ten = A.to(device)
 
@@ -99,79 +121,124 @@ def vgaer(gml_file, num_clusters, prev_communities=None):
 
     weight_tensor, norm = compute_loss_para(A)
 
-    epochs_no_improve = 0
-    min_loss = float('inf')
-    best_hidemb = None
+    monitor = EarlyStopping(args.tol, args.tol_window, args.min_epochs, patience=args.patience, keep_best=True,
+                            log_every=args.log_every)
 
     for epoch in range(args.epochs):
         vgaer_model.train()
-        recovered = vgaer_model.forward(A_hat, feats)
-        logits = torch.sigmoid(recovered[0])
-        hidemb = recovered[1]
+        with profile.autocast():
+            recovered = vgaer_model.forward(A_hat, feats)
+        logits = torch.sigmoid(recovered[0].float())
+        hidemb = recovered[1].float()
+        mean, log_std = vgaer_model.mean.float(), vgaer_model.log_std.float()
 
         loss = norm * F.binary_cross_entropy(logits.view(-1), A_orig_ten.view(-1), weight=weight_tensor)
         kl_divergence = 0.5 / logits.size(0) * (
-                1 + 2 * vgaer_model.log_std - vgaer_model.mean ** 2 - torch.exp(vgaer_model.log_std) ** 2).sum(1).mean()
+                1 + 2 * log_std - mean ** 2 - torch.exp(log_std) ** 2).sum(1).mean()
         loss -= kl_divergence
 
         optimizer.zero_grad()
         loss.backward()
         optimizer.step()
 
-        if loss.item() < min_loss:
-            min_loss = loss.item()
-            epochs_no_improve = 0
-            best_hidemb = hidemb.detach().cpu()
-        else:
-            epochs_no_improve += 1
-
-        if epoch > 200 and epochs_no_improve >= args.patience:
+        if monitor.step(epoch, loss, hidemb):
             break
 
+    best_hidemb = monitor.embedding()
     if best_hidemb is not None:
+        best_hidemb = best_hidemb.cpu()
         # (修改) community 和 eye 函数使用传入的 num_clusters 参数
-        commu_pred = community(best_hidemb, num_clusters, None, None)
-        if prev_communities is not None:
-            commu_pred = match_communities(prev_communities, commu_pred)
-        Q_value = Q(A_orig, np.eye(num_clusters)[commu_pred])
-        q_values.append(Q_value)
+        commu_pred = community(best_hidemb, num_clusters, None, None, method=args.cluster_method)
+        Q_value = modularity(A_orig, commu_pred)
     else:
         print(f"警告: 文件 {gml_file} 的训练未能产生有效结果。")
         commu_pred = None
-
-    return commu_pred, G
+        Q_value = None
+
+    return commu_pred, G, Q_value, best_hidemb
+
+
+def sweep_job(k, index, gml_file):
+    # 单个(k, 窗口)任务。Q值与社区编号无关，因此无需等待上一个窗口的结果
+    # 每个任务按(seed, k, 窗口)设定种子，结果与进程调度顺序无关
+    seed = args.seed + 1000 * k + index
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    if cache is None:
+        commu_pred, _, Q_value, _ = vgaer(gml_file, num_clusters=k)
+        return k, index, commu_pred, Q_value
+
+    # 命中缓存时不再训练；未能产生有效结果的任务不写入缓存
+    adjacency = load_adjacency(gml_file)
+    params = {name: getattr(args, name) for name in CACHE_PARAMS}
+    params.update(k=k, seed=seed, device=device.type)
+    key = cache.key(adjacency[1].numpy(), params)
+    entry = cache.get(key)
+    if entry is not None:
+        return k, index, [int(c) for c in entry['labels']], float(entry['Q'])
+    commu_pred, _, Q_value, hidemb = vgaer(gml_file, num_clusters=k, adjacency=adjacency)
+    if commu_pred is not None:
+        cache.put(key, z=hidemb.numpy(), labels=np.asarray(commu_pred, dtype=np.int32), Q=Q_value)
+    return k, index, commu_pred, Q_value
+
+
+def parallel_sweep(gml_files, ks, workers, threads_per_worker):
+    # 把所有(k, 窗口)任务分发到进程池，返回 {k: [(index, commu_pred, Q_value), ...]}
+    results = {k: [] for k in ks}
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(threads_per_worker,)) as executor:
+        futures = [executor.submit(sweep_job, k, index, os.path.join(args.gml_folder, gml_file))
+                   for k in ks for index, gml_file in enumerate(gml_files, start=1)]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="处理 (k, 窗口) 任务"):
+            k, index, commu_pred, Q_value = future.result()
+            results[k].append((index, commu_pred, Q_value))
+    for k in ks:
+        results[k].sort(key=lambda item: item[0])
+    return results
 
 
 if __name__ == '__main__':
     # 预先加载所有gml文件名
-    gml_files = sorted([f for f in os.listdir(args.gml_folder) if f.endswith('.gml')])
+    if args.graph_store:
+        gml_files = GraphStore(args.graph_store).files
+    else:
+        gml_files = sorted([f for f in os.listdir(args.gml_folder) if f.endswith('.gml')])
     print(f"总共找到 {len(gml_files)} 个GML文件进行分析。")
 
     # ===================================================================================
     # (新增) 创建一个列表来存储最终结果
     final_results = []
+    ks = list(range(3, 11))
 
-    # (新增) 外层循环，遍历聚类数 k 从 3 到 10
-    for k in range(3, 11):
-        print("\n" + "=" * 60)
-        print(f"开始计算: 聚类数 (k) = {k}")
-        print("=" * 60)
-
-        # (修改) 在每次k值循环开始时，重置q_values和prev_communities
-        q_values = []
-        prev_communities = None
-
-        # 内部循环处理所有gml文件
-        # 使用tqdm创建进度条
-        for index, gml_file in enumerate(tqdm(gml_files, desc=f"处理文件 (k={k})"), start=1):
-            # 将当前的k值传递给vgaer函数
-            current_communities, G = vgaer(os.path.join(args.gml_folder, gml_file),
-                                           num_clusters=k,
-                                           prev_communities=prev_communities)
-
-            if current_communities is not None:
-                prev_communities = current_communities
+    q_values_by_k = {}
 
+    # 多进程：所有(k, 窗口)任务并行计算。只汇总Q值，Q值与社区编号无关，因此不需要跨窗口对齐社区编号
+    if args.workers > 1:
+        sweep_results = parallel_sweep(gml_files, ks, args.workers, profile.threads)
+        for k in ks:
+            q_values_by_k[k] = [Q_value for _, _, Q_value in sweep_results[k] if Q_value is not None]
+    else:
+        # (新增) 外层循环，遍历聚类数 k 从 3 到 10
+        for k in ks:
+            print("\n" + "=" * 60)
+            print(f"开始计算: 聚类数 (k) = {k}")
+            print("=" * 60)
+
+            # (修改) 在每次k值循环开始时，重置q_values
+            q_values = []
+
+            # 内部循环处理所有gml文件
+            # 使用tqdm创建进度条
+            for index, gml_file in enumerate(tqdm(gml_files, desc=f"处理文件 (k={k})"), start=1):
+                # 与多进程相同，每个任务按(seed, k, 窗口)设定种子，--workers 1 和 --workers N 的Q值一致
+                _, _, current_communities, Q_value = sweep_job(k, index, os.path.join(args.gml_folder, gml_file))
+
+                if current_communities is not None:
+                    q_values.append(Q_value)
+            q_values_by_k[k] = q_values
+
+    for k in ks:
+        q_values = q_values_by_k[k]
         # 计算当前k值下的平均模块度
         if q_values:
             average_q = sum(q_values) / len(q_values)
@@ -2,8 +2,8 @@ from __future__ import division
 from __future__ import print_function
 
 import os
-os.environ["OMP_NUM_THREADS"] = '1'
-os.environ['CUDA_LAUNCH_BLOCKING'] = '1'
+os.environ.setdefault("OMP_NUM_THREADS", '1')
+os.environ.setdefault('CUDA_LAUNCH_BLOCKING', '1')
 import argparse
 import time
 import networkx as nx